@@ -0,0 +1,195 @@
+"""
+Локальная заглушка BlockCypher API для тестов и бенчмарков.
+
+Поддерживаемые эндпоинты:
+    POST /v1/{coin}/main/addrs                   - новый адрес (201)
+    GET  /v1/{coin}/main/addrs/{address}/balance - баланс адреса (200)
+    GET  /{chain}/dashboards/addresses/{a,b,...}  - балансы в формате Blockchair (200)
+    POST /_stub/pay/{address}?amount=N           - пометить адрес оплаченным (управление заглушкой)
+
+Запуск из каталога BOT_1:
+    python -m bench.blockcypher_stub --port 8081 --latency 0.05 --error-rate 0.1 --slow-rate 0.05 --slow-latency 1
+    BLOCKCYPHER_BASE_URL=http://127.0.0.1:8081 python -m src.bot.main
+"""
+import argparse
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+ADDRS_RE = re.compile(r"^/v1/(?P<coin>\w+)/main/addrs$")
+BALANCE_RE = re.compile(r"^/v1/(?P<coin>\w+)/main/addrs/(?P<addresses>[^/]+)/balance$")
+DASHBOARD_RE = re.compile(r"^/(?P<chain>\w+)/dashboards/addresses/(?P<addresses>[^/]+)$")
+PAY_RE = re.compile(r"^/_stub/pay/(?P<address>[^/]+)$")
+
+class BlockCypherStub:
+    """HTTP-заглушка BlockCypher, работающая в отдельном потоке"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_latency: float = 1.0
+    ):
+        # Параметры сбоев можно менять на ходу: latency, error_rate, slow_rate (доля медленных ответов)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.balances = {}
+        self.requests = 0
+        self.faults = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "BlockCypherStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def pay(self, address: str, amount: int = 100000) -> None:
+        """Зачисляет средства на адрес"""
+        with self._lock:
+            self.balances[address] = self.balances.get(address, 0) + amount
+
+    def inject(self, *faults) -> None:
+        """
+        Сбои для следующих запросов, по одному на запрос: код ответа (int) или
+        задержка ответа в секундах (float) - для проверки таймаутов клиента
+        """
+        with self._lock:
+            self.faults.extend(faults)
+
+    def _balance(self, address: str) -> dict:
+        with self._lock:
+            balance = self.balances.get(address, 0)
+        return {
+            "address": address,
+            "total_received": balance,
+            "balance": balance,
+            "unconfirmed_balance": 0,
+            "final_balance": balance,
+            "n_tx": 1 if balance else 0,
+            "final_n_tx": 1 if balance else 0,
+        }
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело пишутся отдельно: без TCP_NODELAY ответ ждет delayed ACK (~40 мс)
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, payload) -> None:
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент отменил запрос (например, проигравший хеджированный)
+                    self.close_connection = True
+
+            def _prepare(self) -> bool:
+                """Учет запроса, задержка и внедрение сбоев"""
+                with stub._lock:
+                    stub.requests += 1
+                    fault = stub.faults.popleft() if stub.faults else None
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                if isinstance(fault, int):
+                    self._send(fault, {"error": f"injected {fault}"})
+                    return False
+                if fault:
+                    time.sleep(fault)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.slow_rate and random.random() < stub.slow_rate:
+                    time.sleep(stub.slow_latency)
+                if stub.error_rate and random.random() < stub.error_rate:
+                    self._send(503, {"error": "injected failure"})
+                    return False
+                return True
+
+            def do_POST(self):
+                url = urlsplit(self.path)
+                if match := PAY_RE.match(url.path):
+                    amount = int(parse_qs(url.query).get("amount", ["100000"])[0])
+                    stub.pay(match["address"], amount)
+                    self._send(200, stub._balance(match["address"]))
+                    return
+                if not self._prepare():
+                    return
+                if ADDRS_RE.match(url.path):
+                    self._send(201, {
+                        "address": "stub" + secrets.token_hex(15),
+                        "private": secrets.token_hex(32),
+                        "public": secrets.token_hex(33),
+                        "wif": secrets.token_hex(26),
+                    })
+                    return
+                self._send(404, {"error": "not found"})
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if not self._prepare():
+                    return
+                if match := BALANCE_RE.match(url.path):
+                    addresses = match["addresses"].split(";")
+                    if len(addresses) == 1:
+                        self._send(200, stub._balance(addresses[0]))
+                    else:
+                        self._send(200, [stub._balance(address) for address in addresses])
+                    return
+                if match := DASHBOARD_RE.match(url.path):
+                    addresses = match["addresses"].split(",")
+                    self._send(200, {"data": {"addresses": {
+                        address: {"balance": stub._balance(address)["final_balance"]} for address in addresses
+                    }}})
+                    return
+                self._send(404, {"error": "not found"})
+
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Доля медленных ответов")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Дополнительная задержка медленного ответа, сек")
+    args = parser.parse_args()
+
+    stub = BlockCypherStub(args.host, args.port, args.latency, args.error_rate, args.slow_rate, args.slow_latency)
+    print(f"BlockCypher stub: {stub.base_url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,242 @@
+"""
+Локальная имитация Telegram: заглушка Bot API и отправитель обновлений в webhook.
+
+Заглушка отвечает на вызовы бота (getMe, setWebhook, sendMessage, ...) и запоминает их,
+отправитель публикует синтетические обновления в webhook с секретным заголовком и
+измеряет задержку от публикации обновления до ответа бота в этот чат.
+
+Запуск из каталога BOT_1 (в двух терминалах):
+    python -m bench.fake_telegram --api-port 8082 --webhook http://127.0.0.1:8080/telegram --secret s3cr3t
+    BOT_MODE=webhook WEBHOOK_URL=http://127.0.0.1:8080 WEBHOOK_PORT=8080 WEBHOOK_SECRET_TOKEN=s3cr3t \\
+        TELEGRAM_API_URL=http://127.0.0.1:8082 python -m src.bot.main
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import httpx
+
+BOT_USER = {
+    "id": 1, "is_bot": True, "first_name": "CryptoBot", "username": "crypto_bot",
+    "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False,
+}
+
+def make_user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"}
+
+def make_message(update_id: int, user_id: int, text: str) -> dict:
+    """Синтетическое обновление с текстовым сообщением или командой"""
+    entities = []
+    if text.startswith("/"):
+        entities.append({"type": "bot_command", "offset": 0, "length": len(text.split()[0])})
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": make_user(user_id),
+            "text": text,
+            "entities": entities,
+        },
+    }
+
+def make_callback(update_id: int, user_id: int, data: str) -> dict:
+    """Синтетическое обновление с нажатием inline-кнопки"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "from": make_user(user_id),
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "...",
+            },
+        },
+    }
+
+class FakeBotAPI:
+    """HTTP-заглушка Bot API в отдельном потоке"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.calls = []
+        self.updates = deque()
+        self.webhook = None
+        self.webhook_max_connections = 40
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._replied = threading.Condition(self._lock)
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeBotAPI":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def push_update(self, update: dict) -> None:
+        """Кладет обновление в очередь getUpdates (для polling-режима)"""
+        with self._lock:
+            self.updates.append(update)
+
+    def wait_for(self, predicate, timeout: float) -> bool:
+        """Ждет вызова Bot API, удовлетворяющего условию"""
+        deadline = time.monotonic() + timeout
+        with self._replied:
+            while not any(predicate(call) for call in self.calls):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._replied.wait(remaining)
+        return True
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            with self._lock:
+                items = list(self.updates)
+                self.updates.clear()
+            return items
+        if method == "setWebhook":
+            self.webhook = params.get("url")
+            self.webhook_max_connections = int(params.get("max_connections") or 40)
+            return True
+        if method == "getWebhookInfo":
+            return {
+                "url": self.webhook or "",
+                "has_custom_certificate": False,
+                "pending_update_count": 0,
+                "max_connections": self.webhook_max_connections,
+            }
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                method = self.path.rstrip("/").rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+                # getUpdates с таймаутом: ждем обновления, как настоящий long polling
+                if method == "getUpdates" and not api.updates:
+                    time.sleep(min(float(params.get("timeout") or 0), 0.05))
+
+                result = api._result(method, params)
+                with api._replied:
+                    api.calls.append((time.perf_counter(), method, params))
+                    api._replied.notify_all()
+
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+        return Handler
+
+async def post_updates(webhook: str, secret: str, updates: list, concurrency: int) -> dict:
+    """Публикует обновления в webhook и возвращает время отправки по chat_id и коды ответов"""
+    semaphore = asyncio.Semaphore(concurrency)
+    sent_at = {}
+    statuses = {}
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def post(update: dict):
+            chat_id = (update.get("message") or update["callback_query"]["message"])["chat"]["id"]
+            async with semaphore:
+                sent_at[chat_id] = time.perf_counter()
+                response = await client.post(
+                    webhook, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}
+                )
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        await asyncio.gather(*(post(update) for update in updates))
+    return {"sent_at": sent_at, "statuses": statuses}
+
+async def main(args) -> None:
+    api = FakeBotAPI(port=args.api_port).start()
+    print(f"Fake Bot API: {api.url} (TELEGRAM_API_URL)")
+    print("Ожидание setWebhook от бота...")
+    if not api.wait_for(lambda call: call[1] == "setWebhook", timeout=args.startup_timeout):
+        raise SystemExit("Бот не вызвал setWebhook")
+
+    # Каждое обновление приходит от своего пользователя, чтобы сопоставить ответ с запросом
+    commands = itertools.cycle(["/start", "/help", "/products"])
+    updates = [make_message(i + 1, 100000 + i, next(commands)) for i in range(args.updates)]
+
+    started = time.perf_counter()
+    result = await post_updates(args.webhook, args.secret, updates, args.concurrency)
+    posted = time.perf_counter() - started
+
+    replies = {}
+    deadline = time.monotonic() + args.reply_timeout
+    while len(replies) < len(updates) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        for at, method, params in list(api.calls):
+            chat_id = int(params.get("chat_id") or 0)
+            if method == "sendMessage" and chat_id in result["sent_at"] and chat_id not in replies:
+                replies[chat_id] = at - result["sent_at"][chat_id]
+
+    latencies = sorted(replies.values())
+    print(f"Отправлено {len(updates)} обновлений за {posted:.2f} с ({len(updates) / posted:.1f} upd/s)")
+    print(f"Коды ответов webhook: {result['statuses']}")
+    print(f"Получено ответов: {len(replies)}")
+    if latencies:
+        print(
+            f"Задержка до ответа: p50 {statistics.median(latencies) * 1000:.1f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms, "
+            f"max {latencies[-1] * 1000:.1f} ms"
+        )
+    api.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-port", type=int, default=8082)
+    parser.add_argument("--webhook", default="http://127.0.0.1:8080/telegram")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--reply-timeout", type=float, default=30.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,162 @@
+"""
+Бенчмарк пула провайдеров блокчейн-данных: хеджирование и переключение при отказах.
+
+Провайдеры - локальные заглушки (bench.blockcypher_stub) с внедренными
+задержками и сбоями. Сценарии:
+    tail     - основной провайдер иногда отвечает медленно (slow_rate);
+               сравниваются p50/p99 без хеджирования и с ним;
+    outage   - основной провайдер отвечает 503 на все запросы, затем
+               восстанавливается; проверяется, что запросы не теряются,
+               цепь размыкается и после open_timeout трафик возвращается
+               (без хеджирования, чтобы ошибки не маскировались дублями);
+    generate - генерация адреса при недоступном основном провайдере
+               (без хеджирования, только переключение).
+
+Запуск из каталога BOT_1:
+    python -m bench.provider_failover --requests 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import logging
+import math
+import random
+import time
+from bench.blockcypher_stub import BlockCypherStub
+from src.bot.providers import BlockchairProvider, BlockCypherProvider, ProviderError, ProviderPool
+
+def percentile(values: list, p: float) -> float:
+    """Перцентиль по методу ближайшего ранга (values отсортирован)"""
+    return values[max(0, math.ceil(p * len(values)) - 1)]
+
+def make_pool(primary: BlockCypherStub, secondary: BlockCypherStub, args, hedge: bool) -> ProviderPool:
+    # Вторым провайдером - Blockchair-совместимый эндпоинт той же заглушки
+    providers = [
+        BlockCypherProvider(None, primary.base_url),
+        BlockchairProvider(None, secondary.base_url),
+    ]
+    return ProviderPool(
+        providers,
+        failure_threshold=args.failure_threshold,
+        open_timeout=args.open_timeout,
+        hedge_percentile=0.95 if hedge else None,
+        hedge_min_delay=args.hedge_min_delay,
+        retries=args.retries,
+        backoff=0.05
+    )
+
+async def drive(pool: ProviderPool, requests: int, concurrency: int, pause: float = 0.0) -> dict:
+    """Поток проверок балансов: задержки успешных вызовов и число ошибок"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await pool.get_balances([f"addr_{i}", f"addr_{i + 1}"], "btc")
+                latencies.append(time.perf_counter() - started)
+            except ProviderError:
+                errors += 1
+            if pause:
+                await asyncio.sleep(pause)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return {"latencies": sorted(latencies), "errors": errors, "elapsed": time.perf_counter() - started}
+
+def report(label: str, result: dict, primary: BlockCypherStub, secondary: BlockCypherStub) -> None:
+    values = result["latencies"] or [0.0]
+    print(
+        f"{label:<22} | {percentile(values, 0.5) * 1000:8.1f} | {percentile(values, 0.99) * 1000:8.1f} | "
+        f"{result['errors']:6} | {primary.requests:7} | {secondary.requests:7} | {result['elapsed']:6.2f}"
+    )
+
+async def run_tail(args, hedge: bool) -> None:
+    primary = BlockCypherStub(latency=0.02, slow_rate=args.slow_rate, slow_latency=args.slow_latency).start()
+    secondary = BlockCypherStub(latency=0.03).start()
+    pool = make_pool(primary, secondary, args, hedge)
+    try:
+        # Прогрев: пул набирает статистику задержек для порога хеджирования
+        await drive(pool, 50, args.concurrency)
+        primary.requests = secondary.requests = 0
+        result = await drive(pool, args.requests, args.concurrency)
+        report(f"tail, hedge={'on' if hedge else 'off'}", result, primary, secondary)
+    finally:
+        await pool.aclose()
+        primary.stop()
+        secondary.stop()
+
+async def run_outage(args) -> None:
+    primary = BlockCypherStub(latency=0.02, error_rate=1.0).start()
+    secondary = BlockCypherStub(latency=0.03).start()
+    pool = make_pool(primary, secondary, args, hedge=False)
+    try:
+        result = await drive(pool, args.requests, args.concurrency)
+        report("outage", result, primary, secondary)
+        health = pool.health["blockcypher"]
+        print(f"  цепь основного провайдера разомкнута: {health.opened_at is not None}")
+
+        # Восстановление: после open_timeout пробный запрос возвращает основной провайдер
+        primary.error_rate = 0.0
+        await asyncio.sleep(args.open_timeout)
+        primary.requests = secondary.requests = 0
+        result = await drive(pool, args.requests, args.concurrency)
+        report("recovered", result, primary, secondary)
+        print(f"  цепь основного провайдера разомкнута: {health.opened_at is not None}")
+    finally:
+        await pool.aclose()
+        primary.stop()
+        secondary.stop()
+
+async def run_generate(args) -> None:
+    primary = BlockCypherStub(error_rate=1.0).start()
+    secondary = BlockCypherStub().start()
+    pool = ProviderPool(
+        [
+            BlockCypherProvider(None, primary.base_url),
+            BlockCypherProvider(None, secondary.base_url, name="blockcypher-2"),
+        ],
+        failure_threshold=args.failure_threshold,
+        open_timeout=args.open_timeout,
+        retries=args.retries,
+        backoff=0.05
+    )
+    try:
+        started = time.perf_counter()
+        wallets = await asyncio.gather(*(pool.generate_address("btc") for _ in range(20)), return_exceptions=True)
+        failed = sum(isinstance(wallet, Exception) for wallet in wallets)
+        print(
+            f"generate: 20 адресов за {time.perf_counter() - started:.2f} с, ошибок {failed}, "
+            f"запросов к основному {primary.requests}, к резервному {secondary.requests}"
+        )
+    finally:
+        await pool.aclose()
+        primary.stop()
+        secondary.stop()
+
+async def main(args) -> None:
+    print(f"requests={args.requests} concurrency={args.concurrency} slow_rate={args.slow_rate} slow_latency={args.slow_latency}")
+    print(f"{'сценарий':<22} | {'p50 ms':>8} | {'p99 ms':>8} | {'ошибок':>6} | {'основн.':>7} | {'резерв.':>7} | {'сек':>6}")
+    await run_tail(args, hedge=False)
+    await run_tail(args, hedge=True)
+    await run_outage(args)
+    await run_generate(args)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Доля медленных ответов основного провайдера")
+    parser.add_argument("--slow-latency", type=float, default=0.5, help="Задержка медленного ответа, сек")
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--failure-threshold", type=int, default=5)
+    parser.add_argument("--open-timeout", type=float, default=2.0)
+    parser.add_argument("--hedge-min-delay", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(main(args))
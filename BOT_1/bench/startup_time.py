@@ -0,0 +1,101 @@
+"""
+Бенчмарк холодного старта: время от запуска процесса до первого обновления.
+
+Бот запускается отдельным процессом в polling-режиме против локальной заглушки
+Bot API (bench.fake_telegram) и заглушки BlockCypher. Измеряются:
+    - первый getUpdates (бот готов принимать обновления);
+    - ответ на /start, положенный в очередь getUpdates до запуска;
+    - остановка по SIGINT (важно для rolling restart).
+
+Запуск из каталога BOT_1:
+    python -m bench.startup_time --runs 5
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from bench.blockcypher_stub import BlockCypherStub
+from bench.fake_telegram import FakeBotAPI, make_message
+
+ROOT = Path(__file__).resolve().parent.parent
+CHAT_ID = 100001
+
+def run_once(workdir: str, blockcypher_url: str, timeout: float) -> dict:
+    api = FakeBotAPI().start()
+    api.push_update(make_message(1, CHAT_ID, "/start"))
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(ROOT),
+        TOKEN="123456:bench",
+        BOT_TOKEN="123456:bench",
+        TELEGRAM_API_URL=api.url,
+        BOT_MODE="polling",
+        DATABASE_URL=f"sqlite:///{workdir}/startup.db",
+        REDIS_URL=os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0"),
+        ENCRYPTION_KEY=os.environ.get("ENCRYPTION_KEY", "DzPs8lHOhr2Ys2x-8V3hMJvHmVK0nEcDVfY2ZS7Pr0A="),
+        BLOCKCYPHER_BASE_URL=blockcypher_url,
+        ADMIN_IDS="[1]",
+        LOG_LEVEL="WARNING",
+    )
+
+    # Рабочий каталог временный: логи и SQLite не попадают в репозиторий
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "src.bot.main"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        def first(predicate):
+            if not api.wait_for(predicate, timeout):
+                return None
+            return min(at for at, method, params in api.calls if predicate((at, method, params))) - started
+
+        polled = first(lambda call: call[1] == "getUpdates")
+        replied = first(lambda call: call[1] == "sendMessage" and int(call[2].get("chat_id") or 0) == CHAT_ID)
+
+        stop_at = time.perf_counter()
+        process.send_signal(signal.SIGINT)
+        process.wait(timeout=timeout)
+        stopped = time.perf_counter() - stop_at
+    finally:
+        if process.poll() is None:
+            process.kill()
+        stderr = process.stderr.read().decode(errors="replace")
+        api.stop()
+
+    if polled is None or replied is None:
+        raise SystemExit(f"Бот не ответил за {timeout} с:\n{stderr[-2000:]}")
+    return {"polled": polled, "replied": replied, "stopped": stopped}
+
+def main(args) -> None:
+    stub = BlockCypherStub().start()
+    results = []
+    try:
+        for run in range(args.runs):
+            # Каждый запуск с чистой БД, как при первом старте реплики
+            with tempfile.TemporaryDirectory() as workdir:
+                result = run_once(workdir, stub.base_url, args.timeout)
+            results.append(result)
+            print(
+                f"#{run + 1}: getUpdates {result['polled'] * 1000:.0f} ms, "
+                f"ответ на /start {result['replied'] * 1000:.0f} ms, "
+                f"остановка {result['stopped'] * 1000:.0f} ms"
+            )
+    finally:
+        stub.stop()
+
+    for key, title in (("polled", "До первого getUpdates"), ("replied", "До ответа на /start"), ("stopped", "Остановка")):
+        values = [result[key] * 1000 for result in results]
+        print(f"{title}: медиана {statistics.median(values):.0f} ms, min {min(values):.0f} ms, max {max(values):.0f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    main(parser.parse_args())
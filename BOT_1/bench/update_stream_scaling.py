@@ -0,0 +1,201 @@
+"""
+Бенчмарк распределения обновлений через потоки Redis (STREAM_ROLE=ingress/worker).
+
+В потоки публикуются синтетические сообщения от --users пользователей, затем
+запускаются --workers процессов StreamWorker с обработчиком, который тратит
+--work-ms процессорного времени на обновление и проверяет порядок обновлений
+каждого пользователя. Отчет: пропускная способность, распределение обновлений
+по воркерам и число нарушений порядка (должно быть 0).
+
+С --kill-after один воркер убивается SIGKILL посреди прогона: его шарды
+после STREAM_LEASE_TTL переходят другим, неподтвержденные сообщения
+забираются через XAUTOCLAIM, и все обновления все равно обрабатываются.
+
+Без --redis-url поднимается fakeredis (TCP) в этом процессе - годится для
+проверки корректности; замеры масштабирования - на настоящем Redis и машине
+с числом ядер не меньше числа воркеров.
+
+Запуск из каталога BOT_1:
+    python -m bench.update_stream_scaling --updates 20000 --workers 1 2 4 --redis-url redis://localhost:6379/15
+    python -m bench.update_stream_scaling --updates 5000 --workers 3 --kill-after 2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+import redis.asyncio as aioredis
+from telegram import Update
+from telegram.ext import Application, MessageHandler, filters
+from bench.fake_telegram import make_message
+from bench.handlers_load import StubRequest
+from src.bot.update_stream import (
+    ACK_OWNED_LUA, RELEASE_LEASE_LUA, RENEW_LEASE_LUA, StreamWorker, UpdateStream, install_stop_signals
+)
+
+READY_KEY = "bench:ready"
+GO_KEY = "bench:go"
+PROCESSED_KEY = "bench:processed"
+
+async def run_worker_process(args) -> None:
+    """Процесс-воркер: приложение с синтетическим обработчиком и StreamWorker"""
+    last_seq = {}
+    stats = {"processed": 0, "violations": 0}
+
+    async def handle(update: Update, context) -> None:
+        user_id, seq = update.effective_user.id, int(update.message.text)
+        if seq <= last_seq.get(user_id, -1):
+            stats["violations"] += 1
+        last_seq[user_id] = seq
+        deadline = time.perf_counter() + args.work_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+        stats["processed"] += 1
+
+    application = Application.builder().token("1:bench").request(StubRequest()).updater(None).build()
+    application.add_handler(MessageHandler(filters.TEXT, handle))
+    redis = aioredis.from_url(args.redis_url, decode_responses=True)
+    stream = UpdateStream(redis, args.shards)
+    worker = StreamWorker(application, stream, lease_ttl=args.lease_ttl, batch_size=args.batch, max_inflight=args.inflight)
+
+    stop = asyncio.Event()
+    install_stop_signals(stop)
+
+    async def report() -> None:
+        while True:
+            await redis.hset(PROCESSED_KEY, worker.consumer, json.dumps(stats))
+            await asyncio.sleep(0.2)
+
+    await application.initialize()
+    await application.start()
+    # TCP-сервер fakeredis закрывает соединение на ответ NOSCRIPT: скрипты загружаются заранее
+    for script in (RENEW_LEASE_LUA, RELEASE_LEASE_LUA, ACK_OWNED_LUA):
+        await redis.script_load(script)
+    await redis.incr(READY_KEY)
+    while not await redis.exists(GO_KEY):
+        await asyncio.sleep(0.05)
+
+    reporter = asyncio.create_task(report())
+    try:
+        await worker.run(stop)
+    finally:
+        reporter.cancel()
+        await redis.hset(PROCESSED_KEY, worker.consumer, json.dumps(stats))
+        await application.stop()
+        await application.shutdown()
+        await redis.aclose()
+
+async def publish(redis, args) -> None:
+    await redis.flushdb()
+    stream = UpdateStream(redis, args.shards, maxlen=args.updates * 2)
+    await stream.ensure_groups()
+    seq = defaultdict(int)
+    batch = []
+    for i in range(args.updates):
+        user_id = 1000 + i % args.users
+        batch.append(Update.de_json(make_message(i + 1, user_id, str(seq[user_id])), None))
+        seq[user_id] += 1
+        if len(batch) >= 500:
+            await stream.publish(batch)
+            batch = []
+    if batch:
+        await stream.publish(batch)
+
+async def collect(redis) -> list:
+    return [json.loads(value) for value in (await redis.hgetall(PROCESSED_KEY)).values()]
+
+async def drained(stream: UpdateStream) -> bool:
+    """Все сообщения доставлены группе и подтверждены (счетчик убитого воркера неточен)"""
+    for shard in range(stream.shards):
+        key = stream.stream_key(shard)
+        info = await stream.redis.xinfo_stream(key)
+        group = next(group for group in await stream.redis.xinfo_groups(key) if group["name"] == stream.GROUP)
+        if group["pending"] or group["last-delivered-id"] != info["last-generated-id"]:
+            return False
+    return True
+
+async def run_scenario(args, workers: int) -> None:
+    redis = aioredis.from_url(args.redis_url, decode_responses=True)
+    await publish(redis, args)
+
+    command = [sys.executable, "-m", "bench.update_stream_scaling", "--role", "worker", "--redis-url", args.redis_url,
+               "--shards", str(args.shards), "--work-ms", str(args.work_ms), "--lease-ttl", str(args.lease_ttl),
+               "--batch", str(args.batch), "--inflight", str(args.inflight)]
+    processes = [subprocess.Popen(command) for _ in range(workers)]
+    try:
+        while int(await redis.get(READY_KEY) or 0) < workers:
+            await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        await redis.set(GO_KEY, 1)
+
+        stream = UpdateStream(redis, args.shards)
+        killed = False
+        while True:
+            if await drained(stream):
+                break
+            if args.kill_after and not killed and time.perf_counter() - started >= args.kill_after:
+                processes[0].send_signal(signal.SIGKILL)
+                killed = True
+            if time.perf_counter() - started > args.timeout:
+                print("  таймаут: обработаны не все обновления")
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in processes:
+            process.wait()
+
+    results = await collect(redis)
+    processed = [stats["processed"] for stats in results]
+    violations = sum(stats["violations"] for stats in results)
+    # Повторы - обновления, выполненные дважды при переходе шарда (доставка "хотя бы один раз")
+    print(
+        f"{workers:>7} | {args.updates / elapsed:8.0f} | {elapsed:6.2f} | {sum(processed) - args.updates:>6} | "
+        f"{violations:>9} | {processed}"
+    )
+    await redis.aclose()
+
+def start_fake_redis() -> str:
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return f"redis://{host}:{port}/0"
+
+async def main(args) -> None:
+    print(f"updates={args.updates} users={args.users} shards={args.shards} work={args.work_ms} мс")
+    print(f"{'воркеры':>7} | {'обн/с':>8} | {'сек':>6} | {'повт.':>6} | {'нар.пор.':>9} | обработано воркерами")
+    for workers in args.workers:
+        await run_scenario(args, workers)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--role", choices=["bench", "worker"], default="bench")
+    parser.add_argument("--redis-url", default=None)
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--work-ms", type=float, default=1.0, help="Процессорное время обработки одного обновления")
+    parser.add_argument("--lease-ttl", type=float, default=3.0)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--inflight", type=int, default=16)
+    parser.add_argument("--kill-after", type=float, default=0.0, help="Через сколько секунд убить первый воркер")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    if args.role == "worker":
+        asyncio.run(run_worker_process(args))
+    else:
+        if not args.redis_url:
+            args.redis_url = start_fake_redis()
+        asyncio.run(main(args))
@@ -0,0 +1,157 @@
+import logging
+import re
+import time
+from datetime import datetime
+from sqlalchemy import delete, insert, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from telegram.ext import ContextTypes
+from src.bot.database import Transaction, TransactionArchive
+from src.bot.orders import hot_since
+
+logger = logging.getLogger(__name__)
+
+# Статусы, после которых заказ больше не меняется и может уйти в архив
+ARCHIVE_STATUSES = ('completed', 'refunded', 'expired')
+
+PARTITION_RE = re.compile(r"^transactions_p(\d{4})(\d{2})$")
+
+def month_start(moment: datetime, shift: int = 0) -> datetime:
+    """Начало месяца со сдвигом на shift месяцев"""
+    index = moment.year * 12 + moment.month - 1 + shift
+    return datetime(index // 12, index % 12 + 1, 1)
+
+async def archive_transactions(Session: async_sessionmaker, older_than: datetime, batch_size: int) -> int:
+    """
+    Переносит закрытые заказы (ARCHIVE_STATUSES) старше older_than в transactions_archive.
+
+    Каждая пачка - отдельная короткая транзакция: строки блокируются, копируются
+    в архив и удаляются из рабочей таблицы. Фильтр по created_at ограничивает
+    чтение старыми секциями.
+
+    Returns:
+        Количество перенесенных заказов
+    """
+    table = Transaction.__table__
+    columns = [column.name for column in table.columns]
+    condition = (table.c.status.in_(ARCHIVE_STATUSES), table.c.created_at < older_than)
+    moved = 0
+
+    while True:
+        async with Session() as session:
+            result = await session.execute(
+                select(table.c.id).where(*condition)
+                .order_by(table.c.created_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            ids = result.scalars().all()
+            if not ids:
+                break
+
+            batch = (table.c.id.in_(ids), *condition)
+            await session.execute(
+                insert(TransactionArchive.__table__).from_select(
+                    columns + ['archived_at'],
+                    select(*table.c, literal(datetime.utcnow(), TransactionArchive.archived_at.type)).where(*batch)
+                )
+            )
+            await session.execute(delete(table).where(*batch))
+            await session.commit()
+
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+    return moved
+
+async def is_partitioned(session: AsyncSession) -> bool:
+    """transactions секционирована (PostgreSQL после миграции 007)"""
+    if session.bind.dialect.name != "postgresql":
+        return False
+    return bool(await session.scalar(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('transactions')")
+    ))
+
+async def ensure_partitions(session: AsyncSession, months_ahead: int) -> None:
+    """Создает секции текущего и months_ahead следующих месяцев"""
+    now = datetime.utcnow()
+    for shift in range(months_ahead + 1):
+        start, end = month_start(now, shift), month_start(now, shift + 1)
+        try:
+            async with session.begin_nested():
+                await session.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS transactions_p{start:%Y%m} PARTITION OF transactions "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                ))
+        except Exception as e:
+            # Например, строки этого месяца уже лежат в секции по умолчанию
+            logger.error(f"Не удалось создать секцию transactions_p{start:%Y%m}: {str(e)}")
+    await session.commit()
+
+async def drop_empty_partitions(session: AsyncSession, older_than: datetime) -> int:
+    """
+    Удаляет опустевшие после архивации секции месяцев, целиком лежащих до older_than.
+
+    DROP TABLE секции берет ACCESS EXCLUSIVE на саму transactions и на время
+    ожидания блокировки останавливает все запросы к заказам. Поэтому секция
+    сначала отсоединяется DETACH PARTITION CONCURRENTLY (не блокирует чтение и
+    запись), а удаляется уже отдельная таблица. CONCURRENTLY не выполняется
+    внутри транзакции - команды идут через соединение в режиме autocommit - и
+    невозможен при секции по умолчанию (ее убирает миграция 010). Прерванное
+    отсоединение завершается DETACH PARTITION ... FINALIZE.
+    """
+    if await session.scalar(text(
+        "SELECT partdefid <> 0 FROM pg_partitioned_table WHERE partrelid = 'transactions'::regclass"
+    )):
+        logger.warning("У transactions есть секция по умолчанию: пустые секции не удаляются (см. миграцию 010)")
+        return 0
+
+    result = await session.execute(text(
+        "SELECT c.relname, i.inhdetachpending FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'transactions'::regclass"
+    ))
+    empty = []
+    for name, pending in result.all():
+        match = PARTITION_RE.match(name)
+        if not match:
+            continue
+        if month_start(datetime(int(match[1]), int(match[2]), 1), 1) > older_than:
+            continue
+        if await session.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name})")):
+            continue
+        empty.append((name, pending))
+    await session.commit()
+
+    dropped = 0
+    async with session.bind.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        for name, pending in empty:
+            try:
+                mode = "FINALIZE" if pending else "CONCURRENTLY"
+                await connection.execute(text(f"ALTER TABLE transactions DETACH PARTITION {name} {mode}"))
+                await connection.execute(text(f"DROP TABLE {name}"))
+            except Exception as e:
+                logger.error(f"Не удалось удалить секцию {name}: {str(e)}")
+                continue
+            dropped += 1
+    return dropped
+
+async def archive_old_transactions(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Фоновая архивация старых заказов и обслуживание помесячных секций"""
+    config = context.bot_data['config']
+    Session = context.bot_data['session_factory']
+    older_than = hot_since(config.transactions_hot_days)
+
+    started = time.perf_counter()
+    moved = await archive_transactions(Session, older_than, config.archive_batch)
+
+    dropped = 0
+    async with Session() as session:
+        if await is_partitioned(session):
+            await ensure_partitions(session, config.partition_months_ahead)
+            dropped = await drop_empty_partitions(session, older_than)
+
+    if moved or dropped:
+        logger.info(
+            f"Архивировано заказов: {moved}, удалено пустых секций: {dropped} "
+            f"за {time.perf_counter() - started:.1f} с"
+        )
@@ -0,0 +1,92 @@
+import logging
+import time
+from typing import Dict, Optional, Tuple
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+class CatalogCache:
+    """
+    Двухуровневый кеш страниц каталога (состав страницы и цены, без остатков).
+
+    L1 - словарь в памяти процесса с коротким TTL, L2 - ключи в Redis, общие для всех
+    экземпляров бота. Ключ страницы включает поколение каталога (catalog:version):
+    поколение читается до запроса к БД и передается в set, а инвалидация его
+    увеличивает. Поэтому страница, собранная до инвалидации и сохраненная после
+    нее, попадает в старое поколение и не читается. Каждая страница живет ttl
+    секунд с момента записи; старые поколения истекают сами. L1 других экземпляров
+    устаревает не дольше local_ttl секунд. При недоступности Redis кеш деградирует
+    до чтения из БД, а не до ошибки.
+    """
+
+    VERSION_KEY = "catalog:version"
+    # Страницы без остатков: новый префикс не читает страницы прежнего формата
+    PREFIX = "catalog:page2"
+
+    def __init__(self, redis: Redis, ttl: int = 300, local_ttl: float = 5.0):
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self._local: Dict[str, Tuple[float, int, str]] = {}
+        self._version: Optional[int] = None
+        self._version_expires = 0.0
+
+    def _key(self, version: int, page: str) -> str:
+        return f"{self.PREFIX}:{version}:{page}"
+
+    async def _current_version(self) -> int:
+        """Поколение каталога; в памяти хранится не дольше local_ttl"""
+        now = time.monotonic()
+        if self._version is None or self._version_expires <= now:
+            self._version = int(await self.redis.get(self.VERSION_KEY) or 0)
+            self._version_expires = now + self.local_ttl
+        return self._version
+
+    async def get(self, page: str) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Возвращает страницу (None при промахе) и поколение каталога.
+
+        Поколение передается в set после чтения из БД; None - Redis недоступен,
+        и страница не кешируется.
+        """
+        try:
+            version = await self._current_version()
+        except RedisError as e:
+            logger.warning(f"Кеш каталога недоступен: {str(e)}")
+            return None, None
+
+        now = time.monotonic()
+        entry = self._local.get(page)
+        if entry and entry[0] > now and entry[1] == version:
+            return entry[2], version
+
+        try:
+            value = await self.redis.get(self._key(version, page))
+        except RedisError as e:
+            logger.warning(f"Кеш каталога недоступен: {str(e)}")
+            return None, None
+
+        if value is not None:
+            self._local[page] = (now + self.local_ttl, version, value)
+        return value, version
+
+    async def set(self, page: str, value: str, version: Optional[int]) -> None:
+        """Сохраняет страницу, собранную для поколения version, на обоих уровнях"""
+        if version is None:
+            return
+        self._local[page] = (time.monotonic() + self.local_ttl, version, value)
+        try:
+            await self.redis.set(self._key(version, page), value, ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f"Не удалось сохранить каталог в кеш: {str(e)}")
+
+    async def invalidate(self) -> None:
+        """Сбрасывает каталог после изменения товаров или остатков"""
+        self._local.clear()
+        try:
+            self._version = await self.redis.incr(self.VERSION_KEY)
+            self._version_expires = time.monotonic() + self.local_ttl
+        except RedisError as e:
+            self._version = None
+            logger.warning(f"Не удалось сбросить кеш каталога: {str(e)}")
@@ -0,0 +1,262 @@
+import csv
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import Awaitable, Callable, Iterator, List, Optional, TextIO, Tuple
+from sqlalchemy import select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.bot.database import Product
+
+logger = logging.getLogger(__name__)
+
+# Колонки файла импорта; id необязателен: с ним товар обновляется, без него - добавляется
+COLUMNS = ("id", "name", "price_btc", "price_ltc", "file_id", "stock")
+
+# Сколько ошибок валидации показывать администратору
+MAX_REPORTED_ERRORS = 10
+
+class ImportReport:
+    """Итоги импорта: счетчики строк и первые ошибки валидации"""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.invalid = 0
+        self.errors: List[str] = []
+
+    def add_error(self, line: int, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"строка {line}: {message}")
+
+def iter_csv(stream: TextIO) -> Iterator[Tuple[int, dict]]:
+    """Строки CSV с заголовком (разделитель , или ;) вместе с номерами строк файла"""
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(stream, dialect=dialect)
+    for row in reader:
+        # Заголовки без учета регистра и пробелов; лишние значения строки (ключ None) отбрасываются
+        yield reader.line_num, {key.strip().lower(): value for key, value in row.items() if key}
+
+def iter_json(stream: TextIO, chunk_size: int = 65536) -> Iterator[Tuple[int, dict]]:
+    """
+    Объекты из JSON-массива или JSON Lines без загрузки файла целиком.
+
+    Файл читается кусками, объекты разбираются по одному через raw_decode;
+    номер строки - порядковый номер объекта.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    index = 0
+    eof = False
+
+    while True:
+        # Пропуск пробелов и разделителей массива между объектами
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                return
+            buffer, position = stream.read(chunk_size), 0
+            eof = not buffer
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Объект не поместился в буфер - дочитываем
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                raise
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+
+        index += 1
+        position = end
+        yield index, item
+
+def validate_row(row: dict) -> dict:
+    """Приводит строку файла к значениям колонок products; ValueError - строка некорректна"""
+    if not isinstance(row, dict):
+        raise ValueError("ожидался объект с полями товара")
+
+    name = str(row.get("name") or "").strip()
+    if not name or len(name) > 255:
+        raise ValueError("название пустое или длиннее 255 символов")
+
+    values = {"name": name}
+    for column in ("price_btc", "price_ltc"):
+        raw = row.get(column)
+        try:
+            price = Decimal(str(raw).strip().replace(",", ".")) if raw not in (None, "") else Decimal(0)
+        except InvalidOperation:
+            raise ValueError(f"{column}: некорректная цена {raw!r}")
+        if price < 0 or price >= Decimal("1e8"):
+            raise ValueError(f"{column}: цена вне диапазона")
+        values[column] = price
+    if not values["price_btc"] and not values["price_ltc"]:
+        raise ValueError("не указана ни одна цена")
+
+    file_id = str(row.get("file_id") or "").strip()
+    if len(file_id) > 255:
+        raise ValueError("file_id длиннее 255 символов")
+    values["file_id"] = file_id or None
+
+    for column in ("id", "stock"):
+        raw = row.get(column)
+        if raw in (None, ""):
+            values[column] = None if column == "id" else 0
+            continue
+        try:
+            number = int(str(raw).strip())
+        except ValueError:
+            raise ValueError(f"{column}: ожидалось целое число, получено {raw!r}")
+        if number < (1 if column == "id" else 0):
+            raise ValueError(f"{column}: недопустимое значение {number}")
+        values[column] = number
+    return values
+
+async def _copy_batch(session: AsyncSession, batch: List[dict], start_line: int) -> None:
+    """COPY пачки в staging-таблицу (PostgreSQL, asyncpg)"""
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "products_import",
+        records=[
+            (start_line + offset, row["id"], row["name"], row["price_btc"], row["price_ltc"], row["file_id"], row["stock"])
+            for offset, row in enumerate(batch)
+        ],
+        columns=("seq",) + COLUMNS
+    )
+
+async def _merge_staging(session: AsyncSession) -> Tuple[int, int]:
+    """Переносит staging в products одним upsert; возвращает (добавлено, обновлено)"""
+    # Повтор id в файле: побеждает последняя строка, иначе ON CONFLICT затронет строку дважды
+    result = await session.execute(text(
+        "WITH source AS ("
+        "    SELECT DISTINCT ON (COALESCE(id, -seq)) id, name, price_btc, price_ltc, file_id, stock"
+        "    FROM products_import ORDER BY COALESCE(id, -seq), seq DESC"
+        "), upserted AS ("
+        "    INSERT INTO products (id, name, price_btc, price_ltc, file_id, stock)"
+        "    SELECT COALESCE(id, nextval(pg_get_serial_sequence('products', 'id'))),"
+        "           name, price_btc, price_ltc, file_id, stock FROM source"
+        "    ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, price_btc = EXCLUDED.price_btc,"
+        "        price_ltc = EXCLUDED.price_ltc, file_id = EXCLUDED.file_id, stock = EXCLUDED.stock"
+        "    RETURNING (xmax = 0) AS inserted"
+        ") SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM upserted"
+    ))
+    inserted, updated = result.one()
+    # Явные id из файла не сдвигают последовательность - выравниваем, чтобы /add_product не получил занятый id
+    await session.execute(text(
+        "SELECT setval(pg_get_serial_sequence('products', 'id'), GREATEST((SELECT MAX(id) FROM products), 1))"
+    ))
+    return inserted, updated
+
+async def _upsert_batch(session: AsyncSession, batch: List[dict]) -> Tuple[int, int]:
+    """Многострочный INSERT ... ON CONFLICT (id) DO UPDATE для СУБД без COPY"""
+    # Повтор id внутри пачки: побеждает последняя строка
+    by_id = {}
+    for row in batch:
+        by_id[row["id"] if row["id"] is not None else object()] = row
+    rows = list(by_id.values())
+
+    ids = [row["id"] for row in rows if row["id"] is not None]
+    existing = set()
+    if ids:
+        existing = set((await session.execute(select(Product.id).where(Product.id.in_(ids)))).scalars().all())
+
+    stmt = sqlite_insert(Product).values(rows)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[Product.id],
+        set_={column: getattr(stmt.excluded, column) for column in COLUMNS if column != "id"}
+    ))
+    updated = sum(1 for row in rows if row["id"] in existing)
+    return len(rows) - updated, updated
+
+async def import_products(
+    session: AsyncSession,
+    rows: Iterator[Tuple[int, dict]],
+    batch_size: int = 1000,
+    progress: Optional[Callable[[ImportReport], Awaitable[None]]] = None
+) -> ImportReport:
+    """
+    Потоковый импорт каталога в одной транзакции (коммит выполняет вызывающий код).
+
+    Строки проверяются по мере чтения, некорректные пропускаются и попадают
+    в отчет. Корректные накапливаются пачками по batch_size: в PostgreSQL пачка
+    уходит через COPY в временную таблицу, которая в конце сливается в products
+    одним upsert; в остальных СУБД каждая пачка - многострочный upsert. В памяти
+    одновременно находится не больше одной пачки.
+
+    Args:
+        session: Асинхронная сессия БД
+        rows: Пары (номер строки, словарь полей) - iter_csv или iter_json
+        batch_size: Строк в одной пачке
+        progress: Вызывается после каждой пачки с текущим отчетом
+    """
+    report = ImportReport()
+    use_copy = session.bind.dialect.name == "postgresql"
+    if use_copy:
+        await session.execute(text(
+            "CREATE TEMP TABLE products_import (seq BIGINT, id INTEGER, name VARCHAR(255),"
+            " price_btc NUMERIC(16,8), price_ltc NUMERIC(16,8), file_id VARCHAR(255), stock INTEGER)"
+            " ON COMMIT DROP"
+        ))
+
+    batch: List[dict] = []
+    batch_start = 0
+
+    async def flush() -> None:
+        if use_copy:
+            await _copy_batch(session, batch, batch_start)
+        else:
+            inserted, updated = await _upsert_batch(session, batch)
+            report.inserted += inserted
+            report.updated += updated
+        batch.clear()
+        if progress:
+            await progress(report)
+
+    for line, row in rows:
+        report.rows += 1
+        try:
+            values = validate_row(row)
+        except ValueError as e:
+            report.add_error(line, str(e))
+            continue
+        if not batch:
+            batch_start = line
+        batch.append(values)
+        if len(batch) >= batch_size:
+            await flush()
+
+    if batch:
+        await flush()
+    if use_copy:
+        report.inserted, report.updated = await _merge_staging(session)
+    return report
+
+def format_report(report: ImportReport, done: bool) -> str:
+    """Текст сообщения о ходе импорта"""
+    if not done:
+        return f"⏳ Импорт каталога: прочитано строк {report.rows}, ошибок {report.invalid}"
+    lines = [
+        "✅ Импорт каталога завершен",
+        f"• Строк в файле: {report.rows}",
+        f"• Добавлено: {report.inserted}",
+        f"• Обновлено: {report.updated}",
+        f"• Пропущено с ошибками: {report.invalid}",
+    ]
+    if report.errors:
+        lines.append("")
+        lines.extend(report.errors)
+        if report.invalid > len(report.errors):
+            lines.append(f"... и еще {report.invalid - len(report.errors)}")
+    return "\n".join(lines)
@@ -1,5 +1,6 @@
 import os
-from typing import List, Optional
+from functools import lru_cache
+from typing import List, Literal, Optional
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 from pydantic import AnyUrl, Field
@@ -11,6 +12,7 @@ class Config(BaseSettings):
     """
     Конфигурация приложения.
     Все параметры автоматически загружаются из переменных окружения или .env файла.
+    Экземпляр неизменяемый: создается один раз через get_config() и передается через bot_data.
     """
     
     # Telegram
@@ -20,13 +22,212 @@ class Config(BaseSettings):
         description="Список ID администраторов через запятую",
         env="ADMIN_IDS"
     )
+    telegram_api_url: Optional[str] = Field(
+        default=None,
+        env="TELEGRAM_API_URL",
+        description="Адрес Bot API (для локальной заглушки в тестах, опционально)"
+    )
+
+    # Прием обновлений
+    bot_mode: Literal["polling", "webhook"] = Field(
+        default="polling",
+        env="BOT_MODE",
+        description="Способ получения обновлений: polling или webhook"
+    )
+    webhook_url: Optional[str] = Field(
+        default=None,
+        env="WEBHOOK_URL",
+        description="Публичный адрес бота за Traefik, например https://bot.example.com"
+    )
+    webhook_path: str = Field(
+        default="/telegram",
+        env="WEBHOOK_PATH",
+        description="Путь, на который Telegram отправляет обновления"
+    )
+    webhook_listen: str = Field(
+        default="0.0.0.0",
+        env="WEBHOOK_LISTEN",
+        description="Интерфейс HTTP-сервера webhook"
+    )
+    webhook_port: int = Field(
+        default=80,
+        env="WEBHOOK_PORT",
+        description="Порт HTTP-сервера webhook (Traefik проксирует на bot:80)"
+    )
+    webhook_secret_token: Optional[str] = Field(
+        default=None,
+        env="WEBHOOK_SECRET_TOKEN",
+        description="Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (одинаковый для всех реплик)"
+    )
+    webhook_max_connections: int = Field(
+        default=40,
+        env="WEBHOOK_MAX_CONNECTIONS",
+        description="Максимум одновременных соединений Telegram к webhook"
+    )
+    health_path: str = Field(
+        default="/healthz",
+        env="HEALTH_PATH",
+        description="Путь проверки живости"
+    )
+    stream_role: Literal["off", "ingress", "worker"] = Field(
+        default="off",
+        env="STREAM_ROLE",
+        description=(
+            "Распределение обновлений через потоки Redis: off - один процесс обрабатывает всё, "
+            "ingress - только прием (BOT_MODE) и передача в Redis, worker - обработка из Redis"
+        )
+    )
+    stream_shards: int = Field(
+        default=16,
+        env="STREAM_SHARDS",
+        description="Количество потоков-шардов; больше воркеров, чем шардов, не масштабируется"
+    )
+    stream_maxlen: int = Field(
+        default=100000,
+        env="STREAM_MAXLEN",
+        description="Примерная длина одного потока; более старые сообщения вытесняются"
+    )
+    stream_batch: int = Field(
+        default=100,
+        env="STREAM_BATCH",
+        description="Обновлений в одной пачке записи (ingress) и чтения (worker)"
+    )
+    stream_lease_ttl: float = Field(
+        default=15.0,
+        env="STREAM_LEASE_TTL",
+        description="Аренда шарда воркером, сек: через столько шарды упавшего воркера перейдут другим"
+    )
+    stream_block: float = Field(
+        default=1.0,
+        env="STREAM_BLOCK",
+        description="Ожидание новых сообщений в одном чтении воркера, сек"
+    )
+    update_queue_size: int = Field(
+        default=1000,
+        env="UPDATE_QUEUE_SIZE",
+        description="Размер очереди входящих обновлений"
+    )
+    concurrent_updates: int = Field(
+        default=16,
+        env="CONCURRENT_UPDATES",
+        description="Количество обновлений, обрабатываемых одновременно"
+    )
+    
+    # Анти-флуд
+    throttle_user_rate: float = Field(
+        default=2.0,
+        env="THROTTLE_USER_RATE",
+        description="Запросов в секунду от одного пользователя (все действия вместе)"
+    )
+    throttle_user_burst: int = Field(
+        default=10,
+        env="THROTTLE_USER_BURST",
+        description="Допустимая пачка запросов от одного пользователя"
+    )
+    throttle_action_rate: float = Field(
+        default=0.5,
+        env="THROTTLE_ACTION_RATE",
+        description="Повторов одного действия (команды или кнопки) в секунду"
+    )
+    throttle_action_burst: int = Field(
+        default=3,
+        env="THROTTLE_ACTION_BURST",
+        description="Допустимая пачка повторов одного действия"
+    )
     
     # Базы данных
     database_url: AnyUrl = Field(..., env="DATABASE_URL")
     redis_url: AnyUrl = Field(..., env="REDIS_URL")
-    
+
+    # Хранение user_data/chat_data в Redis (общее для реплик и переживает перезапуск)
+    persistence_enabled: bool = Field(
+        default=True,
+        env="PERSISTENCE_ENABLED",
+        description="Сохранять user_data, chat_data и состояния диалогов в Redis"
+    )
+    persistence_update_interval: float = Field(
+        default=10.0,
+        env="PERSISTENCE_UPDATE_INTERVAL",
+        description="Период пакетной записи измененного состояния в Redis, сек"
+    )
+    persistence_local_ttl: float = Field(
+        default=300.0,
+        env="PERSISTENCE_LOCAL_TTL",
+        description="Сколько секунд данные пользователя используются без сверки версии в Redis "
+                    "(в webhook-режиме без STREAM_ROLE всегда 0)"
+    )
+
+    # Пул соединений с БД
+    db_pool_size: int = Field(
+        default=10,
+        env="DB_POOL_SIZE",
+        description="Количество постоянных соединений в пуле"
+    )
+    db_max_overflow: int = Field(
+        default=20,
+        env="DB_MAX_OVERFLOW",
+        description="Дополнительные соединения сверх пула при пиковой нагрузке"
+    )
+    db_pool_timeout: float = Field(
+        default=5.0,
+        env="DB_POOL_TIMEOUT",
+        description="Ожидание свободного соединения, сек"
+    )
+    db_pool_recycle: int = Field(
+        default=1800,
+        env="DB_POOL_RECYCLE",
+        description="Пересоздание соединений старше указанного возраста, сек"
+    )
+
+    # Кеш каталога
+    catalog_cache_ttl: int = Field(
+        default=300,
+        env="CATALOG_CACHE_TTL",
+        description="Время жизни каталога в Redis, сек"
+    )
+    catalog_local_ttl: float = Field(
+        default=5.0,
+        env="CATALOG_LOCAL_TTL",
+        description="Время жизни каталога в памяти процесса, сек"
+    )
+    catalog_page_size: int = Field(
+        default=10,
+        env="CATALOG_PAGE_SIZE",
+        description="Количество товаров на одной странице каталога"
+    )
+    catalog_import_batch: int = Field(
+        default=1000,
+        env="CATALOG_IMPORT_BATCH",
+        description="Количество строк в одной пачке при импорте каталога из файла"
+    )
+    export_batch: int = Field(
+        default=2000,
+        env="EXPORT_BATCH",
+        description="Количество строк, читаемых курсором за раз при выгрузке заказов (/export)"
+    )
+
     # Безопасность
     encryption_key: str = Field(..., env="ENCRYPTION_KEY")
+    encryption_old_keys: List[str] = Field(
+        default_factory=list,
+        env="ENCRYPTION_OLD_KEYS",
+        description="Прежние ключи Fernet (JSON-список) для расшифровки при ротации"
+    )
+    crypto_workers: int = Field(
+        default=2,
+        env="CRYPTO_WORKERS",
+        description="Потоки для шифрования Fernet вне цикла событий"
+    )
+    key_rotation_interval: float = Field(
+        default=3600.0,
+        env="KEY_ROTATION_INTERVAL",
+        description="Период проверки ключей, зашифрованных прежним ключом, сек"
+    )
+    key_rotation_batch: int = Field(
+        default=500,
+        env="KEY_ROTATION_BATCH",
+        description="Количество ключей, перешифровываемых в одной транзакции"
+    )
     
     # API
     blockcypher_api: Optional[str] = Field(
@@ -34,13 +235,271 @@ class Config(BaseSettings):
         env="BLOCKCYPHER_API",
         description="API-ключ BlockCypher (опционально)"
     )
+    blockcypher_base_url: str = Field(
+        default="https://api.blockcypher.com",
+        env="BLOCKCYPHER_BASE_URL",
+        description="Базовый URL BlockCypher (для локальной заглушки в тестах)"
+    )
+    blockcypher_timeout: float = Field(
+        default=10.0,
+        env="BLOCKCYPHER_TIMEOUT",
+        description="Таймаут одного запроса к провайдеру блокчейн-данных, сек"
+    )
+    blockcypher_max_connections: int = Field(
+        default=20,
+        env="BLOCKCYPHER_MAX_CONNECTIONS",
+        description="Размер keep-alive пула HTTP-соединений каждого провайдера"
+    )
+    blockcypher_max_concurrency: int = Field(
+        default=10,
+        env="BLOCKCYPHER_MAX_CONCURRENCY",
+        description="Максимум одновременных запросов к одному провайдеру"
+    )
+    blockcypher_retries: int = Field(
+        default=3,
+        env="BLOCKCYPHER_RETRIES",
+        description="Количество повторов запроса пулом провайдеров, если все отказали временно (сеть, 429/5xx)"
+    )
+    blockchair_api: Optional[str] = Field(
+        default=None,
+        env="BLOCKCHAIR_API",
+        description="API-ключ Blockchair (опционально)"
+    )
+
+    # Провайдеры блокчейн-данных
+    blockchain_providers: List[str] = Field(
+        default_factory=lambda: ["blockcypher"],
+        env="BLOCKCHAIN_PROVIDERS",
+        description="Провайдеры по приоритету (JSON-список): blockcypher, blockchair, blockcypher=<url>"
+    )
+    provider_failure_threshold: int = Field(
+        default=5,
+        env="PROVIDER_FAILURE_THRESHOLD",
+        description="Ошибок подряд, после которых провайдер временно исключается"
+    )
+    provider_open_timeout: float = Field(
+        default=30.0,
+        env="PROVIDER_OPEN_TIMEOUT",
+        description="Время исключения провайдера до пробного запроса, сек"
+    )
+    provider_hedging: bool = Field(
+        default=True,
+        env="PROVIDER_HEDGING",
+        description="Дублировать медленные проверки балансов следующему провайдеру"
+    )
+    provider_hedge_percentile: float = Field(
+        default=0.95,
+        env="PROVIDER_HEDGE_PERCENTILE",
+        description="Перцентиль задержек провайдера, после которого запрос дублируется"
+    )
+    provider_hedge_min_delay: float = Field(
+        default=0.1,
+        env="PROVIDER_HEDGE_MIN_DELAY",
+        description="Минимальная задержка перед дублирующим запросом, сек"
+    )
+
+    # Фоновая проверка платежей
+    payment_watch_interval: float = Field(
+        default=30.0,
+        env="PAYMENT_WATCH_INTERVAL",
+        description="Период проверки ожидающих оплаты транзакций, сек"
+    )
+    payment_watch_batch_size: int = Field(
+        default=50,
+        env="PAYMENT_WATCH_BATCH_SIZE",
+        description="Количество адресов в одном запросе баланса"
+    )
+    payment_watch_limit: int = Field(
+        default=1000,
+        env="PAYMENT_WATCH_LIMIT",
+        description="Максимум транзакций, проверяемых за один проход"
+    )
+    payment_cache_paid_ttl: float = Field(
+        default=600.0,
+        env="PAYMENT_CACHE_PAID_TTL",
+        description="Сколько хранится статус оплаченного адреса, сек"
+    )
+    payment_cache_unpaid_ttl: float = Field(
+        default=15.0,
+        env="PAYMENT_CACHE_UNPAID_TTL",
+        description="Сколько хранится статус неоплаченного адреса, сек (меньше периода проверки)"
+    )
+
+    # Уведомления администраторов
+    notify_global_rate: float = Field(
+        default=25.0,
+        env="NOTIFY_GLOBAL_RATE",
+        description="Общий лимит уведомлений в секунду (лимит Telegram - 30)"
+    )
+    notify_per_chat_rate: float = Field(
+        default=1.0,
+        env="NOTIFY_PER_CHAT_RATE",
+        description="Лимит сообщений в секунду в один чат"
+    )
+    notify_per_chat_burst: int = Field(
+        default=3,
+        env="NOTIFY_PER_CHAT_BURST",
+        description="Допустимая пачка сообщений в один чат"
+    )
+    notify_max_retries: int = Field(
+        default=3,
+        env="NOTIFY_MAX_RETRIES",
+        description="Повторы отправки после RetryAfter и сетевых ошибок"
+    )
+    notify_digest_threshold: int = Field(
+        default=10,
+        env="NOTIFY_DIGEST_THRESHOLD",
+        description="Число событий одного типа за окно, после которого включаются сводки"
+    )
+    notify_digest_window: float = Field(
+        default=60.0,
+        env="NOTIFY_DIGEST_WINDOW",
+        description="Окно подсчета частоты событий, сек"
+    )
+    notify_digest_interval: float = Field(
+        default=60.0,
+        env="NOTIFY_DIGEST_INTERVAL",
+        description="Период отправки сводок, сек"
+    )
+    notify_queue_size: int = Field(
+        default=1000,
+        env="NOTIFY_QUEUE_SIZE",
+        description="Очередь уведомлений администраторам; при переполнении новые отбрасываются"
+    )
+
+    # Брошенные счета
+    pending_expiry_after: int = Field(
+        default=86400,
+        env="PENDING_EXPIRY_AFTER",
+        description="Неоплаченный счет без резерва старше этого срока получает статус expired, сек"
+    )
+    pending_expiry_interval: float = Field(
+        default=300.0,
+        env="PENDING_EXPIRY_INTERVAL",
+        description="Период очистки брошенных счетов, сек"
+    )
+    pending_expiry_batch: int = Field(
+        default=500,
+        env="PENDING_EXPIRY_BATCH",
+        description="Количество счетов, проверяемых и просрочиваемых за одну пачку"
+    )
+    address_recycle_after: int = Field(
+        default=604800,
+        env="ADDRESS_RECYCLE_AFTER",
+        description="Через сколько после истечения счета его адрес проверяется на поздние платежи и выводится из оборота, сек"
+    )
+
+    # Рабочее окно заказов и архивация
+    transactions_hot_days: int = Field(
+        default=90,
+        env="TRANSACTIONS_HOT_DAYS",
+        description="Заказы младше этого срока читаются по умолчанию; закрытые старше - уходят в архив, дни"
+    )
+    archive_interval: float = Field(
+        default=21600.0,
+        env="ARCHIVE_INTERVAL",
+        description="Период архивации старых заказов и обслуживания секций, сек"
+    )
+    archive_batch: int = Field(
+        default=1000,
+        env="ARCHIVE_BATCH",
+        description="Количество заказов, переносимых в архив в одной транзакции"
+    )
+    partition_months_ahead: int = Field(
+        default=2,
+        env="PARTITION_MONTHS_AHEAD",
+        description="На сколько месяцев вперед создаются секции transactions (PostgreSQL)"
+    )
+
+    # Статистика продаж
+    stats_reconcile_interval: float = Field(
+        default=86400.0,
+        env="STATS_RECONCILE_INTERVAL",
+        description="Период сверки счетчиков статистики с таблицей заказов, сек"
+    )
+    stats_reconcile_batch: int = Field(
+        default=5000,
+        env="STATS_RECONCILE_BATCH",
+        description="Количество заказов, читаемых за один запрос при сверке"
+    )
+
+    # Резервирование товара
+    reservation_ttl: int = Field(
+        default=1800,
+        env="RESERVATION_TTL",
+        description="Срок резерва товара под неоплаченный счет, сек; счет истекает вместе с резервом"
+    )
+    reservation_release_interval: float = Field(
+        default=60.0,
+        env="RESERVATION_RELEASE_INTERVAL",
+        description="Период освобождения просроченных резервов, сек"
+    )
+    reservation_release_batch: int = Field(
+        default=500,
+        env="RESERVATION_RELEASE_BATCH",
+        description="Количество резервов, освобождаемых в одной транзакции"
+    )
+
+    # Пул заранее сгенерированных адресов
+    wallet_pool_currencies: List[str] = Field(
+        default_factory=lambda: ["BTC", "LTC"],
+        env="WALLET_POOL_CURRENCIES",
+        description="Валюты, для которых поддерживается пул адресов"
+    )
+    wallet_pool_low_water: int = Field(
+        default=10,
+        env="WALLET_POOL_LOW_WATER",
+        description="Порог свободных адресов, ниже которого пул пополняется"
+    )
+    wallet_pool_target: int = Field(
+        default=30,
+        env="WALLET_POOL_TARGET",
+        description="Целевое количество свободных адресов в пуле"
+    )
+    wallet_pool_refill_batch: int = Field(
+        default=10,
+        env="WALLET_POOL_REFILL_BATCH",
+        description="Максимум адресов, генерируемых за один проход"
+    )
+    wallet_pool_refill_interval: float = Field(
+        default=60.0,
+        env="WALLET_POOL_REFILL_INTERVAL",
+        description="Период проверки заполненности пула, сек"
+    )
     
+    # Метрики Prometheus
+    metrics_port: Optional[int] = Field(
+        default=9100,
+        env="METRICS_PORT",
+        description="Порт HTTP-эндпоинта /metrics (пусто - метрики не публикуются)"
+    )
+    metrics_port_attempts: int = Field(
+        default=8,
+        env="METRICS_PORT_ATTEMPTS",
+        description="Сколько портов подряд от METRICS_PORT пробовать, если порт занят (несколько воркеров на хосте)"
+    )
+
     # Логирование
     log_level: str = Field(
         default="INFO",
         env="LOG_LEVEL",
         description="Уровень логирования (DEBUG, INFO, WARNING, ERROR)"
     )
+    log_format: Literal["text", "json"] = Field(
+        default="text",
+        env="LOG_FORMAT",
+        description="Формат записей: text или json (JSON Lines)"
+    )
+    log_stack_sample_rate: float = Field(
+        default=0.01,
+        env="LOG_STACK_SAMPLE_RATE",
+        description="Доля ошибок, для которых в лог пишется стек вызова (0..1)"
+    )
+    log_backup_days: int = Field(
+        default=14,
+        env="LOG_BACKUP_DAYS",
+        description="Количество хранимых суточных лог-файлов"
+    )
     
     # Traefik
     traefik_domain: Optional[str] = Field(
@@ -58,7 +517,10 @@ class Config(BaseSettings):
         env_file = ".env"
         env_file_encoding = "utf-8"
         case_sensitive = False  # Игнорировать регистр переменных
+        frozen = True  # Настройки не меняются после загрузки
 
 
-# Создание экземпляра конфигурации
-config = Config()
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_config() -> Config:
+    """Единственный экземпляр конфигурации, создается при первом обращении"""
+    return Config()
\ No newline at end of file
@@ -1,30 +1,136 @@
-import os
-import requests
-from cryptography.fernet import Fernet
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from src.bot.metrics import PAYMENT_STATUS_LOOKUPS
+from src.bot.providers import ProviderError, ProviderPool
+from src.bot.vault import KeyVault
+
+logger = logging.getLogger(__name__)
 
 class CryptoProcessor:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.cipher = Fernet(os.getenv('ENCRYPTION_KEY').encode())
+    """
+    Платежные операции поверх пула провайдеров блокчейн-данных.
+
+    Генерация адресов с шифрованием приватного ключа и проверка оплаты
+    с кэшем статусов адресов. Выбор провайдера, переключение при отказах и
+    хеджирование запросов выполняет ProviderPool.
+    """
+
+    def __init__(
+        self,
+        pool: ProviderPool,
+        vault: KeyVault,
+        paid_ttl: float = 600.0,
+        unpaid_ttl: float = 15.0,
+        max_cached: int = 50000
+    ):
+        self.pool = pool
+        self.vault = vault
+
+        # Статусы адресов: (валюта, адрес) -> (истекает, оплачен) и общие запросы в процессе
+        self.paid_ttl = paid_ttl
+        self.unpaid_ttl = unpaid_ttl
+        self.max_cached = max_cached
+        self._status_cache: Dict[Tuple[str, str], Tuple[float, bool]] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
 
-    def generate_wallet(self, currency: str) -> dict:
+    async def generate_wallet(self, currency: str, timeout: Optional[float] = None) -> dict:
         """Генерирует новый кошелек для указанной криптовалюты"""
-        url = f"https://api.blockcypher.com/v1/{currency}/main/addrs"
-        response = requests.post(url, params={'token': self.api_key})
-        
-        if response.status_code == 201:
-            data = response.json()
-            return {
-                'address': data['address'],
-                'private': self.cipher.encrypt(data['private'].encode()).decode()
-            }
-        raise Exception(f"Blockcypher API error: {response.text}")
-
-    def check_payment(self, address: str, currency: str) -> bool:
-        """Проверяет наличие подтвержденных платежей по адресу"""
-        url = f"https://api.blockcypher.com/v1/{currency}/main/addrs/{address}/balance"
-        response = requests.get(url, params={'token': self.api_key})
-        
-        if response.status_code == 200:
-            return response.json().get('final_balance', 0) > 0
-        return False
\ No newline at end of file
+        wallet = await self.pool.generate_address(currency, timeout=timeout)
+        return {
+            'address': wallet['address'],
+            'private': await self.vault.encrypt(wallet['private']),
+            'key_id': self.vault.key_id
+        }
+
+    def _cached_status(self, key: Tuple[str, str]) -> Optional[bool]:
+        entry = self._status_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._status_cache[key]
+            return None
+        return entry[1]
+
+    def _remember_status(self, key: Tuple[str, str], paid: bool) -> None:
+        now = time.monotonic()
+        if len(self._status_cache) >= self.max_cached:
+            self._status_cache = {k: v for k, v in self._status_cache.items() if v[0] > now}
+            if len(self._status_cache) >= self.max_cached:
+                self._status_cache.clear()
+        self._status_cache[key] = (now + (self.paid_ttl if paid else self.unpaid_ttl), paid)
+
+    async def check_payment(self, address: str, currency: str, timeout: Optional[float] = None) -> bool:
+        """Проверяет наличие подтвержденных платежей по адресу (через кэш статусов)"""
+        paid = await self.check_payments([address], currency, timeout=timeout)
+        if address not in paid:
+            raise ProviderError(f"Не удалось проверить баланс {address}")
+        return paid[address]
+
+    async def check_payments(
+        self,
+        addresses: List[str],
+        currency: str,
+        batch_size: int = 50,
+        timeout: Optional[float] = None
+    ) -> Dict[str, bool]:
+        """
+        Проверяет сразу несколько адресов пакетными запросами по batch_size адресов.
+
+        Результат кэшируется по адресу: оплаченный - на paid_ttl, неоплаченный - на
+        unpaid_ttl. Адрес, который уже проверяется другим вызовом, повторно не
+        запрашивается - вызовы ждут один общий запрос. Адреса, проверить которые
+        не удалось, в результат не попадают.
+        """
+        paid = {}
+        shared = {}
+        missing = []
+        for address in dict.fromkeys(addresses):
+            key = (currency, address)
+            cached = self._cached_status(key)
+            if cached is not None:
+                paid[address] = cached
+            elif key in self._inflight:
+                shared[address] = self._inflight[key]
+            else:
+                missing.append(address)
+
+        PAYMENT_STATUS_LOOKUPS.labels("cached").inc(len(paid))
+        PAYMENT_STATUS_LOOKUPS.labels("shared").inc(len(shared))
+        PAYMENT_STATUS_LOOKUPS.labels("requested").inc(len(missing))
+
+        loop = asyncio.get_running_loop()
+        futures = {address: loop.create_future() for address in missing}
+        for address, future in futures.items():
+            self._inflight[(currency, address)] = future
+
+        try:
+            batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+            results = await asyncio.gather(
+                *(self.pool.get_balances(batch, currency, timeout) for batch in batches),
+                return_exceptions=True
+            )
+            for batch, result in zip(batches, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Ошибка пакетной проверки {len(batch)} адресов: {result}")
+                    continue
+                for address, is_paid in result.items():
+                    self._remember_status((currency, address), is_paid)
+                paid.update(result)
+        finally:
+            # Ожидающие получают результат и при ошибке/отмене запроса: None - статус неизвестен
+            for address, future in futures.items():
+                if self._inflight.get((currency, address)) is future:
+                    del self._inflight[(currency, address)]
+                future.set_result(paid.get(address))
+
+        if shared:
+            # shield: отмена одного ожидающего не отменяет общий результат для остальных
+            results = await asyncio.gather(*(asyncio.shield(future) for future in shared.values()))
+            paid.update({address: result for address, result in zip(shared, results) if result is not None})
+        return paid
+
+    async def aclose(self) -> None:
+        """Закрывает HTTP-соединения провайдеров"""
+        await self.pool.aclose()
@@ -1,9 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, Numeric, DateTime, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Numeric, DateTime, ForeignKey, Text, Index, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 from datetime import datetime
+from src.bot.metrics import instrument_engine
 
 Base = declarative_base()
 
+# Асинхронные драйверы для поддерживаемых СУБД
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite",
+}
+
 class Product(Base):
     __tablename__ = 'products'
     id = Column(Integer, primary_key=True)
@@ -14,6 +23,11 @@ class Product(Base):
     stock = Column(Integer, default=0)
 
 class Transaction(Base):
+    """
+    Заказ. В PostgreSQL таблица секционирована по месяцам created_at
+    (миграция 007, первичный ключ (id, created_at)); запросы по умолчанию
+    ограничиваются окном TRANSACTIONS_HOT_DAYS, чтобы читать только свежие секции.
+    """
     __tablename__ = 'transactions'
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False)
@@ -24,7 +38,142 @@ class Transaction(Base):
     status = Column(String(50), default='pending')
     created_at = Column(DateTime, default=datetime.utcnow)
 
-def init_db(database_url: str):
-    engine = create_engine(database_url)
-    Base.metadata.create_all(engine)
-    return sessionmaker(bind=engine)
\ No newline at end of file
+    __table_args__ = (
+        # История заказов пользователя и админа: keyset по (created_at, id) от новых к старым
+        Index('idx_transactions_user_created', user_id, created_at.desc(), id.desc()),
+        Index('idx_transactions_created', created_at.desc(), id.desc()),
+        # Фоновая проверка оплаты читает только ожидающие транзакции
+        Index(
+            'idx_transactions_pending', 'id',
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'")
+        ),
+        # Вывод адресов просроченных счетов из оборота
+        Index(
+            'idx_transactions_expired', 'created_at',
+            postgresql_where=text("status = 'expired'"),
+            sqlite_where=text("status = 'expired'")
+        ),
+    )
+
+class TransactionArchive(Base):
+    """Закрытые заказы (completed, refunded, expired) старше окна TRANSACTIONS_HOT_DAYS"""
+    __tablename__ = 'transactions_archive'
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False)
+    product_id = Column(Integer)
+    crypto_address = Column(String(255))
+    amount = Column(Numeric(16, 8))
+    currency = Column(String(10))
+    status = Column(String(50))
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_transactions_archive_user_created', user_id, created_at.desc(), id.desc()),
+    )
+
+class DepositAddress(Base):
+    """Заранее сгенерированный адрес для оплаты (приватный ключ зашифрован Fernet)"""
+    __tablename__ = 'deposit_addresses'
+    id = Column(Integer, primary_key=True)
+    currency = Column(String(10), nullable=False)
+    address = Column(String(255), nullable=False, unique=True)
+    private_key = Column(Text, nullable=False)
+    key_id = Column(String(16))
+    status = Column(String(20), nullable=False, default='free')
+    created_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime)
+
+    __table_args__ = (
+        Index(
+            'idx_deposit_addresses_free', 'currency', 'id',
+            postgresql_where=text("status = 'free'"),
+            sqlite_where=text("status = 'free'")
+        ),
+    )
+
+class StockReservation(Base):
+    """Резерв единицы товара под неоплаченный счет"""
+    __tablename__ = 'stock_reservations'
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    # Без внешнего ключа: заказ может быть перенесен в архив, а transactions секционирована
+    transaction_id = Column(Integer, nullable=False, unique=True)
+    status = Column(String(20), nullable=False, default='active')
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index(
+            'idx_stock_reservations_expiry', 'expires_at',
+            postgresql_where=text("status = 'active'"),
+            sqlite_where=text("status = 'active'")
+        ),
+    )
+
+class StatCounter(Base):
+    """
+    Счетчик, обновляемый при смене статуса заказа (orders_pending, orders_completed, ...).
+
+    Значение счетчика - сумма по слотам: параллельные заказы изменяют разные строки.
+    """
+    __tablename__ = 'stat_counters'
+    name = Column(String(50), primary_key=True)
+    slot = Column(SmallInteger, primary_key=True, default=0)
+    value = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class SalesRollup(Base):
+    """Выручка по оплаченным заказам за час или сутки в разрезе валюты"""
+    __tablename__ = 'sales_rollups'
+    granularity = Column(String(10), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    currency = Column(String(10), primary_key=True)
+    slot = Column(SmallInteger, primary_key=True, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(24, 8), nullable=False, default=0)
+
+def to_async_url(database_url) -> URL:
+    """Подменяет драйвер в URL на асинхронный (postgresql -> asyncpg, sqlite -> aiosqlite)"""
+    url = make_url(str(database_url))
+    backend = url.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver and url.get_driver_name() != driver:
+        url = url.set(drivername=f"{backend}+{driver}")
+    return url
+
+def create_db_engine(
+    database_url,
+    pool_size: int = 10,
+    max_overflow: int = 20,
+    pool_timeout: float = 5.0,
+    pool_recycle: int = 1800
+) -> AsyncEngine:
+    """Создает асинхронный движок с настроенным пулом соединений"""
+    url = to_async_url(database_url)
+    options = {"pool_pre_ping": True}
+
+    # SQLite работает без сетевого пула, параметры пула применимы только к серверным СУБД
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle
+        )
+    return create_async_engine(url, **options)
+
+async def init_db(database_url, **pool_options) -> async_sessionmaker:
+    """Создает схему и возвращает фабрику асинхронных сессий"""
+    engine = create_db_engine(database_url, **pool_options)
+    instrument_engine(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    # expire_on_commit=False: после commit атрибуты остаются доступны без ленивой подгрузки
+    return async_sessionmaker(bind=engine, expire_on_commit=False)
+
+async def close_db(session_factory: async_sessionmaker) -> None:
+    """Закрывает все соединения пула"""
+    await session_factory.kw["bind"].dispose()
@@ -0,0 +1,180 @@
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram.ext import ContextTypes
+from src.bot.database import DepositAddress, Transaction
+from src.bot.metrics import ORDER_SWEEPER_DURATION, ORDER_SWEEPER_RESULTS
+from src.bot.payment_watcher import check_orders, confirm_payments
+from src.bot.reservations import release_reservations
+from src.bot.stats import bump_counters, counter_name
+
+logger = logging.getLogger(__name__)
+
+async def expire_orders(session: AsyncSession, orders: List[Tuple[int, datetime]]) -> Tuple[List[int], Counter]:
+    """
+    Переводит ожидающие транзакции в expired одним UPDATE и освобождает их резервы.
+
+    Обновление условное (status = 'pending'), поэтому заказ, оплаченный между
+    проверкой и обновлением, не будет просрочен. Заказы передаются парами
+    (id, created_at): диапазон времени создания ограничивает UPDATE секциями,
+    в которых лежат заказы. Коммит выполняет вызывающий код.
+
+    Returns:
+        ID просроченных транзакций и возвращенный на склад товар по ID
+    """
+    transaction_ids = [transaction_id for transaction_id, _ in orders]
+    created = [created_at for _, created_at in orders]
+    result = await session.execute(
+        update(Transaction)
+        .where(
+            Transaction.id.in_(transaction_ids),
+            Transaction.created_at.between(min(created), max(created)),
+            Transaction.status == 'pending'
+        )
+        .values(status='expired')
+        .returning(Transaction.id)
+    )
+    expired = result.scalars().all()
+    if not expired:
+        return [], Counter()
+
+    await bump_counters(session, {counter_name('pending'): -len(expired), counter_name('expired'): len(expired)})
+    return expired, await release_reservations(session, expired)
+
+async def sweep_stale_orders(context: ContextTypes.DEFAULT_TYPE, cutoff: datetime) -> Counter:
+    """
+    Просрочивает счета, созданные до cutoff и не оплаченные.
+
+    Заказы читаются keyset-пачками по id (частичный индекс ожидающих). Перед
+    переводом в expired адреса пачки проверяются: поздняя оплата завершает заказ,
+    а заказ, проверить который не удалось, остается ожидающим до следующего запуска.
+    """
+    Session = context.bot_data['session_factory']
+    config = context.bot_data['config']
+    totals = Counter()
+    last_id = 0
+
+    while True:
+        async with Session() as session:
+            result = await session.execute(
+                select(Transaction.id, Transaction.crypto_address, Transaction.currency, Transaction.created_at)
+                .where(Transaction.status == 'pending', Transaction.created_at < cutoff, Transaction.id > last_id)
+                .order_by(Transaction.id)
+                .limit(config.pending_expiry_batch)
+            )
+            rows = result.all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        paid = await check_orders(context.bot_data['crypto'], rows, config.payment_watch_batch_size)
+        stale = [(row.id, row.created_at) for row in rows if paid[row.id] is False]
+        totals['late_paid'] += await confirm_payments(context, [(row.id, row.created_at) for row in rows if paid[row.id]])
+        totals['unchecked'] += sum(1 for is_paid in paid.values() if is_paid is None)
+
+        if stale:
+            async with Session() as session:
+                expired, released = await expire_orders(session, stale)
+                await session.commit()
+            totals['expired'] += len(expired)
+            totals['released'] += sum(released.values())
+
+        if len(rows) < config.pending_expiry_batch:
+            break
+    return totals
+
+async def retire_addresses(context: ContextTypes.DEFAULT_TYPE, cutoff: datetime) -> Counter:
+    """
+    Выводит из оборота (retired) адреса счетов, просроченных до cutoff.
+
+    В пул такие адреса не возвращаются: проверка оплаты видит только наличие
+    средств на адресе, поэтому поздний платеж прежнего покупателя засчитал бы
+    заказ нового. Перед выводом проверяется баланс: средства, пришедшие после
+    истечения счета, пишутся в журнал - такой платеж требует ручного возврата.
+    Адрес, проверить который не удалось, остается claimed до следующего запуска.
+    """
+    Session = context.bot_data['session_factory']
+    config = context.bot_data['config']
+    totals = Counter()
+    last_id = 0
+
+    while True:
+        async with Session() as session:
+            result = await session.execute(
+                select(DepositAddress.id, DepositAddress.address.label('crypto_address'),
+                       DepositAddress.currency, Transaction.id.label('transaction_id'))
+                .join(Transaction, Transaction.crypto_address == DepositAddress.address)
+                .where(
+                    Transaction.status == 'expired',
+                    Transaction.created_at < cutoff,
+                    DepositAddress.status == 'claimed',
+                    DepositAddress.claimed_at <= Transaction.created_at,
+                    DepositAddress.id > last_id
+                )
+                .order_by(DepositAddress.id)
+                .limit(config.pending_expiry_batch)
+            )
+            rows = result.all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        paid = await check_orders(context.bot_data['crypto'], rows, config.payment_watch_batch_size)
+        checked = [address_id for address_id, is_paid in paid.items() if is_paid is not None]
+        # Адрес может встретиться в пачке несколько раз (выданный повторно до вывода адресов из оборота)
+        funded = {row.id: row for row in rows if paid.get(row.id)}
+
+        if checked:
+            async with Session() as session:
+                await session.execute(
+                    update(DepositAddress)
+                    .where(DepositAddress.id.in_(checked), DepositAddress.status == 'claimed')
+                    .values(status='retired')
+                )
+                await session.commit()
+
+        for row in funded.values():
+            logger.critical(f"Средства пришли на адрес {row.crypto_address} после истечения счета #{row.transaction_id}")
+        totals['retired'] += len(checked)
+        totals['late_funded'] += len(funded)
+
+        if len(rows) < config.pending_expiry_batch:
+            break
+    return totals
+
+async def sweep_pending_orders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Фоновая очистка брошенных счетов.
+
+    Счета старше PENDING_EXPIRY_AFTER переводятся в expired пачками с возвратом
+    товара на склад, поэтому множество ожидающих заказов (индекс, /stats,
+    проверка оплаты) не растет с трафиком. Через ADDRESS_RECYCLE_AFTER после
+    истечения адреса таких счетов выводятся из оборота.
+    """
+    config = context.bot_data['config']
+    started = time.perf_counter()
+
+    cutoff = datetime.utcnow() - timedelta(seconds=config.pending_expiry_after)
+    totals = await sweep_stale_orders(context, cutoff)
+    expired_in = time.perf_counter() - started
+
+    totals.update(await retire_addresses(context, cutoff - timedelta(seconds=config.address_recycle_after)))
+    elapsed = time.perf_counter() - started
+
+    ORDER_SWEEPER_DURATION.observe(elapsed)
+    for result, count in totals.items():
+        ORDER_SWEEPER_RESULTS.labels(result).inc(count)
+
+    if totals['released']:
+        await context.bot_data['catalog_cache'].invalidate()
+    if any(totals.values()):
+        logger.info(
+            f"Просрочено счетов: {totals['expired']} (товара возвращено: {totals['released']}), "
+            f"оплачено с опозданием: {totals['late_paid']}, не проверено: {totals['unchecked']} "
+            f"за {expired_in:.1f} с; адресов выведено из оборота: {totals['retired']}, "
+            f"из них с поздними платежами: {totals['late_funded']}; всего {elapsed:.1f} с"
+        )
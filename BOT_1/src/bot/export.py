@@ -0,0 +1,111 @@
+import asyncio
+import csv
+import gzip
+import io
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.bot.database import Product, Transaction, TransactionArchive
+
+logger = logging.getLogger(__name__)
+
+# Колонки выгрузки заказов для бухгалтерии
+EXPORT_COLUMNS = (
+    "id", "created_at", "user_id", "product_id", "product_name",
+    "amount", "currency", "status", "crypto_address"
+)
+
+DATE_FORMAT = "%Y-%m-%d"
+
+def parse_period(args: Sequence[str]) -> Tuple[datetime, datetime]:
+    """
+    Период выгрузки из аргументов команды: /export <с> <по> (ГГГГ-ММ-ДД, обе даты включительно).
+
+    Returns:
+        Полуинтервал [начало первого дня, начало дня после последнего)
+    """
+    if len(args) != 2:
+        raise ValueError("❌ Формат: /export <с ГГГГ-ММ-ДД> <по ГГГГ-ММ-ДД>")
+    try:
+        start, end = (datetime.strptime(arg, DATE_FORMAT) for arg in args)
+    except ValueError:
+        raise ValueError("❌ Даты указываются в формате ГГГГ-ММ-ДД, например 2025-01-31")
+    if start > end:
+        raise ValueError("❌ Начало периода позже его конца")
+    return start, end + timedelta(days=1)
+
+def _format_row(row) -> tuple:
+    return (
+        row.id,
+        row.created_at.isoformat(sep=" ") if row.created_at else "",
+        row.user_id,
+        row.product_id if row.product_id is not None else "",
+        row.product_name or "",
+        row.amount if row.amount is not None else "",
+        row.currency or "",
+        row.status or "",
+        row.crypto_address or "",
+    )
+
+def _write_rows(stream: io.TextIOWrapper, rows: List) -> None:
+    """Форматирование, CSV и сжатие пачки - в потоке, чтобы не занимать цикл событий"""
+    csv.writer(stream).writerows(_format_row(row) for row in rows)
+
+async def export_transactions(
+    session: AsyncSession,
+    start: datetime,
+    end: datetime,
+    path: str,
+    batch_size: int = 2000,
+    progress: Optional[Callable[[int], Awaitable[None]]] = None
+) -> int:
+    """
+    Выгружает заказы за [start, end) с названиями товаров в gzip-сжатый CSV.
+
+    Строки читаются серверным курсором (stream + yield_per) пачками по
+    batch_size, каждая пачка записывается в файл в отдельном потоке, поэтому
+    память не растет с размером выгрузки, а цикл событий не блокируется.
+    Сначала выгружается архив (transactions_archive), затем рабочая таблица;
+    внутри каждой части строки упорядочены по (created_at, id).
+
+    Args:
+        session: Асинхронная сессия БД
+        start: Начало периода (включительно)
+        end: Конец периода (не включительно)
+        path: Путь к создаваемому файлу .csv.gz
+        batch_size: Строк в одной пачке курсора
+        progress: Вызывается после каждой пачки с числом выгруженных строк
+
+    Returns:
+        Количество выгруженных строк
+    """
+    written = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6) as stream:
+        await asyncio.to_thread(csv.writer(stream).writerow, EXPORT_COLUMNS)
+
+        for table in (TransactionArchive, Transaction):
+            query = (
+                select(
+                    table.id, table.created_at, table.user_id, table.product_id,
+                    Product.name.label("product_name"), table.amount, table.currency,
+                    table.status, table.crypto_address
+                )
+                .outerjoin(Product, Product.id == table.product_id)
+                .where(table.created_at >= start, table.created_at < end)
+                .order_by(table.created_at, table.id)
+                .execution_options(yield_per=batch_size)
+            )
+            result = await session.stream(query)
+            async for rows in result.partitions():
+                await asyncio.to_thread(_write_rows, stream, rows)
+                written += len(rows)
+                if progress:
+                    await progress(written)
+    return written
+
+def export_filename(start: datetime, end: datetime) -> str:
+    """Имя файла выгрузки с датами периода включительно"""
+    last_day = end - timedelta(days=1)
+    return f"transactions_{start:{DATE_FORMAT}}_{last_day:{DATE_FORMAT}}.csv.gz"
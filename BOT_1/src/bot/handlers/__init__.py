@@ -1,9 +1,19 @@
+from telegram import Update
+from telegram.ext import TypeHandler
 from .commands import register_commands
 from .admin import register_admin_handlers
 from .payments import register_payment_handlers
+from src.bot.metrics import instrument_handlers
+from src.bot.throttle import throttle_updates
 
 def register_handlers(application):
     """Регистрация всех обработчиков команд и callback-ов"""
+    # Анти-флуд выполняется до всех обработчиков (группа -1) и останавливает лишние обновления
+    application.add_handler(TypeHandler(Update, throttle_updates), group=-1)
+
     register_commands(application)
     register_admin_handlers(application)
-    register_payment_handlers(application)
\ No newline at end of file
+    register_payment_handlers(application)
+
+    # Метрики латентности и ошибок для каждого обработчика
+    instrument_handlers(application)
\ No newline at end of file
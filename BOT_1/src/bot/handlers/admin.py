@@ -1,18 +1,42 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
-from sqlalchemy.orm import Session
-from src.bot.database import Product, Transaction
-from src.bot.config import Config
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+from src.bot.catalog_import import format_report, import_products, iter_csv, iter_json
+from src.bot.database import Product
+from src.bot.export import export_filename, export_transactions, parse_period
+from src.bot.orders import hot_since, load_order_history
 from src.bot.notifications import notify_admins
 from src.bot.logger import log_admin_action, log_error
+from src.bot.stats import bump_counters, load_stats
+import asyncio
+import csv
+import functools
+import json
+import os
+import tempfile
+import time
 
-config = Config()
+# Количество заказов на странице "Последние заказы"
+RECENT_ORDERS_PAGE_SIZE = 10
+
+# Bot API не отдает ботам файлы больше 20 МБ
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+
+# Сообщение о ходе импорта и выгрузки редактируется не чаще, чем раз в столько секунд
+PROGRESS_EDIT_INTERVAL = 2.0
+
+# Bot API принимает от ботов документы до 50 МБ
+MAX_EXPORT_FILE_SIZE = 50 * 1024 * 1024
+
+# Одновременно выполняется одна выгрузка: каждая держит соединение с БД и курсор
+export_lock = asyncio.Lock()
 
 def admin_only(func):
     """Декоратор для проверки прав администратора"""
+    @functools.wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if update.effective_user.id not in config.admin_ids:
-            await update.message.reply_text("🚫 Доступ запрещен!")
+        if update.effective_user.id not in context.bot_data['config'].admin_ids:
+            await update.effective_message.reply_text("🚫 Доступ запрещен!")
             return
         return await func(update, context)
     return wrapper
@@ -28,7 +52,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             "⚙️ *Панель администратора*:",
             reply_markup=reply_markup,
             parse_mode="Markdown"
@@ -37,7 +61,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     except Exception as e:
         log_error(f"Admin panel error: {str(e)}")
-        await notify_admins(context.bot, f"Ошибка панели: {str(e)}")
+        notify_admins(context.bot_data['notifier'], f"Ошибка панели: {str(e)}")
 
 async def admin_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик кнопок админки"""
@@ -56,7 +80,7 @@ async def admin_button_handler(update: Update, context: ContextTypes.DEFAULT_TYP
             )
         elif query.data == "admin_stats":
             await show_stats(update, context)
-        elif query.data == "admin_orders":
+        elif query.data == "admin_orders" or query.data.startswith("admin_orders_"):
             await show_recent_orders(update, context)
             
     except Exception as e:
@@ -64,36 +88,50 @@ async def admin_button_handler(update: Update, context: ContextTypes.DEFAULT_TYP
 
 @admin_only
 async def show_recent_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать последние заказы"""
+    """Показать последние заказы (кнопка "Более старые" листает историю по курсору)"""
     session = None
+    query = update.callback_query
     try:
+        # admin_orders - первая страница, admin_orders_<курсор> - следующие
+        cursor = None
+        if query and query.data.startswith("admin_orders_"):
+            cursor = query.data[len("admin_orders_"):]
+        
         Session = context.bot_data['session_factory']
         session = Session()
         
-        orders = session.query(Transaction)\
-            .order_by(Transaction.created_at.desc())\
-            .limit(10)\
-            .all()
+        since = hot_since(context.bot_data['config'].transactions_hot_days)
+        orders, next_cursor = await load_order_history(session, RECENT_ORDERS_PAGE_SIZE, cursor, since=since)
             
         if not orders:
-            await update.message.reply_text("📭 Нет последних заказов")
+            await update.effective_message.reply_text("📭 Нет последних заказов")
             return
             
-        response = ["📋 *Последние 10 заказов:*\n"]
+        title = "📋 *Последние заказы:*\n" if not cursor else "📋 *Более старые заказы:*\n"
+        response = [title]
         for order in orders:
             response.append(
                 f"#{order.id} {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
                 f"Статус: {order.status} | Сумма: {order.amount} {order.currency}"
             )
+        
+        reply_markup = None
+        if next_cursor:
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("⏬ Более старые", callback_data=f"admin_orders_{next_cursor}")
+            ]])
             
-        await update.message.reply_text("\n".join(response), parse_mode="Markdown")
+        if cursor:
+            await query.edit_message_text("\n".join(response), reply_markup=reply_markup, parse_mode="Markdown")
+        else:
+            await update.effective_message.reply_text("\n".join(response), reply_markup=reply_markup, parse_mode="Markdown")
         
     except Exception as e:
-        await update.message.reply_text("❌ Ошибка получения заказов")
+        await update.effective_message.reply_text("❌ Ошибка получения заказов")
         log_error(f"Order history error: {str(e)}")
     finally:
         if session:
-            session.close()
+            await session.close()
 
 @admin_only
 async def add_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -121,18 +159,20 @@ async def add_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
             stock=stock
         )
         session.add(product)
-        session.commit()
-        await update.message.reply_text("✅ Товар добавлен")
+        await bump_counters(session, {"products": 1})
+        await session.commit()
+        await context.bot_data['catalog_cache'].invalidate()
+        await update.effective_message.reply_text("✅ Товар добавлен")
         log_admin_action(update.effective_user.id, f"Добавлен товар: {name}")
         
     except ValueError as e:
-        await update.message.reply_text(str(e))
+        await update.effective_message.reply_text(str(e))
     except Exception as e:
-        await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+        await update.effective_message.reply_text(f"❌ Ошибка: {str(e)}")
         log_error(f"Add product error: {str(e)}")
     finally:
         if session:
-            session.close()
+            await session.close()
 
 @admin_only
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -142,25 +182,34 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         Session = context.bot_data['session_factory']
         session = Session()
         
-        total_products = session.query(Product).count()
-        total_sales = session.query(Transaction).filter_by(status="completed").count()
-        pending_orders = session.query(Transaction).filter_by(status="pending").count()
+        # Счетчики и сводки обновляются при смене статуса заказа, полный подсчет не нужен
+        stats = await load_stats(session)
+        counters = stats["counters"]
         
-        stats_text = (
-            "📊 *Статистика продаж*\n\n"
-            f"• Товаров в каталоге: `{total_products}`\n"
-            f"• Успешных заказов: `{total_sales}`\n"
-            f"• Ожидает оплаты: `{pending_orders}`"
-        )
-        await update.message.reply_text(stats_text, parse_mode="Markdown")
+        lines = [
+            "📊 *Статистика продаж*\n",
+            f"• Товаров в каталоге: `{counters.get('products', 0)}`",
+            f"• Успешных заказов: `{counters.get('orders_completed', 0)}`",
+            f"• Ожидает оплаты: `{counters.get('orders_pending', 0)}`",
+            f"• Возвратов: `{counters.get('orders_refunded', 0)}`",
+            f"• Просроченных счетов: `{counters.get('orders_expired', 0)}`"
+        ]
+        for title, key in (("За 24 часа", "day"), ("За 7 дней", "week")):
+            lines.append(f"\n*{title}:*")
+            if not stats[key]:
+                lines.append("• Нет продаж")
+            for currency, (orders, revenue) in sorted(stats[key].items()):
+                lines.append(f"• {currency}: `{orders}` заказов на `{revenue}`")
+        
+        await update.effective_message.reply_text("\n".join(lines), parse_mode="Markdown")
         log_admin_action(update.effective_user.id, "Просмотр статистики")
         
     except Exception as e:
-        await update.message.reply_text("❌ Ошибка получения статистики")
+        await update.effective_message.reply_text("❌ Ошибка получения статистики")
         log_error(f"Stats error: {str(e)}")
     finally:
         if session:
-            session.close()
+            await session.close()
 
 @admin_only
 async def update_stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -177,23 +226,129 @@ async def update_stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
         Session = context.bot_data['session_factory']
         session = Session()
         
-        product = session.query(Product).get(product_id)
+        product = await session.get(Product, product_id)
         if product:
             product.stock = new_stock
-            session.commit()
-            await update.message.reply_text(f"✅ Товар ID {product_id} обновлен")
+            await session.commit()
+            await context.bot_data['catalog_cache'].invalidate()
+            await update.effective_message.reply_text(f"✅ Товар ID {product_id} обновлен")
             log_admin_action(update.effective_user.id, f"Обновлен stock товара #{product_id}")
         else:
-            await update.message.reply_text("❌ Товар не найден")
+            await update.effective_message.reply_text("❌ Товар не найден")
             
     except ValueError as e:
-        await update.message.reply_text(str(e))
+        await update.effective_message.reply_text(str(e))
     except Exception as e:
-        await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+        await update.effective_message.reply_text(f"❌ Ошибка: {str(e)}")
         log_error(f"Update stock error: {str(e)}")
     finally:
         if session:
-            session.close()
+            await session.close()
+
+@admin_only
+async def import_catalog(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Импорт каталога из CSV/JSON документа (колонки: id, name, price_btc, price_ltc, file_id, stock)"""
+    document = update.effective_message.document
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await update.effective_message.reply_text("❌ Файл больше 20 МБ, разбейте каталог на части")
+        return
+
+    status = await update.effective_message.reply_text("⏳ Загрузка файла...")
+    last_edit = time.monotonic()
+
+    async def progress(report):
+        nonlocal last_edit
+        if time.monotonic() - last_edit < PROGRESS_EDIT_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        try:
+            await status.edit_text(format_report(report, done=False))
+        except TelegramError:
+            pass
+
+    try:
+        extension = os.path.splitext(document.file_name or "")[1].lower()
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, f"catalog{extension}")
+            file = await document.get_file()
+            await file.download_to_drive(path)
+
+            # Файл читается построчно с диска, в памяти только текущая пачка
+            with open(path, encoding="utf-8-sig", newline="") as stream:
+                rows = iter_csv(stream) if extension == ".csv" else iter_json(stream)
+                async with context.bot_data['session_factory']() as session:
+                    report = await import_products(
+                        session, rows, context.bot_data['config'].catalog_import_batch, progress
+                    )
+                    await bump_counters(session, {"products": report.inserted})
+                    await session.commit()
+
+        await context.bot_data['catalog_cache'].invalidate()
+        await status.edit_text(format_report(report, done=True))
+        log_admin_action(
+            update.effective_user.id,
+            f"Импорт каталога {document.file_name}: добавлено {report.inserted}, обновлено {report.updated}"
+        )
+
+    except (UnicodeDecodeError, json.JSONDecodeError, csv.Error) as e:
+        await status.edit_text(f"❌ Не удалось разобрать файл, каталог не изменен: {str(e)}")
+    except Exception as e:
+        await status.edit_text("❌ Ошибка импорта, каталог не изменен")
+        log_error(f"Catalog import error: {str(e)}")
+
+@admin_only
+async def export_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгрузка заказов за период в CSV (gzip) для бухгалтерии: /export <с> <по>"""
+    try:
+        start, end = parse_period(context.args)
+    except ValueError as e:
+        await update.effective_message.reply_text(str(e))
+        return
+
+    if export_lock.locked():
+        await update.effective_message.reply_text("⏳ Уже выполняется другая выгрузка, повторите позже")
+        return
+
+    async with export_lock:
+        status = await update.effective_message.reply_text("⏳ Выгрузка заказов...")
+        last_edit = time.monotonic()
+
+        async def progress(written):
+            nonlocal last_edit
+            if time.monotonic() - last_edit < PROGRESS_EDIT_INTERVAL:
+                return
+            last_edit = time.monotonic()
+            try:
+                await status.edit_text(f"⏳ Выгрузка заказов: {written} строк")
+            except TelegramError:
+                pass
+
+        try:
+            filename = export_filename(start, end)
+            with tempfile.TemporaryDirectory() as workdir:
+                path = os.path.join(workdir, filename)
+                async with context.bot_data['session_factory']() as session:
+                    written = await export_transactions(
+                        session, start, end, path, context.bot_data['config'].export_batch, progress
+                    )
+
+                if os.path.getsize(path) > MAX_EXPORT_FILE_SIZE:
+                    await status.edit_text(
+                        f"❌ Выгрузка ({written} строк) больше 50 МБ, укажите период короче"
+                    )
+                    return
+
+                with open(path, "rb") as document:
+                    await update.effective_message.reply_document(
+                        document, filename=filename, caption=f"📄 Заказы: {written} строк",
+                        read_timeout=120, write_timeout=120
+                    )
+            await status.delete()
+            log_admin_action(update.effective_user.id, f"Выгрузка заказов {filename}: {written} строк")
+
+        except Exception as e:
+            await status.edit_text("❌ Ошибка выгрузки заказов")
+            log_error(f"Orders export error: {str(e)}")
 
 def register_admin_handlers(application):
     """Регистрация административных обработчиков"""
@@ -201,4 +356,11 @@ def register_admin_handlers(application):
     application.add_handler(CallbackQueryHandler(admin_button_handler, pattern="^admin_"))
     application.add_handler(CommandHandler("add_product", add_product))
     application.add_handler(CommandHandler("stats", show_stats))
-    application.add_handler(CommandHandler("update_stock", update_stock))
\ No newline at end of file
+    application.add_handler(CommandHandler("update_stock", update_stock))
+    application.add_handler(CommandHandler("export", export_orders))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("csv")
+        | filters.Document.FileExtension("json")
+        | filters.Document.FileExtension("jsonl"),
+        import_catalog
+    ))
\ No newline at end of file
@@ -1,11 +1,123 @@
-from telegram import Update
-from telegram.ext import ContextTypes, CommandHandler
-from sqlalchemy.orm import Session
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
+from sqlalchemy import select
+from typing import Dict, Optional, Tuple
+import json
 from src.bot.database import Product
-from src.bot.config import Config
+from src.bot.orders import hot_since, load_order_history
 from src.bot.logger import log_command, log_error, log_admin_action
 
-config = Config()
+# Количество заказов на странице /my_orders
+MY_ORDERS_PAGE_SIZE = 5
+
+# Направления листания каталога: страница после ID или перед ID
+CATALOG_AFTER = "a"
+CATALOG_BEFORE = "b"
+
+def render_catalog(products, stock: Dict[int, int]) -> str:
+    """Отрисовка страницы каталога в Markdown (остатки - из stock, по ID товара)"""
+    if not products:
+        return "😔 Товары временно отсутствуют"
+
+    response = ["🛒 *Доступные товары:*\n"]
+    for product in products:
+        response.append(
+            f"▪️ *{product['name']}*\n"
+            f"   Цена: `{product['price_btc']} ₿` / `{product['price_ltc']} Ł`\n"
+            f"   Остаток: {stock.get(product['id'], 0)} шт.\n"
+            f"   Купить: /pay_{product['id']}"
+        )
+    return "\n".join(response)
+
+def catalog_keyboard(page: dict) -> Optional[InlineKeyboardMarkup]:
+    """Кнопки листания для страницы каталога"""
+    buttons = []
+    if page["prev"] is not None:
+        buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"catalog_{CATALOG_BEFORE}_{page['prev']}"))
+    if page["next"] is not None:
+        buttons.append(InlineKeyboardButton("Вперед ➡️", callback_data=f"catalog_{CATALOG_AFTER}_{page['next']}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def load_catalog_page(session, direction: str, cursor: int, page_size: int) -> dict:
+    """
+    Читает страницу каталога одним запросом по первичному ключу (keyset-пагинация).
+
+    Запрашивается на одну запись больше размера страницы, чтобы без COUNT(*)
+    узнать, есть ли следующая (или предыдущая) страница.
+
+    Args:
+        session: Асинхронная сессия БД
+        direction: CATALOG_AFTER - товары с ID больше cursor, CATALOG_BEFORE - меньше
+        cursor: Граничный ID (0 - первая страница)
+        page_size: Количество товаров на странице
+
+    Returns:
+        {"products": товары страницы без остатков, "prev": курсор назад, "next": курсор вперед}
+    """
+    query = select(Product).where(Product.stock > 0)
+    if direction == CATALOG_BEFORE:
+        query = query.where(Product.id < cursor).order_by(Product.id.desc())
+    else:
+        query = query.where(Product.id > cursor).order_by(Product.id)
+
+    result = await session.execute(query.limit(page_size + 1))
+    products = result.scalars().all()
+    has_more = len(products) > page_size
+    products = products[:page_size]
+
+    if direction == CATALOG_BEFORE:
+        products.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor > 0, has_more
+
+    return {
+        "products": [
+            {"id": product.id, "name": product.name,
+             "price_btc": f"{product.price_btc:.8f}", "price_ltc": f"{product.price_ltc:.8f}"}
+            for product in products
+        ],
+        "prev": products[0].id if products and has_prev else None,
+        "next": products[-1].id if products and has_next else None,
+        "empty": not products
+    }
+
+async def load_stock(session, products) -> Dict[int, int]:
+    """Текущие остатки товаров страницы одним запросом по первичному ключу"""
+    if not products:
+        return {}
+    result = await session.execute(
+        select(Product.id, Product.stock).where(Product.id.in_([product["id"] for product in products]))
+    )
+    return dict(result.all())
+
+async def get_catalog_page(context: ContextTypes.DEFAULT_TYPE, direction: str, cursor: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Страница каталога из кеша, при промахе - из БД с сохранением в кеш.
+
+    Остатки меняются при каждом резерве и не кешируются: они читаются на каждый
+    запрос по ID товаров страницы, кеш хранит только состав страницы и цены.
+    """
+    cache = context.bot_data['catalog_cache']
+    key = f"{direction}:{cursor}"
+    # Поколение читается до запроса к БД: страница, собранная до инвалидации, не попадет в новое
+    cached, version = await cache.get(key)
+
+    Session = context.bot_data['session_factory']
+    async with Session() as session:
+        if cached is not None:
+            page = json.loads(cached)
+        else:
+            page_size = context.bot_data['config'].catalog_page_size
+            page = await load_catalog_page(session, direction, cursor, page_size)
+            # Товары страницы раскуплены - показываем начало каталога
+            if page["empty"] and cursor:
+                page = await load_catalog_page(session, CATALOG_AFTER, 0, page_size)
+        stock = await load_stock(session, page["products"])
+    if cached is None:
+        await cache.set(key, json.dumps(page), version)
+
+    return render_catalog(page["products"], stock), catalog_keyboard(page)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -45,59 +157,57 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def list_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /products"""
-    session = None
     try:
         user_id = update.effective_user.id
         log_command(user_id, "/products")
         
-        Session = context.bot_data['session_factory']
-        session = Session()
-        
-        products = session.query(Product).filter(Product.stock > 0).all()
-        
-        if not products:
-            await update.message.reply_text("😔 Товары временно отсутствуют")
-            return
-
-        response = ["🛒 *Доступные товары:*\n"]
-        for product in products:
-            response.append(
-                f"▪️ *{product.name}*\n"
-                f"   Цена: `{product.price_btc:.8f} ₿` / `{product.price_ltc:.8f} Ł`\n"
-                f"   Остаток: {product.stock} шт.\n"
-                f"   Купить: /pay_{product.id}"
-            )
-            
-        await update.message.reply_text("\n".join(response), parse_mode="Markdown")
+        # Первая страница каталога, остальные - по кнопкам листания
+        text, reply_markup = await get_catalog_page(context, CATALOG_AFTER, 0)
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode="Markdown")
         
     except Exception as e:
         log_error(f"Ошибка команды /products: {str(e)}")
         await update.message.reply_text("❌ Ошибка загрузки товаров")
-    finally:
-        if session:
-            session.close()
+
+async def catalog_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание каталога кнопками навигации"""
+    query = update.callback_query
+    await query.answer()
+    
+    try:
+        _, direction, cursor = query.data.split('_')
+        text, reply_markup = await get_catalog_page(context, direction, int(cursor))
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode="Markdown")
+        
+    except Exception as e:
+        log_error(f"Ошибка листания каталога: {str(e)}")
 
 async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик команды /my_orders"""
+    """Обработчик команды /my_orders и листания истории заказов"""
     session = None
+    query = update.callback_query
     try:
         user_id = update.effective_user.id
-        log_command(user_id, "/my_orders")
+        cursor = None
+        if query:
+            await query.answer()
+            cursor = query.data.split('_', 1)[1]
+        else:
+            log_command(user_id, "/my_orders")
         
         Session = context.bot_data['session_factory']
         session = Session()
         
-        orders = session.query(Transaction)\
-            .filter(Transaction.user_id == user_id)\
-            .order_by(Transaction.created_at.desc())\
-            .limit(5)\
-            .all()
+        since = hot_since(context.bot_data['config'].transactions_hot_days)
+        orders, next_cursor = await load_order_history(
+            session, MY_ORDERS_PAGE_SIZE, cursor, user_id=user_id, since=since
+        )
             
         if not orders:
-            await update.message.reply_text("📭 У вас нет активных заказов")
+            await update.effective_message.reply_text("📭 У вас нет активных заказов")
             return
             
-        response = ["📋 *Ваши последние заказы:*\n"]
+        response = ["📋 *Ваши последние заказы:*\n" if not cursor else "📋 *Ваши более старые заказы:*\n"]
         for order in orders:
             status_emoji = "✅" if order.status == "completed" else "🕒"
             response.append(
@@ -105,19 +215,30 @@ async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"Дата: {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
                 f"Статус: {order.status.capitalize()}\n"
             )
+        
+        reply_markup = None
+        if next_cursor:
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("⏬ Более старые", callback_data=f"myorders_{next_cursor}")
+            ]])
             
-        await update.message.reply_text("\n".join(response), parse_mode="Markdown")
+        if query:
+            await query.edit_message_text("\n".join(response), reply_markup=reply_markup, parse_mode="Markdown")
+        else:
+            await update.message.reply_text("\n".join(response), reply_markup=reply_markup, parse_mode="Markdown")
         
     except Exception as e:
         log_error(f"Ошибка команды /my_orders: {str(e)}")
-        await update.message.reply_text("❌ Ошибка загрузки заказов")
+        await update.effective_message.reply_text("❌ Ошибка загрузки заказов")
     finally:
         if session:
-            session.close()
+            await session.close()
 
 def register_commands(application):
     """Регистрация обработчиков команд"""
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("products", list_products))
-    application.add_handler(CommandHandler("my_orders", my_orders))
\ No newline at end of file
+    application.add_handler(CallbackQueryHandler(catalog_callback, pattern="^catalog_"))
+    application.add_handler(CommandHandler("my_orders", my_orders))
+    application.add_handler(CallbackQueryHandler(my_orders, pattern="^myorders_"))
\ No newline at end of file
@@ -1,41 +1,75 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, CommandHandler
-from src.bot.crypto import CryptoProcessor
-from src.bot.database import Transaction, Product
-from src.bot.config import Config
+from sqlalchemy import select
+from datetime import datetime
+from src.bot.database import Transaction, DepositAddress
 from src.bot.handlers.admin import admin_only
+from src.bot.notifications import notify_new_order, notify_payment_received
+from src.bot.orders import complete_transaction, hot_since, refund_order
+from src.bot.providers import ProviderError
+from src.bot.reservations import reserve_stock, add_reservation
+from src.bot.stats import record_transition
+from src.bot.wallet_pool import claim_address
 import logging
 
-config = Config()
-crypto = CryptoProcessor(config.blockcypher_api)
 logger = logging.getLogger(__name__)
 
+EXPIRED_TEXT = (
+    "⌛️ Счет истек, заказ отменен.\n"
+    "💸 Если вы отправили оплату на этот адрес, напишите в поддержку "
+    "с номером заказа #{transaction_id} - средства будут возвращены"
+)
+
 async def start_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Инициализация процесса оплаты"""
     try:
         product_id = int(context.args[0])
-        Session = context.bot_data['session']
+        Session = context.bot_data['session_factory']
+        
+        ttl = context.bot_data['config'].reservation_ttl
         
-        with Session() as session:
-            product = session.query(Product).get(product_id)
-            if not product or product.stock < 1:
+        async with Session() as session:
+            # Товар резервируется атомарно в момент создания счета
+            product = await reserve_stock(session, product_id)
+            if product is None:
                 await update.message.reply_text("❌ Товар недоступен")
                 return
 
-            wallet = crypto.generate_wallet('btc' if product.price_btc > 0 else 'ltc')
             currency = 'BTC' if product.price_btc > 0 else 'LTC'
             amount = product.price_btc if currency == 'BTC' else product.price_ltc
 
+            # Адрес берется из заранее заполненного пула, API вызывается только если пул пуст
+            address = await claim_address(session, currency)
+            if address is None:
+                logger.warning(f"Пул адресов {currency} пуст, генерация через API")
+                crypto = context.bot_data['crypto']
+                wallet = await crypto.generate_wallet(currency.lower())
+                address = wallet['address']
+                session.add(DepositAddress(
+                    currency=currency,
+                    address=address,
+                    private_key=wallet['private'],
+                    key_id=wallet['key_id'],
+                    status='claimed',
+                    claimed_at=datetime.utcnow()
+                ))
+
             transaction = Transaction(
                 user_id=update.effective_user.id,
                 product_id=product.id,
-                crypto_address=wallet['address'],
+                crypto_address=address,
                 amount=amount,
                 currency=currency,
                 status='pending'
             )
             session.add(transaction)
-            session.commit()
+            await session.flush()
+            add_reservation(session, product.id, transaction.id, ttl)
+            await record_transition(session, None, 'pending')
+            await session.commit()
+
+            if product.stock == 0:
+                await context.bot_data['catalog_cache'].invalidate()
 
             keyboard = [[InlineKeyboardButton("✅ Я оплатил", callback_data=f"check_{transaction.id}")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -44,13 +78,17 @@ async def start_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"💳 Оплата {product.name}\n\n"
                 f"➖➖➖➖➖➖➖➖➖\n"
                 f"💰 Сумма: {amount} {currency}\n"
-                f"📥 Адрес: {wallet['address']}\n"
+                f"📥 Адрес: {address}\n"
                 f"➖➖➖➖➖➖➖➖➖\n"
-                f"⚠️ Отправьте точную сумму на указанный адрес"
+                f"⚠️ Отправьте точную сумму на указанный адрес\n"
+                f"⏳ Товар зарезервирован на {ttl // 60} мин."
             )
 
             await update.message.reply_text(message_text, reply_markup=reply_markup)
 
+        # Уведомление админам отправляется в фоне под ограничителем частоты - покупатель его не ждет
+        notify_new_order(context.bot_data['notifier'], transaction.id, amount, currency)
+
     except Exception as e:
         logger.error(f"Payment error: {e}")
         await update.message.reply_text("❌ Ошибка при создании платежа")
@@ -61,37 +99,72 @@ async def check_payment_callback(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
     
     transaction_id = int(query.data.split('_')[1])
-    Session = context.bot_data['session']
+    Session = context.bot_data['session_factory']
     
     try:
-        with Session() as session:
-            transaction = session.query(Transaction).get(transaction_id)
+        async with Session() as session:
+            # Счет из рабочего окна: запрос читает только свежие секции таблицы
+            transaction = await session.scalar(
+                select(Transaction).where(
+                    Transaction.id == transaction_id,
+                    Transaction.created_at >= hot_since(context.bot_data['config'].transactions_hot_days)
+                )
+            )
             if not transaction:
                 await query.edit_message_text("❌ Транзакция не найдена")
                 return
 
-            if crypto.check_payment(transaction.crypto_address, transaction.currency.lower()):
-                transaction.status = 'completed'
-                product = session.query(Product).get(transaction.product_id)
-                product.stock -= 1
-                session.commit()
-                
-                await query.edit_message_text(
-                    "✅ Платеж подтвержден!\n"
-                    "📦 Ваш товар будет отправлен в течение 24 часов"
-                )
-                
-                # Уведомление администратора
-                admin_text = (
-                    f"🛎 Новый платеж!\n\n"
-                    f"• Пользователь: @{query.from_user.username}\n"
-                    f"• Товар: {product.name}\n"
-                    f"• Сумма: {transaction.amount} {transaction.currency}"
-                )
-                for admin_id in config.admin_ids:
-                    await context.bot.send_message(admin_id, admin_text)
-            else:
-                await query.edit_message_text("⌛️ Платеж еще не получен. Попробуйте проверить позже")
+            # Завершенные и возвращенные заказы отвечаются из БД, без обращения к провайдерам
+            if transaction.status == 'refunded':
+                await query.edit_message_text("↩️ Средства по заказу возвращены")
+                return
+            if transaction.status == 'expired':
+                await query.edit_message_text(EXPIRED_TEXT.format(transaction_id=transaction_id))
+                return
+
+            completed = False
+            if transaction.status == 'pending':
+                # Статус адреса берется из кэша CryptoProcessor; одновременные нажатия
+                # (и фоновая проверка) ждут один общий запрос к API
+                try:
+                    paid = await context.bot_data['crypto'].check_payment(
+                        transaction.crypto_address, transaction.currency.lower()
+                    )
+                except ProviderError as e:
+                    logger.warning(f"Payment check for #{transaction_id} deferred to watcher: {e}")
+                    paid = False
+                if paid:
+                    completed = await complete_transaction(session, transaction_id, transaction.created_at)
+                    await session.commit()
+                    if not completed:
+                        # Заказ одновременно завершил наблюдатель или просрочила очистка счетов
+                        await session.refresh(transaction)
+                        if transaction.status == 'expired':
+                            await query.edit_message_text(EXPIRED_TEXT.format(transaction_id=transaction_id))
+                            return
+                else:
+                    await query.edit_message_text(
+                        "⌛️ Платеж еще не получен.\n"
+                        "🔔 Мы пришлем уведомление, как только он поступит"
+                    )
+                    return
+
+            if not completed and transaction.status != 'completed':
+                logger.warning(f"Payment check for #{transaction_id}: unexpected status {transaction.status}")
+                await query.edit_message_text("❌ Заказ не может быть подтвержден, обратитесь в поддержку")
+                return
+
+            await query.edit_message_text(
+                "✅ Платеж подтвержден!\n"
+                "📦 Ваш товар будет отправлен в течение 24 часов"
+            )
+
+        if completed:
+            await context.bot_data['catalog_cache'].invalidate()
+            notify_payment_received(
+                context.bot_data['notifier'], transaction.id, transaction.amount,
+                transaction.currency, transaction.crypto_address
+            )
 
     except Exception as e:
         logger.error(f"Payment check error: {e}")
@@ -102,13 +175,18 @@ async def refund_transaction(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Возврат средств по транзакции"""
     try:
         transaction_id = int(context.args[0])
-        Session = context.bot_data['session']
+        Session = context.bot_data['session_factory']
         
-        with Session() as session:
-            transaction = session.query(Transaction).get(transaction_id)
-            if transaction and transaction.status == 'completed':
-                transaction.status = 'refunded'
-                session.commit()
+        async with Session() as session:
+            # Время создания - часть первичного ключа: по нему обновляется одна секция таблицы
+            created_at = await session.scalar(
+                select(Transaction.created_at).where(
+                    Transaction.id == transaction_id,
+                    Transaction.created_at >= hot_since(context.bot_data['config'].transactions_hot_days)
+                )
+            )
+            if created_at and await refund_order(session, transaction_id, created_at):
+                await session.commit()
                 await update.message.reply_text("✅ Возврат успешно выполнен")
             else:
                 await update.message.reply_text("❌ Транзакция не найдена или уже возвращена")
@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import logging
+import os
+import socket
+import uuid
+from redis.exceptions import RedisError
+from telegram.ext import Application, ContextTypes
+from src.bot.archive import archive_old_transactions
+from src.bot.expiry import sweep_pending_orders
+from src.bot.payment_watcher import watch_pending_payments
+from src.bot.reservations import release_expired_reservations
+from src.bot.stats import reconcile_stats
+from src.bot.update_stream import RENEW_LEASE_LUA
+from src.bot.vault import rotate_encryption_keys
+from src.bot.wallet_pool import refill_wallet_pool
+
+logger = logging.getLogger(__name__)
+
+# Захват аренды задачи: свободной или уже своей (владелец запускает задачу и дальше)
+ACQUIRE_LEASE_LUA = """
+local owner = redis.call('GET', KEYS[1])
+if owner == false or owner == ARGV[1] then
+    return redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2]) and 1 or 0
+end
+return 0
+"""
+
+# Владелец аренд фоновых задач этого процесса
+JOB_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def exclusive(callback, interval: float):
+    """
+    Задача выполняется одним процессом на весь кластер.
+
+    Реплики webhook и воркеры потоков регистрируют одни и те же задачи; перед
+    запуском процесс берет аренду jobs:lease:<имя задачи> в Redis (SET PX), у
+    остальных запуск пропускается. Аренда живет полтора интервала и остается за
+    владельцем, пока он запускает задачу; во время долгого выполнения она
+    продлевается. Если владелец остановился, задачу подхватит другой процесс
+    не позже чем через интервал после истечения аренды.
+    """
+    ttl_ms = int(interval * 1.5 * 1000)
+
+    @functools.wraps(callback)
+    async def run(context: ContextTypes.DEFAULT_TYPE) -> None:
+        redis = context.bot_data["redis"]
+        key = f"jobs:lease:{context.job.name}"
+        try:
+            if not await redis.eval(ACQUIRE_LEASE_LUA, 1, key, JOB_OWNER, ttl_ms):
+                return
+        except RedisError as e:
+            # Без Redis нельзя убедиться, что задачу не выполняет другой процесс
+            logger.warning(f"Задача {context.job.name} пропущена: нет доступа к Redis ({str(e)})")
+            return
+
+        renewal = asyncio.create_task(_renew_lease(redis, key, ttl_ms))
+        try:
+            await callback(context)
+        finally:
+            renewal.cancel()
+    return run
+
+async def _renew_lease(redis, key: str, ttl_ms: int) -> None:
+    while True:
+        await asyncio.sleep(ttl_ms / 3000)
+        try:
+            if not await redis.eval(RENEW_LEASE_LUA, 1, key, JOB_OWNER, ttl_ms):
+                logger.warning(f"Аренда {key} перехвачена другим процессом во время выполнения задачи")
+                return
+        except RedisError as e:
+            logger.warning(f"Не удалось продлить аренду {key}: {str(e)}")
+
+def register_jobs(application: Application) -> None:
+    """Регистрация фоновых задач в JobQueue (каждая выполняется одним процессом, см. exclusive)"""
+    config = application.bot_data["config"]
+    job_queue = application.job_queue
+
+    job_queue.run_repeating(
+        exclusive(watch_pending_payments, config.payment_watch_interval),
+        interval=config.payment_watch_interval,
+        first=config.payment_watch_interval,
+        name="payment_watcher"
+    )
+
+    job_queue.run_repeating(
+        exclusive(refill_wallet_pool, config.wallet_pool_refill_interval),
+        interval=config.wallet_pool_refill_interval,
+        first=1,
+        name="wallet_pool_refill"
+    )
+
+    job_queue.run_repeating(
+        exclusive(release_expired_reservations, config.reservation_release_interval),
+        interval=config.reservation_release_interval,
+        first=config.reservation_release_interval,
+        name="reservation_release"
+    )
+
+    job_queue.run_repeating(
+        exclusive(sweep_pending_orders, config.pending_expiry_interval),
+        interval=config.pending_expiry_interval,
+        first=config.pending_expiry_interval,
+        name="pending_expiry"
+    )
+
+    job_queue.run_repeating(
+        exclusive(reconcile_stats, config.stats_reconcile_interval),
+        interval=config.stats_reconcile_interval,
+        first=config.stats_reconcile_interval,
+        name="stats_reconcile"
+    )
+
+    job_queue.run_repeating(
+        exclusive(rotate_encryption_keys, config.key_rotation_interval),
+        interval=config.key_rotation_interval,
+        first=config.key_rotation_interval,
+        name="key_rotation"
+    )
+
+    job_queue.run_repeating(
+        exclusive(archive_old_transactions, config.archive_interval),
+        interval=config.archive_interval,
+        first=config.archive_interval,
+        name="transaction_archive"
+    )
@@ -1,47 +1,114 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
-from src.bot.config import Config
 import sys
 
-config = Config()
+# Доля вызовов log_error/log_critical, для которых сохраняется стек вызова
+_stack_sample_rate = 0.0
+
+class JsonFormatter(logging.Formatter):
+    """Формат JSON Lines: одна запись - один объект"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if hasattr(record, "user_id"):
+            entry["user_id"] = record.user_id
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь без форматирования.
+
+    Стандартный QueueHandler форматирует запись (включая traceback) в потоке,
+    где вызван логгер, то есть в цикле событий. Здесь подставляются только
+    аргументы сообщения, а форматирование и запись на диск выполняет QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def setup_logging(
+    level: str = "INFO",
+    log_format: str = "text",
+    stack_sample_rate: float = 0.0,
+    backup_days: int = 14
+) -> QueueListener:
+    """
+    Инициализация системы логирования.
+
+    Обработчики бота только кладут записи в очередь; файл и stdout пишет
+    QueueListener в отдельном потоке. Файл logs/bot.log ротируется в полночь.
+
+    Args:
+        level: Уровень логирования (DEBUG, INFO, WARNING, ERROR)
+        log_format: text - читаемый формат, json - JSON Lines для сборщиков логов
+        stack_sample_rate: Доля ошибок, для которых сохраняется стек вызова (0..1)
+        backup_days: Сколько суточных файлов хранить
+    """
+    global _stack_sample_rate
+    _stack_sample_rate = stack_sample_rate
 
-def setup_logging() -> None:
-    """Инициализация системы логирования с ротацией файлов"""
     logs_dir = Path("logs")
     logs_dir.mkdir(exist_ok=True, parents=True)
-    
-    log_file = logs_dir / f"bot_{datetime.now().strftime('%Y-%m-%d')}.log"
-    
-    # Формат логов: [Время] [Уровень] [Модуль] - Сообщение
-    formatter = logging.Formatter(
-        fmt="[%(asctime)s] [%(levelname)s] [%(name)s] - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    
-    # Настройка ротации: 5 файлов по 5 МБ каждый
-    file_handler = RotatingFileHandler(
-        filename=log_file,
-        maxBytes=5*1024*1024,  # 5 MB
-        backupCount=5,
+
+    if log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        # Формат логов: [Время] [Уровень] [Модуль] - Сообщение
+        formatter = logging.Formatter(
+            fmt="[%(asctime)s] [%(levelname)s] [%(name)s] - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
+
+    # Новый файл каждые сутки: bot.log -> bot.log.YYYY-MM-DD
+    file_handler = TimedRotatingFileHandler(
+        filename=logs_dir / "bot.log",
+        when="midnight",
+        backupCount=backup_days,
         encoding="utf-8"
     )
     file_handler.setFormatter(formatter)
-    
+
     # Консольный вывод для DEBUG-режима
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Остаток очереди дописывается при завершении процесса
+    atexit.register(listener.stop)
+
     # Уровень логирования из конфига
-    log_level = getattr(logging, config.log_level.upper(), logging.INFO)
-    
+    log_level = getattr(logging, level.upper(), logging.INFO)
+
     logging.basicConfig(
         level=log_level,
-        handlers=[file_handler, console_handler],
+        handlers=[DeferredQueueHandler(log_queue)],
         force=True  # Перезаписать существующие обработчики
     )
+    return listener
+
+def _sample_stack() -> bool:
+    """Нужно ли сохранять стек для текущей записи"""
+    return _stack_sample_rate > 0 and random.random() < _stack_sample_rate
 
 def log_command(user_id: int, command: str, args: Optional[str] = None) -> None:
     """Логирование команд пользователя"""
@@ -69,7 +136,7 @@ def log_error(error: str, context: Optional[dict] = None) -> None:
         log_message = f"ERROR: {error}"
         if context:
             log_message += f" | Context: {context}"
-        logging.error(log_message, exc_info=True, stack_info=True)
+        logging.error(log_message, exc_info=True, stack_info=_sample_stack())
     except Exception as e:
         logging.critical(f"Error logging failure: {str(e)}", exc_info=True)
 
@@ -79,6 +146,6 @@ def log_critical(event: str, details: Optional[dict] = None) -> None:
         log_message = f"CRITICAL: {event}"
         if details:
             log_message += f" | Details: {details}"
-        logging.critical(log_message, exc_info=True, stack_info=True)
+        logging.critical(log_message, exc_info=True, stack_info=_sample_stack())
     except Exception as e:
         print(f"FATAL LOG FAILURE: {str(e)}")  # Fallback
\ No newline at end of file
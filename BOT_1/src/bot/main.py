@@ -1,78 +1,223 @@
-import os
 import logging
-import asyncio  # Добавлен импорт asyncio
-from telegram import Update  # Добавлен импорт Update
+import asyncio
+import redis.asyncio as aioredis
+from telegram import Update
 from telegram.ext import Application
-from src.bot.config import Config
-from src.bot.database import init_db
+from src.bot.cache import CatalogCache
+from src.bot.config import get_config
+from src.bot.crypto import CryptoProcessor
+from src.bot.database import init_db, close_db
 from src.bot.handlers import register_handlers
+from src.bot.jobs import register_jobs
 from src.bot.logger import setup_logging
-from src.bot.notifications import notify_critical_error
+from src.bot.metrics import start_metrics_server
+from src.bot.notifications import create_notifier, notify_critical_error
+from src.bot.persistence import RedisPersistence
+from src.bot.providers import ProviderPool, build_providers
+from src.bot.throttle import Throttle
+from src.bot.update_stream import run_ingress, run_worker
+from src.bot.vault import KeyVault
 
 # Основные изменения:
-# 1. main() стала асинхронной
-# 2. Добавлен asyncio.run() для запуска
+# 1. main() синхронная: run_polling сам управляет циклом событий
+# 2. Асинхронная инициализация (БД) выполняется в post_init, освобождение ресурсов - в post_shutdown
 # 3. Обработка случая, когда application не определена
-# 4. Исправлен импорт Update
+# 4. Режим webhook (BOT_MODE=webhook) вместо polling для работы за Traefik и нескольких реплик
+# 5. Конфигурация создается один раз (get_config) и передается через bot_data
+# 6. user_data/chat_data хранятся в Redis (RedisPersistence), а не только в памяти процесса
+# 7. STREAM_ROLE=ingress/worker: прием обновлений и их обработка в разных процессах через потоки Redis
 
-async def main():
+def main():
     """Точка входа в приложение"""
-    setup_logging()
+    config = get_config()
+    setup_logging(
+        config.log_level,
+        log_format=config.log_format,
+        stack_sample_rate=config.log_stack_sample_rate,
+        backup_days=config.log_backup_days
+    )
     logging.info("Запуск бота...")
 
     application = None  # Для безопасного использования в блоке except
-    
-    try:
-        config = Config()
-        logging.info("Конфигурация загружена")
-
-        SessionFactory = init_db(config.database_url)
-        logging.info("База данных подключена")
 
+    try:
         # Создание приложения
-        application = Application.builder() \
+        builder = Application.builder() \
             .token(config.bot_token) \
-            .post_init(post_init) \
-            .build()
+            .update_queue(asyncio.Queue(maxsize=config.update_queue_size))
+
+        # Ingress только передает обновления в Redis: без БД, обработчиков и состояния
+        ingress = config.stream_role == "ingress"
+        if not ingress:
+            builder = builder \
+                .concurrent_updates(config.concurrent_updates) \
+                .post_init(post_init) \
+                .post_shutdown(post_shutdown)
+
+        if config.persistence_enabled and not ingress:
+            # Webhook-реплики без потоков получают обновления одного пользователя вперемешку:
+            # локальной копии доверять нельзя, а запись должна уходить быстрее
+            shared = config.bot_mode == "webhook" and config.stream_role == "off"
+            # Отдельный клиент без decode_responses: состояние хранится в бинарном виде
+            builder = builder.persistence(RedisPersistence(
+                aioredis.from_url(str(config.redis_url)),
+                update_interval=min(config.persistence_update_interval, 1.0) if shared
+                else config.persistence_update_interval,
+                local_ttl=0 if shared else config.persistence_local_ttl
+            ))
+
+        if config.telegram_api_url:
+            builder = builder \
+                .base_url(f"{config.telegram_api_url}/bot") \
+                .base_file_url(f"{config.telegram_api_url}/file/bot")
+
+        # В webhook-режиме обновления принимает собственный HTTP-сервер, воркер читает их из Redis:
+        # Updater не нужен
+        if config.bot_mode == "webhook" or config.stream_role == "worker":
+            builder = builder.updater(None)
+
+        application = builder.build()
 
         application.bot_data.update({
-            "session_factory": SessionFactory,
             "config": config
         })
 
+        if config.metrics_port:
+            start_metrics_server(config.metrics_port, attempts=config.metrics_port_attempts)
+
+        if ingress:
+            asyncio.run(run_ingress(application, config))
+            return
+
         register_handlers(application)
         logging.info("Обработчики зарегистрированы")
 
-        # Асинхронный запуск
-        await application.run_polling(
-            drop_pending_updates=True,
-            allowed_updates=Update.ALL_TYPES
-        )
+        register_jobs(application)
+        logging.info("Фоновые задачи запланированы")
+
+        if config.stream_role == "worker":
+            asyncio.run(run_worker(application, config))
+        elif config.bot_mode == "webhook":
+            # tornado нужен только в webhook-режиме
+            from src.bot.webhook import run_webhook
+            asyncio.run(run_webhook(application, config))
+        else:
+            application.run_polling(
+                drop_pending_updates=True,
+                allowed_updates=Update.ALL_TYPES
+            )
 
     except Exception as e:
         logging.critical(f"Критическая ошибка: {str(e)}", exc_info=True)
         if application and application.bot:
-            # Вызов асинхронной функции через задачу
-            asyncio.create_task(notify_critical_error(application.bot, str(e)))
+            asyncio.run(notify_crash(application, config, str(e)))
         raise
 
+async def notify_crash(app: Application, config, error: str) -> None:
+    """Уведомление администраторов о падении вне цикла приложения"""
+    try:
+        async with app.bot:
+            # Диспетчер приложения привязан к завершенному циклу событий
+            notifier = create_notifier(app.bot, config)
+            notify_critical_error(notifier, error)
+            await notifier.close()
+    except Exception as e:
+        logging.error(f"Не удалось отправить уведомление о падении: {str(e)}")
+
 async def post_init(app: Application) -> None:
     """Пост-инициализация приложения"""
-    try:
-        await app.bot.set_my_commands([
+    config = app.bot_data["config"]
+
+    app.bot_data["session_factory"] = await init_db(
+        config.database_url,
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_timeout=config.db_pool_timeout,
+        pool_recycle=config.db_pool_recycle
+    )
+    logging.info("База данных подключена")
+
+    app.bot_data["vault"] = KeyVault(
+        config.encryption_key,
+        config.encryption_old_keys,
+        max_workers=config.crypto_workers
+    )
+
+    pool = ProviderPool(
+        build_providers(config),
+        failure_threshold=config.provider_failure_threshold,
+        open_timeout=config.provider_open_timeout,
+        hedge_percentile=config.provider_hedge_percentile if config.provider_hedging else None,
+        hedge_min_delay=config.provider_hedge_min_delay,
+        retries=config.blockcypher_retries
+    )
+    app.bot_data["crypto"] = CryptoProcessor(
+        pool,
+        vault=app.bot_data["vault"],
+        paid_ttl=config.payment_cache_paid_ttl,
+        unpaid_ttl=config.payment_cache_unpaid_ttl
+    )
+
+    app.bot_data["notifier"] = create_notifier(app.bot, config)
+
+    redis = aioredis.from_url(str(config.redis_url), decode_responses=True)
+    app.bot_data["redis"] = redis
+    app.bot_data["catalog_cache"] = CatalogCache(
+        redis,
+        ttl=config.catalog_cache_ttl,
+        local_ttl=config.catalog_local_ttl
+    )
+    app.bot_data["throttle"] = Throttle(
+        redis,
+        user_rate=config.throttle_user_rate,
+        user_burst=config.throttle_user_burst,
+        action_rate=config.throttle_action_rate,
+        action_burst=config.throttle_action_burst
+    )
+
+    # Запросы к Bot API независимы: выполняются параллельно, чтобы не задерживать старт
+    results = await asyncio.gather(
+        app.bot.set_my_commands([
             ("start", "Главное меню"),
             ("products", "Каталог товаров"),
             ("help", "Помощь по боту")
-        ])
-        logging.info("Команды бота обновлены")
-
-        await app.bot.send_message(
-            chat_id=Config().admin_ids[0],
+        ]),
+        app.bot.send_message(
+            chat_id=config.admin_ids[0],
             text="🟢 Бот успешно запущен!"
-        )
-    except Exception as e:
-        logging.error(f"Ошибка пост-инициализации: {str(e)}")
+        ),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logging.error(f"Ошибка пост-инициализации: {str(result)}")
+
+async def post_shutdown(app: Application) -> None:
+    """Освобождение ресурсов при остановке"""
+    notifier = app.bot_data.get("notifier")
+    if notifier:
+        await notifier.close()
+
+    crypto = app.bot_data.get("crypto")
+    if crypto:
+        await crypto.aclose()
+
+    vault = app.bot_data.get("vault")
+    if vault:
+        vault.close()
+
+    redis = app.bot_data.get("redis")
+    if redis:
+        await redis.aclose()
+
+    # Буфер состояния уже записан в Application.shutdown (persistence.flush)
+    if app.persistence:
+        await app.persistence.aclose()
+
+    session_factory = app.bot_data.get("session_factory")
+    if session_factory:
+        await close_db(session_factory)
+        logging.info("Соединения с базой данных закрыты")
 
 if __name__ == "__main__":
-    # Запуск асинхронного главного метода
-    asyncio.run(main())
\ No newline at end of file
+    main()
@@ -0,0 +1,174 @@
+import functools
+import logging
+import time
+from typing import Optional
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from telegram.ext import ApplicationHandlerStop
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм: от быстрых запросов к БД до таймаутов внешних API, сек
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Время обработки обновления обработчиком",
+    ["handler"], buckets=LATENCY_BUCKETS
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Необработанные исключения в обработчиках", ["handler"]
+)
+HANDLERS_IN_PROGRESS = Gauge(
+    "bot_handlers_in_progress", "Обновления, обрабатываемые в данный момент", ["handler"]
+)
+UPDATE_QUEUE_SIZE = Gauge(
+    "bot_update_queue_size", "Обновления, ожидающие обработки в очереди приложения"
+)
+ORDER_SWEEPER_RESULTS = Counter(
+    "bot_order_sweeper_total",
+    "Итоги очистки брошенных счетов: expired, released, late_paid, unchecked, retired, late_funded",
+    ["result"]
+)
+ORDER_SWEEPER_DURATION = Histogram(
+    "bot_order_sweeper_duration_seconds", "Длительность одного запуска очистки брошенных счетов",
+    buckets=LATENCY_BUCKETS
+)
+THROTTLED_UPDATES = Counter(
+    "bot_throttled_updates_total", "Обновления, отброшенные анти-флудом", ["action"]
+)
+
+DB_QUERY_LATENCY = Histogram(
+    "bot_db_query_duration_seconds", "Время выполнения SQL-запроса",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+DB_ERRORS = Counter(
+    "bot_db_errors_total", "Ошибки выполнения SQL-запросов", ["operation"]
+)
+DB_POOL_SIZE = Gauge("bot_db_pool_size", "Размер пула соединений с БД")
+DB_POOL_CHECKED_OUT = Gauge("bot_db_pool_checked_out", "Соединения, выданные из пула")
+DB_POOL_OVERFLOW = Gauge("bot_db_pool_overflow", "Соединения сверх размера пула")
+
+BLOCKCHAIN_LATENCY = Histogram(
+    "bot_blockchain_request_duration_seconds", "Время запроса к провайдеру блокчейн-данных (одна попытка)",
+    ["provider", "method", "endpoint", "status"], buckets=LATENCY_BUCKETS
+)
+BLOCKCHAIN_ERRORS = Counter(
+    "bot_blockchain_errors_total", "Неуспешные попытки запросов к провайдерам блокчейн-данных",
+    ["provider", "endpoint", "reason"]
+)
+PROVIDER_HEALTH = Gauge(
+    "bot_blockchain_provider_health", "Оценка здоровья провайдера (доля успехов с поправкой на задержку)",
+    ["provider"]
+)
+PROVIDER_CIRCUIT_OPEN = Gauge(
+    "bot_blockchain_provider_circuit_open", "1 - провайдер исключен после ошибок (circuit breaker открыт)",
+    ["provider"]
+)
+HEDGED_REQUESTS = Counter(
+    "bot_blockchain_hedged_requests_total", "Дублирующие запросы при медленном ответе основного провайдера",
+    ["provider"]
+)
+PAYMENT_STATUS_LOOKUPS = Counter(
+    "bot_payment_status_lookups_total",
+    "Проверки статуса адресов: из кэша, через общий запрос или новым запросом к провайдеру",
+    ["source"]
+)
+PERSISTENCE_OPERATIONS = Counter(
+    "bot_persistence_operations_total",
+    "Операции хранилища состояния в Redis: load, check, load_error, write, unchanged, conflict, flush_error",
+    ["operation"]
+)
+STREAM_UPDATES = Counter(
+    "bot_stream_updates_total",
+    "Обновления в потоках Redis: published, publish_error, processed, failed (в updates:dead), "
+    "reclaimed, dropped (аренда шарда потеряна), lease_lost",
+    ["result"]
+)
+STREAM_SHARDS_OWNED = Gauge(
+    "bot_stream_shards_owned", "Шарды потока обновлений, арендованные этим воркером"
+)
+PERSISTENCE_FLUSH_DURATION = Histogram(
+    "bot_persistence_flush_duration_seconds", "Длительность одной пакетной записи состояния в Redis",
+    buckets=LATENCY_BUCKETS
+)
+
+def instrument_callback(name: str, callback):
+    """Оборачивает callback обработчика: латентность, ошибки и число выполняющихся вызовов"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        in_progress = HANDLERS_IN_PROGRESS.labels(name)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            # Штатное прерывание цепочки обработчиков (анти-флуд), а не ошибка
+            raise
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - started)
+            in_progress.dec()
+    return wrapper
+
+def instrument_handlers(application) -> None:
+    """Подключает метрики ко всем зарегистрированным обработчикам приложения"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = instrument_callback(handler.callback.__name__, handler.callback)
+    UPDATE_QUEUE_SIZE.set_function(application.update_queue.qsize)
+
+def _operation(statement: str) -> str:
+    """Тип SQL-запроса для метки (SELECT, INSERT, UPDATE, ...)"""
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подписывается на события движка: время запросов, ошибки и заполненность пула"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_LATENCY.labels(_operation(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        stack = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if stack:
+            stack.pop()
+        DB_ERRORS.labels(_operation(exception_context.statement or "")).inc()
+
+    # Показатели пула читаются в момент сбора метрик; у SQLite пул без этих методов
+    pool = sync_engine.pool
+    if hasattr(pool, "checkedout"):
+        DB_POOL_SIZE.set_function(pool.size)
+        DB_POOL_CHECKED_OUT.set_function(pool.checkedout)
+        DB_POOL_OVERFLOW.set_function(lambda: max(pool.overflow(), 0))
+
+def start_metrics_server(port: int, addr: str = "0.0.0.0", attempts: int = 1) -> Optional[int]:
+    """
+    HTTP-сервер /metrics в отдельном потоке, не зависит от цикла событий бота.
+
+    Несколько процессов на одном хосте (воркеры потоков) занимают порты
+    port, port + 1, ... - до attempts штук. Если свободного порта нет,
+    бот работает без метрик, а не падает при старте.
+
+    Returns:
+        Занятый порт или None
+    """
+    for candidate in range(port, port + max(attempts, 1)):
+        try:
+            start_http_server(candidate, addr)
+        except OSError as e:
+            last_error = e
+            continue
+        logger.info(f"Метрики Prometheus доступны на {addr}:{candidate}/metrics")
+        return candidate
+    logger.error(f"Метрики не публикуются: порты {port}-{port + max(attempts, 1) - 1} заняты ({str(last_error)})")
+    return None
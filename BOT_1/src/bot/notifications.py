@@ -1,40 +1,248 @@
 from telegram import Bot
+from telegram.error import RetryAfter, TimedOut, NetworkError
 from src.bot.config import Config
+from collections import deque
+from typing import Dict, List, Optional
+import asyncio
 import logging
+import time
 
-config = Config()
 logger = logging.getLogger(__name__)
 
-async def notify_admins(bot: Bot, message: str) -> None:
+# Заголовки сводок для событий, которые объединяются при всплеске
+DIGEST_TITLES = {
+    "new_order": "🛒 Новые заказы",
+    "payment_received": "✅ Полученные оплаты",
+}
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не более capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class NotificationDispatcher:
     """
-    Отправляет уведомление всем администраторам из списка.
-    
-    Args:
-        bot: Объект бота Telegram
-        message: Текст уведомления
+    Рассылка уведомлений администраторам.
+
+    Уведомления ставятся в ограниченную очередь и отправляются фоновой задачей:
+    вызывающий код (обработчики, наблюдатель оплат) не ждет ограничителей
+    частоты. При переполнении очереди новые уведомления отбрасываются.
+    Сообщения уходят параллельно, под общим и per-chat ограничителями частоты,
+    с повтором после RetryAfter (429). Если частота событий одного типа превышает
+    порог, они накапливаются и отправляются периодической сводкой.
     """
-    try:
-        if not config.admin_ids:
-            logger.error("Список администраторов пуст")
+
+    def __init__(
+        self,
+        bot: Bot,
+        admin_ids: List[int],
+        global_rate: float = 25.0,
+        per_chat_rate: float = 1.0,
+        per_chat_burst: int = 3,
+        max_retries: int = 3,
+        digest_threshold: int = 10,
+        digest_window: float = 60.0,
+        digest_interval: float = 60.0,
+        queue_size: int = 1000,
+        close_timeout: float = 10.0
+    ):
+        self.bot = bot
+        self.admin_ids = admin_ids
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.digest_threshold = digest_threshold
+        self.digest_window = digest_window
+        self.digest_interval = digest_interval
+        self.queue_size = queue_size
+        self.close_timeout = close_timeout
+
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._events: Dict[str, deque] = {}
+        self._digests: Dict[str, List[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # Очередь и задача создаются при первом уведомлении - в цикле событий, где они будут жить
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._dropped = 0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    async def send(self, chat_id: int, text: str, parse_mode: Optional[str] = None) -> bool:
+        """Отправка одного сообщения с соблюдением лимитов и повтором при flood-wait"""
+        for attempt in range(self.max_retries + 1):
+            await self._chat_bucket(chat_id).acquire()
+            await self._global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return True
+            except RetryAfter as e:
+                delay = float(e.retry_after)
+            except (TimedOut, NetworkError) as e:
+                delay = 2 ** attempt
+                logger.warning(f"Сбой отправки в чат {chat_id}: {str(e)}")
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомления в чат {chat_id}: {str(e)}")
+                return False
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+
+        logger.error(f"Уведомление в чат {chat_id} не доставлено после {self.max_retries} повторов")
+        return False
+
+    async def broadcast(self, text: str, parse_mode: Optional[str] = "Markdown") -> int:
+        """Параллельная отправка всем администраторам; возвращает число доставленных"""
+        results = await asyncio.gather(
+            *(self.send(admin_id, text, parse_mode) for admin_id in self.admin_ids)
+        )
+        return sum(results)
+
+    def post(self, message: str) -> bool:
+        """
+        Ставит уведомление всем администраторам в очередь, не дожидаясь отправки.
+
+        Returns:
+            False, если очередь переполнена и уведомление отброшено
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._deliver())
+
+        try:
+            self._queue.put_nowait(f"🔔 **Уведомление**\n{message}")
+        except asyncio.QueueFull:
+            if not self._dropped:
+                logger.warning(f"Очередь уведомлений переполнена ({self.queue_size}), новые уведомления отбрасываются")
+            self._dropped += 1
+            return False
+
+        if self._dropped:
+            logger.warning(f"Отброшено уведомлений при переполнении очереди: {self._dropped}")
+            self._dropped = 0
+        return True
+
+    async def _deliver(self) -> None:
+        """Фоновая отправка уведомлений из очереди"""
+        while True:
+            text = await self._queue.get()
+            try:
+                delivered = await self.broadcast(text)
+                logger.info(f"Уведомления отправлены администраторам: {delivered}/{len(self.admin_ids)}")
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомления: {str(e)}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def event(self, kind: str, message: str, summary: str) -> None:
+        """
+        Уведомление о событии с объединением всплесков.
+
+        Args:
+            kind: Тип события (ключ DIGEST_TITLES)
+            message: Полный текст для одиночной отправки
+            summary: Строка для сводки
+        """
+        now = time.monotonic()
+        events = self._events.setdefault(kind, deque())
+        events.append(now)
+        while events and events[0] < now - self.digest_window:
+            events.popleft()
+
+        if len(events) <= self.digest_threshold and not self._digests.get(kind):
+            notify_admins(self, message)
             return
 
-        for admin_id in config.admin_ids:
-            await bot.send_message(
-                chat_id=admin_id,
-                text=f"🔔 **Уведомление**\n{message}",
-                parse_mode="Markdown"
-            )
-        logger.info("Уведомления отправлены администраторам")
+        self._digests.setdefault(kind, []).append(summary)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.digest_interval)
+        self.flush()
+
+    def flush(self) -> None:
+        """Ставит в очередь накопленные сводки"""
+        digests, self._digests = self._digests, {}
+        for kind, lines in digests.items():
+            if not lines:
+                continue
+            shown = lines[:20]
+            text = f"{DIGEST_TITLES.get(kind, kind)}: {len(lines)}\n" + "\n".join(shown)
+            if len(lines) > len(shown):
+                text += f"\n… и еще {len(lines) - len(shown)}"
+            notify_admins(self, text)
+
+    async def close(self) -> None:
+        """Досылает сводки и очередь при остановке (не дольше close_timeout)"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        self.flush()
 
-    except Exception as e:
-        logger.error(f"Ошибка отправки уведомления: {str(e)}", exc_info=True)
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), self.close_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Не отправлено уведомлений при остановке: {self._queue.qsize()}")
+        self._worker.cancel()
+
+def create_notifier(bot: Bot, settings: Config) -> NotificationDispatcher:
+    """Создает диспетчер уведомлений с параметрами из конфигурации (хранится в bot_data["notifier"])"""
+    return NotificationDispatcher(
+        bot,
+        settings.admin_ids,
+        global_rate=settings.notify_global_rate,
+        per_chat_rate=settings.notify_per_chat_rate,
+        per_chat_burst=settings.notify_per_chat_burst,
+        max_retries=settings.notify_max_retries,
+        digest_threshold=settings.notify_digest_threshold,
+        digest_window=settings.notify_digest_window,
+        digest_interval=settings.notify_digest_interval,
+        queue_size=settings.notify_queue_size
+    )
 
-async def notify_new_order(bot: Bot, order_id: int, amount: float, currency: str) -> None:
+def notify_admins(notifier: NotificationDispatcher, message: str) -> None:
+    """
+    Ставит в очередь уведомление всем администраторам из списка.
+
+    Args:
+        notifier: Диспетчер уведомлений (bot_data["notifier"])
+        message: Текст уведомления
+    """
+    if not notifier.admin_ids:
+        logger.error("Список администраторов пуст")
+        return
+    notifier.post(message)
+
+def notify_new_order(notifier: NotificationDispatcher, order_id: int, amount: float, currency: str) -> None:
     """
     Уведомление о новом заказе.
-    
+
     Args:
-        bot: Объект бота Telegram
+        notifier: Диспетчер уведомлений (bot_data["notifier"])
         order_id: ID заказа
         amount: Сумма оплаты
         currency: Валюта (BTC/LTC)
@@ -44,34 +252,37 @@ async def notify_new_order(bot: Bot, order_id: int, amount: float, currency: str
         f"• Номер: `#{order_id}`\n"
         f"• Сумма: `{amount} {currency}`"
     )
-    await notify_admins(bot, message)
+    notifier.event("new_order", message, f"• `#{order_id}` — `{amount} {currency}`")
 
-async def notify_payment_received(bot: Bot, order_id: int, tx_hash: str) -> None:
+def notify_payment_received(notifier: NotificationDispatcher, order_id: int, amount: float, currency: str, address: str) -> None:
     """
     Уведомление об успешной оплате.
-    
+
     Args:
-        bot: Объект бота Telegram
+        notifier: Диспетчер уведомлений (bot_data["notifier"])
         order_id: ID заказа
-        tx_hash: Хеш транзакции
+        amount: Сумма оплаты
+        currency: Валюта (BTC/LTC)
+        address: Адрес, на который поступила оплата
     """
     message = (
         f"✅ Оплата получена!\n"
         f"• Заказ: `#{order_id}`\n"
-        f"• Транзакция: `{tx_hash}`"
+        f"• Сумма: `{amount} {currency}`\n"
+        f"• Адрес: `{address}`"
     )
-    await notify_admins(bot, message)
+    notifier.event("payment_received", message, f"• `#{order_id}` — `{amount} {currency}`")
 
-async def notify_critical_error(bot: Bot, error: str) -> None:
+def notify_critical_error(notifier: NotificationDispatcher, error: str) -> None:
     """
     Уведомление о критической ошибке.
-    
+
     Args:
-        bot: Объект бота Telegram
+        notifier: Диспетчер уведомлений (bot_data["notifier"])
         error: Текст ошибки
     """
     message = (
         f"🚨 **Критическая ошибка**\n"
         f"```\n{error}\n```"
     )
-    await notify_admins(bot, message)
\ No newline at end of file
+    notify_admins(notifier, message)
@@ -0,0 +1,147 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import select, update, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.bot.database import Product, Transaction
+from src.bot.reservations import commit_reservation
+from src.bot.stats import record_transition
+
+logger = logging.getLogger(__name__)
+
+# Формат времени в курсоре истории заказов (callback_data ограничена 64 байтами)
+CURSOR_TIME_FORMAT = "%Y%m%d%H%M%S%f"
+
+def hot_since(days: int) -> datetime:
+    """Нижняя граница рабочего окна заказов: более старые секции запросы по умолчанию не читают"""
+    return datetime.utcnow() - timedelta(days=days)
+
+def encode_cursor(created_at: datetime, transaction_id: int) -> str:
+    """Курсор истории заказов: позиция последнего показанного заказа"""
+    return f"{created_at.strftime(CURSOR_TIME_FORMAT)}-{transaction_id}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Разбор курсора из callback_data"""
+    created_at, transaction_id = cursor.split("-")
+    return datetime.strptime(created_at, CURSOR_TIME_FORMAT), int(transaction_id)
+
+async def load_order_history(
+    session: AsyncSession,
+    limit: int,
+    cursor: Optional[str] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None
+) -> Tuple[List[Transaction], Optional[str]]:
+    """
+    Страница истории заказов от новых к старым (keyset-пагинация).
+
+    Следующая страница начинается строго после пары (created_at, id) из курсора,
+    поэтому запрос читает из индекса только limit + 1 строк независимо от глубины
+    листания. Использует индексы (user_id, created_at DESC, id DESC) и
+    (created_at DESC, id DESC).
+
+    Args:
+        session: Асинхронная сессия БД
+        limit: Количество заказов на странице
+        cursor: Курсор предыдущей страницы (None - самые новые заказы)
+        user_id: Только заказы пользователя (None - все заказы)
+        since: Не старше этого момента (отсекает старые секции таблицы)
+
+    Returns:
+        Заказы страницы и курсор следующей страницы (None, если она последняя)
+    """
+    query = select(Transaction)
+    if user_id is not None:
+        query = query.where(Transaction.user_id == user_id)
+    if since is not None:
+        query = query.where(Transaction.created_at >= since)
+    if cursor:
+        created_at, transaction_id = decode_cursor(cursor)
+        query = query.where(tuple_(Transaction.created_at, Transaction.id) < tuple_(created_at, transaction_id))
+
+    result = await session.execute(
+        query.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit + 1)
+    )
+    orders = result.scalars().all()
+    if len(orders) <= limit:
+        return orders, None
+
+    orders = orders[:limit]
+    return orders, encode_cursor(orders[-1].created_at, orders[-1].id)
+
+async def complete_transaction(session: AsyncSession, transaction_id: int, created_at: datetime) -> bool:
+    """
+    Переводит транзакцию из pending в completed и подтверждает резерв товара.
+
+    Обновление условное, поэтому при гонке нескольких экземпляров бота
+    транзакция будет завершена ровно один раз (и один раз учтена в статистике).
+    Коммит выполняет вызывающий код.
+
+    Args:
+        session: Асинхронная сессия БД
+        transaction_id: ID транзакции
+        created_at: Время создания транзакции - вторая часть первичного ключа;
+            по нему PostgreSQL обновляет одну секцию вместо перебора всех
+
+    Returns:
+        True, если статус изменен этим вызовом
+    """
+    result = await session.execute(
+        update(Transaction)
+        .where(
+            Transaction.id == transaction_id,
+            Transaction.created_at == created_at,
+            Transaction.status == 'pending'
+        )
+        .values(status='completed')
+        .returning(Transaction.product_id, Transaction.amount, Transaction.currency, Transaction.created_at)
+    )
+    row = result.first()
+    if row is None:
+        return False
+
+    await record_transition(session, 'pending', 'completed', row.amount, row.currency, row.created_at)
+
+    # Товар списан при создании счета, остается подтвердить резерв
+    if await commit_reservation(session, transaction_id):
+        return True
+
+    # Резерв истек до оплаты: списываем заново, если товар еще есть
+    result = await session.execute(
+        update(Product)
+        .where(Product.id == row.product_id, Product.stock > 0)
+        .values(stock=Product.stock - 1)
+        .returning(Product.id)
+    )
+    if result.first() is None:
+        logger.critical(f"Оплачен заказ #{transaction_id}, но товар #{row.product_id} закончился")
+    return True
+
+async def refund_order(session: AsyncSession, transaction_id: int, created_at: datetime) -> bool:
+    """
+    Переводит оплаченную транзакцию в refunded и вычитает ее из статистики продаж.
+
+    Args:
+        session: Асинхронная сессия БД
+        transaction_id: ID транзакции
+        created_at: Время создания транзакции (ограничивает обновление одной секцией)
+
+    Returns:
+        True, если статус изменен этим вызовом
+    """
+    result = await session.execute(
+        update(Transaction)
+        .where(
+            Transaction.id == transaction_id,
+            Transaction.created_at == created_at,
+            Transaction.status == 'completed'
+        )
+        .values(status='refunded')
+        .returning(Transaction.amount, Transaction.currency, Transaction.created_at)
+    )
+    row = result.first()
+    if row is None:
+        return False
+
+    await record_transition(session, 'completed', 'refunded', row.amount, row.currency, row.created_at)
+    return True
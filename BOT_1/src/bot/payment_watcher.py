@@ -0,0 +1,125 @@
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from telegram.ext import ContextTypes
+from src.bot.database import Product, Transaction
+from src.bot.notifications import notify_payment_received
+from src.bot.orders import complete_transaction, hot_since
+
+logger = logging.getLogger(__name__)
+
+async def watch_pending_payments(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Фоновая проверка ожидающих оплаты транзакций.
+
+    Адреса проверяются пакетными запросами по валютам. Проверка идет через кэш
+    статусов CryptoProcessor, общий с кнопкой "✅ Я оплатил": адрес, недавно
+    проверенный по нажатию, повторно не запрашивается.
+    """
+    Session = context.bot_data['session_factory']
+    crypto = context.bot_data['crypto']
+    config = context.bot_data['config']
+
+    async with Session() as session:
+        result = await session.execute(
+            select(Transaction.id, Transaction.crypto_address, Transaction.currency, Transaction.created_at)
+            .where(
+                Transaction.status == 'pending',
+                Transaction.created_at >= hot_since(config.transactions_hot_days)
+            )
+            .order_by(Transaction.id.desc())
+            .limit(config.payment_watch_limit)
+        )
+        pending = result.all()
+
+    if not pending:
+        return
+
+    paid = await check_orders(crypto, pending, config.payment_watch_batch_size)
+    completed = await confirm_payments(context, [(row.id, row.created_at) for row in pending if paid.get(row.id)])
+    if completed:
+        logger.info(f"Проверено {len(pending)} ожидающих транзакций, оплачено: {completed}")
+
+async def check_orders(crypto, rows, batch_size: int) -> Dict[int, Optional[bool]]:
+    """
+    Статус оплаты заказов (строки с id, crypto_address, currency) пакетными запросами по валютам.
+
+    Returns:
+        {id заказа: оплачен}; None - проверить не удалось, у заказа без адреса - False
+    """
+    by_currency = defaultdict(list)
+    paid = {}
+    for row in rows:
+        if row.crypto_address and row.currency:
+            by_currency[row.currency].append(row)
+        else:
+            paid[row.id] = False
+
+    for currency, group in by_currency.items():
+        balances = await crypto.check_payments(
+            [row.crypto_address for row in group],
+            currency.lower(),
+            batch_size=batch_size
+        )
+        paid.update((row.id, balances.get(row.crypto_address)) for row in group)
+    return paid
+
+async def confirm_payments(context: ContextTypes.DEFAULT_TYPE, paid: List[Tuple[int, datetime]]) -> int:
+    """
+    Завершает оплаченные заказы и уведомляет покупателей; возвращает число завершенных.
+
+    Заказы передаются парами (id, created_at): время создания ограничивает
+    запросы секциями, в которых лежат заказы.
+    """
+    if not paid:
+        return 0
+
+    Session = context.bot_data['session_factory']
+    completed = []
+    orders = []
+    async with Session() as session:
+        for transaction_id, created_at in paid:
+            if await complete_transaction(session, transaction_id, created_at):
+                completed.append(transaction_id)
+        await session.commit()
+
+        if completed:
+            # Остатки изменились - каталог нужно перерисовать
+            await context.bot_data['catalog_cache'].invalidate()
+
+            result = await session.execute(
+                select(Transaction, Product.name)
+                .join(Product, Product.id == Transaction.product_id, isouter=True)
+                .where(
+                    Transaction.id.in_(completed),
+                    Transaction.created_at >= min(created_at for _, created_at in paid)
+                )
+            )
+            orders = result.all()
+
+    for transaction, product_name in orders:
+        await notify_buyer(context, transaction, product_name)
+    return len(completed)
+
+async def notify_buyer(context: ContextTypes.DEFAULT_TYPE, transaction: Transaction, product_name: str) -> None:
+    """Уведомляет покупателя и ставит в очередь уведомление администраторам о подтвержденной оплате"""
+    try:
+        await context.bot.send_message(
+            chat_id=transaction.user_id,
+            text=(
+                f"✅ Платеж по заказу #{transaction.id} ({product_name}) подтвержден!\n"
+                "📦 Ваш товар будет отправлен в течение 24 часов"
+            )
+        )
+    except Exception as e:
+        logger.error(f"Не удалось уведомить покупателя {transaction.user_id}: {str(e)}")
+
+    notify_payment_received(
+        context.bot_data['notifier'],
+        transaction.id,
+        transaction.amount,
+        transaction.currency,
+        transaction.crypto_address
+    )
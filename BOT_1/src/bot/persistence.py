@@ -0,0 +1,380 @@
+import asyncio
+import hashlib
+import json
+import logging
+import pickle
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from telegram.ext import BasePersistence, PersistenceInput
+from src.bot.metrics import PERSISTENCE_FLUSH_DURATION, PERSISTENCE_OPERATIONS
+
+logger = logging.getLogger(__name__)
+
+# Ключ состояния: (hash в Redis, поле)
+StateKey = Tuple[str, str]
+
+# Результаты загрузки: Redis недоступен; версия в Redis совпала с локальной копией
+FAILED = object()
+UNCHANGED = object()
+
+# Условная запись данных пользователя или чата: только если версия в Redis та же,
+# с которой была прочитана локальная копия (ARGV[2] пустой - без проверки).
+# Возвращает новую версию или -1, если данные в Redis изменил другой процесс
+WRITE_IF_VERSION_LUA = """
+local current = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+if ARGV[2] ~= '' and current ~= tonumber(ARGV[2]) then
+    return -1
+end
+if ARGV[3] == 'del' then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[4])
+end
+return redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+"""
+
+def fingerprint(blob: Optional[bytes]) -> Optional[bytes]:
+    """Отпечаток сериализованных данных для отбрасывания неизмененных записей"""
+    return hashlib.blake2b(blob, digest_size=16).digest() if blob is not None else None
+
+class RedisPersistence(BasePersistence):
+    """
+    user_data, chat_data и состояния диалогов в Redis, общие для всех реплик.
+
+    Запись отложенная: PTB раз в update_interval передает данные, затронутые
+    обновлениями; неизмененные (по отпечатку) отбрасываются, остальные
+    копятся в буфере и уходят в Redis одним конвейером. Чтение ленивое: данные
+    пользователя или чата загружаются при первом обновлении от него (запросы
+    одновременных обновлений объединяются).
+
+    У данных пользователя и чата есть версия (hash <имя>:version), которая
+    растет при каждой записи. Локальная копия используется без обращения к
+    Redis не дольше local_ttl с последнего обновления, дальше при каждом
+    обновлении сверяется версия, а данные перечитываются, только если их
+    записал другой процесс. Запись условная (WRITE_IF_VERSION_LUA): изменение,
+    сделанное по устаревшей копии, не затирает более новые данные - оно
+    отбрасывается, а копия перечитывается. Когда обновления одного
+    пользователя приходят в разные процессы (webhook-реплики без потоков
+    Redis), local_ttl должен быть 0.
+
+    bot_data не сохраняется: в нем лежат конфигурация и объекты сервисов,
+    создаваемые в post_init. Данные сериализуются pickle: загрузка из Redis
+    выполняет произвольный код, поэтому Redis должен быть доверенным
+    внутренним сервисом, недоступным извне (запись в него равна выполнению
+    кода в боте).
+    """
+
+    PREFIX = "state"
+    USER_DATA = f"{PREFIX}:user_data"
+    CHAT_DATA = f"{PREFIX}:chat_data"
+
+    def __init__(
+        self,
+        redis: Redis,
+        update_interval: float = 10.0,
+        local_ttl: float = 300.0,
+        flush_batch: int = 1000
+    ):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.redis = redis
+        self.local_ttl = local_ttl
+        self.flush_batch = flush_batch
+
+        self._seen: Dict[StateKey, float] = {}
+        self._versions: Dict[StateKey, int] = {}
+        self._digests: Dict[StateKey, Optional[bytes]] = {}
+        self._dirty: Dict[StateKey, Tuple[Optional[bytes], Optional[bytes]]] = {}
+        self._flushing: set = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+        self._inflight: Dict[StateKey, asyncio.Future] = {}
+        self._load_queue: List[StateKey] = []
+        self._check_queue: List[StateKey] = []
+        self._load_task: Optional[asyncio.Task] = None
+        self._prefetched: Dict[StateKey, Tuple[Optional[bytes], int]] = {}
+
+        self._write_if_version = redis.register_script(WRITE_IF_VERSION_LUA)
+
+    @staticmethod
+    def version_key(name: str) -> str:
+        return f"{name}:version"
+
+    # Загрузка
+
+    async def get_user_data(self) -> dict:
+        # Пользователи загружаются по одному при первом обновлении (refresh_user_data)
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        name = f"{self.PREFIX}:conversations:{name}"
+        states = await self.redis.hgetall(name)
+        conversations = {}
+        for field, blob in states.items():
+            field = field.decode()
+            self._digests[(name, field)] = fingerprint(blob)
+            conversations[tuple(json.loads(field))] = pickle.loads(blob)
+        return conversations
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh((self.USER_DATA, str(user_id)), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        # В личном чате id совпадает с id пользователя: его данные загружаются тем же запросом
+        prefetch = (self.USER_DATA, str(chat_id)) if chat_id > 0 else None
+        await self._refresh((self.CHAT_DATA, str(chat_id)), chat_data, prefetch)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def _refresh(self, key: StateKey, data: dict, prefetch: Optional[StateKey] = None) -> None:
+        """Загружает данные из Redis при первом обращении, дальше - если их изменил другой процесс"""
+        if key in self._inflight:
+            await self._inflight[key]
+            return
+
+        now = time.monotonic()
+        seen = self._seen.get(key)
+        self._seen[key] = now
+        if seen is not None and now - seen < self.local_ttl:
+            return
+        # Незаписанные локальные изменения новее, чем данные в Redis
+        if key in self._dirty or key in self._flushing:
+            return
+
+        if key in self._prefetched:
+            blob, version = self._prefetched.pop(key)
+            self._versions[key] = version
+        else:
+            if prefetch and (prefetch in self._seen or prefetch in self._inflight):
+                prefetch = None
+            # Локальная копия уже есть: сначала сверяется только версия
+            check = seen is not None and key in self._versions
+            future = self._load(key, prefetch, check)
+            try:
+                result = await future
+            finally:
+                self._inflight.pop(key, None)
+            if result is UNCHANGED:
+                return
+            if result is FAILED:
+                # Повторим при следующем обновлении, пока работаем с данными в памяти
+                if seen is None:
+                    self._seen.pop(key, None)
+                return
+            blob, _ = result
+
+        loaded = pickle.loads(blob) if blob is not None else {}
+        if seen is None:
+            # Первая загрузка: данные, уже появившиеся в памяти процесса, не затираются
+            for name, value in loaded.items():
+                data.setdefault(name, value)
+        else:
+            data.clear()
+            data.update(loaded)
+
+    def _load(self, key: StateKey, prefetch: Optional[StateKey], check: bool) -> asyncio.Future:
+        """Ставит ключ в общую пачку загрузки; пачка уходит в Redis одним конвейером"""
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        (self._check_queue if check else self._load_queue).append(key)
+        if prefetch:
+            self._load_queue.append(prefetch)
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self._load_batch())
+        return future
+
+    async def _hmget(self, keys: List[StateKey], versions_only: bool = False) -> Dict[StateKey, object]:
+        """Данные и версии ключей одним конвейером: {ключ: (данные, версия) или версия}"""
+        fields = defaultdict(list)
+        for name, field in keys:
+            fields[name].append(field)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for name, names in fields.items():
+                pipe.hmget(self.version_key(name), names)
+                if not versions_only:
+                    pipe.hmget(name, names)
+            results = iter(await pipe.execute())
+
+        values = {}
+        for name, names in fields.items():
+            versions = [int(version or 0) for version in next(results)]
+            blobs = next(results) if not versions_only else versions
+            for field, version, blob in zip(names, versions, blobs):
+                values[(name, field)] = version if versions_only else (blob, version)
+        return values
+
+    async def _load_batch(self) -> None:
+        # Один проход цикла событий: собираем ключи обновлений, пришедших одновременно
+        await asyncio.sleep(0)
+        loads, self._load_queue = list(dict.fromkeys(self._load_queue)), []
+        checks, self._check_queue = [key for key in dict.fromkeys(self._check_queue) if key not in loads], []
+        self._load_task = None
+
+        values = {}
+        try:
+            if checks:
+                versions = await self._hmget(checks, versions_only=True)
+                changed = [key for key in checks if versions[key] != self._versions.get(key)]
+                values.update({key: UNCHANGED for key in checks if key not in changed})
+                loads.extend(changed)
+                PERSISTENCE_OPERATIONS.labels("check").inc(len(checks))
+            if loads:
+                values.update(await self._hmget(loads))
+                PERSISTENCE_OPERATIONS.labels("load").inc(len(loads))
+        except RedisError as e:
+            PERSISTENCE_OPERATIONS.labels("load_error").inc(len(loads) + len(checks))
+            logger.warning(f"Не удалось загрузить состояние из Redis: {str(e)}")
+
+        for key in list(dict.fromkeys(loads + checks)):
+            result = values.get(key, FAILED)
+            if isinstance(result, tuple) and key not in self._dirty and key not in self._flushing:
+                self._digests[key] = fingerprint(result[0])
+                self._versions[key] = result[1]
+            future = self._inflight.get(key)
+            if future is not None and not future.done():
+                future.set_result(result)
+            elif isinstance(result, tuple) and key not in self._seen:
+                self._prefetched[key] = result
+
+    # Запись
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._write((self.USER_DATA, str(user_id)), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._write((self.CHAT_DATA, str(chat_id)), data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        self._write((f"{self.PREFIX}:conversations:{name}", json.dumps(list(key))), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._write((self.USER_DATA, str(user_id)), None)
+        self._seen.pop((self.USER_DATA, str(user_id)), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._write((self.CHAT_DATA, str(chat_id)), None)
+        self._seen.pop((self.CHAT_DATA, str(chat_id)), None)
+
+    def _write(self, key: StateKey, value: Optional[object]) -> None:
+        """Буферизует запись; пустые данные хранятся как отсутствие поля"""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) if value not in (None, {}) else None
+        digest = fingerprint(blob)
+        if key in self._digests and self._digests[key] == digest:
+            # Совпадает с тем, что уже лежит в Redis (или записывается сейчас)
+            self._dirty.pop(key, None)
+            PERSISTENCE_OPERATIONS.labels("unchanged").inc()
+        else:
+            self._dirty[key] = (blob, digest)
+        if self._dirty and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self) -> None:
+        # PTB передает данные через gather: запись начинается, когда буферизованы все
+        await asyncio.sleep(0)
+        self._flush_task = None
+        await self._flush()
+
+    async def _flush(self) -> None:
+        """Записывает буфер одним конвейером; при ошибке записи возвращаются в буфер"""
+        async with self._flush_lock:
+            if self._dirty:
+                await self._flush_pending()
+
+    async def _flush_pending(self) -> None:
+        pending, self._dirty = self._dirty, {}
+        # Отпечатки обновляются сразу, чтобы повтор записываемого значения не дублировался
+        previous = {key: self._digests.get(key) for key in pending}
+        self._digests.update({key: digest for key, (_, digest) in pending.items()})
+        self._flushing.update(pending)
+
+        # Данные пользователей и чатов пишутся условно по версии, состояния диалогов - как есть
+        versioned = [key for key in pending if key[0] in (self.USER_DATA, self.CHAT_DATA)]
+        stores, deletes = defaultdict(list), defaultdict(list)
+        for (name, field), (blob, _) in pending.items():
+            if (name, field) in versioned:
+                continue
+            if blob is None:
+                deletes[name].append(field)
+            else:
+                stores[name].append((field, blob))
+
+        started = time.perf_counter()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in versioned:
+                    (name, field), (blob, _) = key, pending[key]
+                    expected = self._versions.get(key)
+                    await self._write_if_version(
+                        keys=[name, self.version_key(name)],
+                        args=[field, "" if expected is None else expected,
+                              "del" if blob is None else "set", blob or b""],
+                        client=pipe
+                    )
+                for name, items in stores.items():
+                    for i in range(0, len(items), self.flush_batch):
+                        pipe.hset(name, mapping=dict(items[i:i + self.flush_batch]))
+                for name, names in deletes.items():
+                    for i in range(0, len(names), self.flush_batch):
+                        pipe.hdel(name, *names[i:i + self.flush_batch])
+                results = await pipe.execute()
+        except RedisError as e:
+            self._digests.update(previous)
+            # Более новые изменения, пришедшие во время записи, не затираются
+            for key, item in pending.items():
+                self._dirty.setdefault(key, item)
+            PERSISTENCE_OPERATIONS.labels("flush_error").inc()
+            logger.warning(f"Не удалось записать состояние в Redis ({len(pending)} записей): {str(e)}")
+        else:
+            conflicts = 0
+            for key, version in zip(versioned, results):
+                if version == -1:
+                    # Данные изменил другой процесс: запись по устаревшей копии отбрасывается,
+                    # при следующем обновлении копия перечитывается целиком
+                    conflicts += 1
+                    self._versions.pop(key, None)
+                    self._digests.pop(key, None)
+                    self._dirty.pop(key, None)
+                    self._seen[key] = float("-inf")
+                else:
+                    self._versions[key] = version
+            if conflicts:
+                PERSISTENCE_OPERATIONS.labels("conflict").inc(conflicts)
+                logger.warning(f"Отброшено {conflicts} записей состояния: данные в Redis изменены другим процессом")
+            PERSISTENCE_OPERATIONS.labels("write").inc(len(pending) - conflicts)
+        finally:
+            self._flushing.difference_update(pending)
+            PERSISTENCE_FLUSH_DURATION.observe(time.perf_counter() - started)
+
+    async def flush(self) -> None:
+        """Вызывается PTB при остановке: записывает все, что осталось в буфере"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._flush()
+        if self._dirty:
+            logger.error(f"При остановке не записано в Redis {len(self._dirty)} записей состояния")
+
+    async def aclose(self) -> None:
+        await self.redis.aclose()
@@ -0,0 +1,418 @@
+import asyncio
+import logging
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+import httpx
+from src.bot.metrics import (
+    BLOCKCHAIN_ERRORS, BLOCKCHAIN_LATENCY, HEDGED_REQUESTS, PROVIDER_CIRCUIT_OPEN, PROVIDER_HEALTH
+)
+
+logger = logging.getLogger(__name__)
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class ProviderError(Exception):
+    """Ошибка обращения к провайдеру блокчейн-данных"""
+
+class ProviderUnavailable(ProviderError):
+    """Временный отказ провайдера (сеть, 429, 5xx): запрос имеет смысл повторить"""
+
+class BlockchainProvider(ABC):
+    """
+    Источник блокчейн-данных: балансы адресов и, если поддерживается, генерация адреса.
+
+    Провайдер выполняет одну попытку запроса и бросает ProviderError при любой
+    неудаче (ProviderUnavailable - при временной); переключение, хеджирование
+    и повторы выполняет ProviderPool.
+    """
+
+    name: str = "provider"
+    can_generate: bool = False
+    currencies = frozenset({"btc", "ltc"})
+
+    @abstractmethod
+    async def get_balances(self, addresses: List[str], currency: str, timeout: Optional[float] = None) -> Dict[str, bool]:
+        """Наличие средств на адресах: {адрес: оплачен}"""
+
+    async def generate_address(self, currency: str, timeout: Optional[float] = None) -> dict:
+        """Новый адрес: {'address': ..., 'private': ...} (приватный ключ в открытом виде)"""
+        raise ProviderError(f"{self.name} не генерирует адреса")
+
+    async def aclose(self) -> None:
+        pass
+
+class HttpProvider(BlockchainProvider):
+    """
+    HTTP-провайдер: keep-alive пул и ограничение конкурентности.
+
+    Собственные повторы (retries) по умолчанию выключены: в ProviderPool
+    неудачная попытка сразу передается следующему провайдеру, а повторяет
+    запрос пул.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        params: Optional[dict] = None,
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        max_concurrency: int = 10,
+        retries: int = 0,
+        backoff: float = 0.5
+    ):
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+
+        # Ограничение одновременных запросов, чтобы всплеск заказов не выбил квоту API
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            params=params,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    async def _request(self, method: str, path: str, endpoint: str, timeout: Optional[float] = None) -> httpx.Response:
+        """Выполняет запрос с ограничением конкурентности и повторами с экспоненциальной задержкой"""
+        request_timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        error = None
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    # Время считается без ожидания семафора: очередь видна отдельно по латентности обработчиков
+                    started = time.perf_counter()
+                    response = await self._client.request(method, path, timeout=request_timeout)
+                BLOCKCHAIN_LATENCY.labels(self.name, method, endpoint, response.status_code) \
+                    .observe(time.perf_counter() - started)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                error = f"HTTP {response.status_code}"
+                BLOCKCHAIN_ERRORS.labels(self.name, endpoint, response.status_code).inc()
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+                BLOCKCHAIN_ERRORS.labels(self.name, endpoint, type(e).__name__).inc()
+
+            if attempt < self.retries:
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                logger.warning(f"{self.name} {method} {endpoint}: {error}, повтор через {delay:.2f} с")
+                await asyncio.sleep(delay)
+
+        raise ProviderUnavailable(f"{self.name} API unavailable: {error}")
+
+    async def aclose(self) -> None:
+        """Закрывает пул HTTP-соединений"""
+        await self._client.aclose()
+
+class BlockCypherProvider(HttpProvider):
+    """BlockCypher API (или совместимый прокси/заглушка): балансы пакетами и генерация адресов"""
+
+    can_generate = True
+
+    def __init__(self, api_key: Optional[str], base_url: str = "https://api.blockcypher.com", name: str = "blockcypher", **kwargs):
+        super().__init__(name, base_url, params={'token': api_key} if api_key else None, **kwargs)
+
+    async def generate_address(self, currency: str, timeout: Optional[float] = None) -> dict:
+        response = await self._request("POST", f"/v1/{currency}/main/addrs", "addrs", timeout=timeout)
+        if response.status_code != 201:
+            raise ProviderError(f"{self.name} API error: {response.text}")
+        data = response.json()
+        return {'address': data['address'], 'private': data['private']}
+
+    async def get_balances(self, addresses: List[str], currency: str, timeout: Optional[float] = None) -> Dict[str, bool]:
+        response = await self._request(
+            "GET", f"/v1/{currency}/main/addrs/{';'.join(addresses)}/balance", "balance", timeout=timeout
+        )
+        if response.status_code != 200:
+            raise ProviderError(f"{self.name} API error: {response.text}")
+
+        data = response.json()
+        # Для одного адреса API возвращает объект, для нескольких - список
+        items = data if isinstance(data, list) else [data]
+        return {item['address']: item.get('final_balance', 0) > 0 for item in items if 'address' in item}
+
+class BlockchairProvider(HttpProvider):
+    """Blockchair API: только балансы (dashboards/addresses), адреса не генерирует"""
+
+    COINS = {"btc": "bitcoin", "ltc": "litecoin"}
+    currencies = frozenset(COINS)
+
+    def __init__(self, api_key: Optional[str], base_url: str = "https://api.blockchair.com", name: str = "blockchair", **kwargs):
+        super().__init__(name, base_url, params={'key': api_key} if api_key else None, **kwargs)
+
+    async def get_balances(self, addresses: List[str], currency: str, timeout: Optional[float] = None) -> Dict[str, bool]:
+        response = await self._request(
+            "GET", f"/{self.COINS[currency]}/dashboards/addresses/{','.join(addresses)}", "balance", timeout=timeout
+        )
+        if response.status_code != 200:
+            raise ProviderError(f"{self.name} API error: {response.text}")
+
+        items = (response.json().get('data') or {}).get('addresses') or {}
+        return {address: item.get('balance', 0) > 0 for address, item in items.items()}
+
+class ProviderHealth:
+    """
+    Состояние провайдера: оценка здоровья и автомат circuit breaker.
+
+    После failure_threshold ошибок подряд провайдер исключается на open_timeout
+    секунд, затем пропускается один пробный запрос: успех возвращает провайдер
+    в работу, ошибка снова открывает цепь.
+    """
+
+    # Задержка, предполагаемая для провайдера без статистики: резервный провайдер
+    # не становится основным, пока основной отвечает быстрее
+    UNKNOWN_LATENCY = 1.0
+
+    def __init__(self, name: str, failure_threshold: int = 5, open_timeout: float = 30.0, window: int = 200):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_timeout = open_timeout
+        self.latencies = deque(maxlen=window)
+        self.success_rate = 1.0
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def score(self) -> float:
+        """Чем выше, тем предпочтительнее: доля успехов с поправкой на медианную задержку"""
+        latency = self.percentile(0.5)
+        return self.success_rate / (1.0 + (self.UNKNOWN_LATENCY if latency is None else latency))
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+    @property
+    def probe_ready(self) -> bool:
+        """Цепь открыта, но таймаут истек - следующий запрос будет пробным"""
+        return self.opened_at is not None and not self.probing \
+            and time.monotonic() - self.opened_at >= self.open_timeout
+
+    def acquire(self) -> bool:
+        """Можно ли отправить запрос; в полуоткрытом состоянии - только один пробный"""
+        if self.opened_at is None:
+            return True
+        if self.probing or time.monotonic() - self.opened_at < self.open_timeout:
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.success_rate = self.success_rate * 0.9 + 0.1
+        self.failures = 0
+        if self.opened_at is not None:
+            # Восстановившийся провайдер снова сравнивается с остальными только по задержке
+            self.success_rate = 1.0
+            logger.info(f"Провайдер {self.name} снова доступен")
+        self.opened_at = None
+        self.probing = False
+        self._export()
+
+    def record_failure(self) -> None:
+        self.success_rate *= 0.9
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+            logger.warning(f"Провайдер {self.name} исключен на {self.open_timeout:.0f} с после {self.failures} ошибок подряд")
+            self.opened_at = time.monotonic()
+        self.probing = False
+        self._export()
+
+    def release(self) -> None:
+        """Запрос отменен (проиграл хеджированному): результат не учитывается"""
+        self.probing = False
+
+    def _export(self) -> None:
+        PROVIDER_HEALTH.labels(self.name).set(self.score)
+        PROVIDER_CIRCUIT_OPEN.labels(self.name).set(0 if self.opened_at is None else 1)
+
+class ProviderPool:
+    """
+    Несколько провайдеров с переключением при отказах.
+
+    Провайдеры упорядочены по оценке здоровья, при равенстве - по порядку в
+    конфигурации. Чтение балансов хеджируется: если основной провайдер не ответил
+    за hedge_percentile своих недавних задержек, тот же запрос отправляется
+    следующему, и используется первый успешный ответ. Генерация адреса не
+    хеджируется (иначе создавались бы лишние кошельки), только переключается
+    на следующий провайдер при ошибке.
+
+    Если все провайдеры отказали временно (ProviderUnavailable), проход
+    повторяется до retries раз с экспоненциальной задержкой; провайдеры для
+    повтора выбираются заново, с учетом только что открытых цепей.
+    """
+
+    def __init__(
+        self,
+        providers: List[BlockchainProvider],
+        failure_threshold: int = 5,
+        open_timeout: float = 30.0,
+        hedge_percentile: Optional[float] = 0.95,
+        hedge_min_delay: float = 0.1,
+        retries: int = 3,
+        backoff: float = 0.5
+    ):
+        if not providers:
+            raise ValueError("Нужен хотя бы один провайдер")
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.health = {
+            provider.name: ProviderHealth(provider.name, failure_threshold, open_timeout)
+            for provider in providers
+        }
+
+    def _candidates(self, currency: str, generate: bool = False) -> List[BlockchainProvider]:
+        suitable = [
+            provider for provider in self.providers
+            if currency in provider.currencies and (provider.can_generate or not generate)
+        ]
+        # Пробный запрос к восстанавливающемуся провайдеру идет первым (чтения при этом
+        # хеджируются); sorted устойчива - при равной оценке сохраняется порядок из конфигурации
+        return sorted(suitable, key=lambda provider: (
+            not self.health[provider.name].probe_ready, -self.health[provider.name].score
+        ))
+
+    def _hedge_delay(self, provider: BlockchainProvider) -> Optional[float]:
+        if self.hedge_percentile is None:
+            return None
+        latency = self.health[provider.name].percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, latency or 0.0)
+
+    async def _call(self, provider: BlockchainProvider, operation: Callable[[BlockchainProvider], Awaitable]):
+        health = self.health[provider.name]
+        started = time.perf_counter()
+        try:
+            result = await operation(provider)
+        except asyncio.CancelledError:
+            health.release()
+            raise
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.perf_counter() - started)
+        return result
+
+    async def _run(self, candidates: List[BlockchainProvider], operation, hedge: bool):
+        """Первый успешный результат: переключение при ошибке и (если hedge) при медленном ответе"""
+        queue = list(candidates)
+        running = {}
+        errors = []
+        transient = True
+
+        def launch() -> bool:
+            while queue:
+                provider = queue.pop(0)
+                if self.health[provider.name].acquire():
+                    running[asyncio.ensure_future(self._call(provider, operation))] = provider
+                    return True
+            return False
+
+        if not launch():
+            raise ProviderError("Нет доступных провайдеров: все исключены после ошибок")
+
+        try:
+            while running:
+                primary = next(iter(running.values()))
+                delay = self._hedge_delay(primary) if hedge and queue else None
+                done, _ = await asyncio.wait(running, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Основной провайдер медленнее обычного - дублируем запрос
+                    if launch():
+                        HEDGED_REQUESTS.labels(list(running.values())[-1].name).inc()
+                    continue
+
+                for task in done:
+                    provider = running.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(f"{provider.name}: {task.exception()}")
+                    transient = transient and isinstance(task.exception(), ProviderUnavailable)
+
+                if not running:
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        error = ProviderUnavailable if transient else ProviderError
+        raise error(f"Все провайдеры недоступны ({'; '.join(errors)})")
+
+    async def _run_with_retries(self, candidates: Callable[[], List[BlockchainProvider]], operation, hedge: bool):
+        """Повторяет проход по провайдерам, пока отказы временные"""
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._run(candidates(), operation, hedge)
+            except ProviderUnavailable as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                logger.warning(f"{str(e)}, повтор через {delay:.2f} с")
+                await asyncio.sleep(delay)
+
+    async def get_balances(self, addresses: List[str], currency: str, timeout: Optional[float] = None) -> Dict[str, bool]:
+        """Балансы адресов от первого ответившего провайдера"""
+        return await self._run_with_retries(
+            lambda: self._candidates(currency),
+            lambda provider: provider.get_balances(addresses, currency, timeout),
+            hedge=True
+        )
+
+    async def generate_address(self, currency: str, timeout: Optional[float] = None) -> dict:
+        """Новый адрес у первого доступного провайдера, поддерживающего генерацию"""
+        return await self._run_with_retries(
+            lambda: self._candidates(currency, generate=True),
+            lambda provider: provider.generate_address(currency, timeout),
+            hedge=False
+        )
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(provider.aclose() for provider in self.providers))
+
+def build_providers(config) -> List[BlockchainProvider]:
+    """
+    Провайдеры из BLOCKCHAIN_PROVIDERS, в порядке приоритета.
+
+    Элемент списка - тип провайдера (blockcypher, blockchair), при необходимости
+    с адресом: "blockcypher=http://proxy:8081" - BlockCypher-совместимый сервис.
+    """
+    http = dict(
+        timeout=config.blockcypher_timeout,
+        max_connections=config.blockcypher_max_connections,
+        max_concurrency=config.blockcypher_max_concurrency
+    )
+    providers = []
+    for spec in config.blockchain_providers:
+        kind, _, url = spec.partition("=")
+        kind = kind.strip().lower()
+        # Одинаковые типы различаются номером: blockcypher, blockcypher-2, ...
+        count = sum(1 for provider in providers if provider.name.split("-")[0] == kind)
+        name = kind if count == 0 else f"{kind}-{count + 1}"
+
+        if kind == "blockcypher":
+            providers.append(BlockCypherProvider(
+                config.blockcypher_api, url.strip() or config.blockcypher_base_url, name=name, **http
+            ))
+        elif kind == "blockchair":
+            providers.append(BlockchairProvider(
+                config.blockchair_api, url.strip() or "https://api.blockchair.com", name=name, **http
+            ))
+        else:
+            raise ValueError(f"Неизвестный провайдер в BLOCKCHAIN_PROVIDERS: {spec}")
+    return providers
@@ -0,0 +1,156 @@
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram.ext import ContextTypes
+from src.bot.database import Product, StockReservation, Transaction
+from src.bot.stats import bump_counters, counter_name
+
+logger = logging.getLogger(__name__)
+
+# Резерв создается в запросе, создавшем заказ, сразу после него: created_at заказа
+# лежит не раньше чем за это окно до created_at резерва (ограничивает UPDATE секциями)
+ORDER_SKEW = timedelta(minutes=5)
+
+async def reserve_stock(session: AsyncSession, product_id: int) -> Optional[Row]:
+    """
+    Списывает единицу товара одним условным UPDATE ... WHERE stock > 0 RETURNING.
+
+    Проверка и списание выполняются в одном выражении, поэтому при любом числе
+    параллельных покупателей остаток не уходит в минус. Коммит выполняет вызывающий код.
+
+    Args:
+        session: Асинхронная сессия БД
+        product_id: ID товара
+
+    Returns:
+        Строка (id, name, price_btc, price_ltc, stock) после списания или None, если товара нет
+    """
+    result = await session.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.stock > 0)
+        .values(stock=Product.stock - 1)
+        .returning(Product.id, Product.name, Product.price_btc, Product.price_ltc, Product.stock)
+    )
+    return result.first()
+
+def add_reservation(session: AsyncSession, product_id: int, transaction_id: int, ttl: int) -> StockReservation:
+    """Фиксирует резерв под транзакцию со сроком жизни ttl секунд"""
+    reservation = StockReservation(
+        product_id=product_id,
+        transaction_id=transaction_id,
+        status='active',
+        expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+    )
+    session.add(reservation)
+    return reservation
+
+async def commit_reservation(session: AsyncSession, transaction_id: int) -> bool:
+    """Переводит активный резерв в committed после оплаты; False, если резерв уже освобожден"""
+    result = await session.execute(
+        update(StockReservation)
+        .where(StockReservation.transaction_id == transaction_id, StockReservation.status == 'active')
+        .values(status='committed')
+        .returning(StockReservation.id)
+    )
+    return result.first() is not None
+
+async def release_expired(session: AsyncSession, batch_size: int) -> Tuple[int, Counter]:
+    """
+    Освобождает одну пачку просроченных резервов, возвращает товар на склад и
+    просрочивает неоплаченные счета этих резервов.
+
+    Счет истекает вместе со своим резервом: иначе оплата, пришедшая после
+    освобождения резерва, завершила бы заказ без товара - или списала бы
+    единицу, уже зарезервированную другим покупателем. Оплата после истечения
+    обрабатывается как оплата просроченного счета (возврат через поддержку).
+    Заказы блокируются раньше резервов - в том же порядке, что и в
+    complete_transaction, поэтому одновременная оплата не приводит к взаимной
+    блокировке: побеждает тот, кто первым изменил статус заказа. Коммит
+    выполняет вызывающий код.
+
+    Returns:
+        Число просмотренных резервов и количество возвращенных единиц по ID товара
+    """
+    result = await session.execute(
+        select(StockReservation.id, StockReservation.transaction_id, StockReservation.created_at)
+        .where(StockReservation.status == 'active', StockReservation.expires_at < datetime.utcnow())
+        .order_by(StockReservation.id)
+        .limit(batch_size)
+    )
+    rows = result.all()
+    if not rows:
+        return 0, Counter()
+
+    created = [row.created_at for row in rows]
+    result = await session.execute(
+        update(Transaction)
+        .where(
+            Transaction.id.in_([row.transaction_id for row in rows]),
+            Transaction.created_at.between(min(created) - ORDER_SKEW, max(created)),
+            Transaction.status == 'pending'
+        )
+        .values(status='expired')
+        .returning(Transaction.id)
+    )
+    expired = len(result.scalars().all())
+    if expired:
+        await bump_counters(session, {counter_name('pending'): -expired, counter_name('expired'): expired})
+
+    result = await session.execute(
+        update(StockReservation)
+        .where(StockReservation.id.in_([row.id for row in rows]), StockReservation.status == 'active')
+        .values(status='released')
+        .returning(StockReservation.product_id)
+    )
+    released = Counter(result.scalars().all())
+    await return_stock(session, released)
+    return len(rows), released
+
+async def release_reservations(session: AsyncSession, transaction_ids: List[int]) -> Counter:
+    """
+    Освобождает активные резервы указанных транзакций (например, просроченных счетов).
+
+    Returns:
+        Количество возвращенных единиц по ID товара
+    """
+    result = await session.execute(
+        update(StockReservation)
+        .where(StockReservation.transaction_id.in_(transaction_ids), StockReservation.status == 'active')
+        .values(status='released')
+        .returning(StockReservation.product_id)
+    )
+    released = Counter(result.scalars().all())
+    await return_stock(session, released)
+    return released
+
+async def return_stock(session: AsyncSession, released: Counter) -> None:
+    """Возвращает товар на склад: одно обновление на товар, а не на резерв"""
+    for product_id, count in released.items():
+        await session.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(stock=Product.stock + count)
+        )
+
+async def release_expired_reservations(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Фоновое освобождение просроченных резервов пачками с коммитом после каждой"""
+    Session = context.bot_data['session_factory']
+    config = context.bot_data['config']
+
+    total = 0
+    while True:
+        async with Session() as session:
+            scanned, released = await release_expired(session, config.reservation_release_batch)
+            await session.commit()
+
+        total += sum(released.values())
+        if scanned < config.reservation_release_batch:
+            break
+
+    if total:
+        await context.bot_data['catalog_cache'].invalidate()
+        logger.info(f"Освобождено просроченных резервов: {total}")
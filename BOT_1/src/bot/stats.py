@@ -0,0 +1,219 @@
+import logging
+import random
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Optional
+from sqlalchemy import select, func, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from telegram.ext import ContextTypes
+from src.bot.database import Product, Transaction, TransactionArchive, StatCounter, SalesRollup
+
+logger = logging.getLogger(__name__)
+
+# Гранулярность сводок выручки
+GRANULARITIES = ("hour", "day")
+
+# Слоты счетчиков и сводок: каждое изменение попадает в случайный слот, поэтому
+# одновременные заказы не ждут блокировку одной строки orders_pending
+STAT_SLOTS = 16
+
+def counter_name(status: str) -> str:
+    """Имя счетчика заказов в статусе status"""
+    return f"orders_{status}"
+
+def truncate(moment: datetime, granularity: str) -> datetime:
+    """Начало часа или суток, к которому относится момент времени"""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+def _insert(session: AsyncSession, table):
+    """INSERT с поддержкой ON CONFLICT для текущей СУБД (PostgreSQL или SQLite)"""
+    if session.bind.dialect.name == "postgresql":
+        return pg_insert(table)
+    return sqlite_insert(table)
+
+async def bump_counters(session: AsyncSession, deltas: Dict[str, int], slot: Optional[int] = None) -> None:
+    """Изменяет счетчики на указанные величины одним upsert на счетчик (по умолчанию в случайном слоте)"""
+    if slot is None:
+        slot = random.randrange(STAT_SLOTS)
+    # Строки блокируются в одном порядке во всех транзакциях - без взаимных блокировок
+    for name, delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        stmt = _insert(session, StatCounter).values(name=name, slot=slot, value=delta, updated_at=datetime.utcnow())
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[StatCounter.name, StatCounter.slot],
+            set_={"value": StatCounter.value + delta, "updated_at": stmt.excluded.updated_at}
+        ))
+
+async def add_sales(
+    session: AsyncSession,
+    created_at: datetime,
+    currency: str,
+    orders: int,
+    revenue: Decimal
+) -> None:
+    """Добавляет заказы и выручку в почасовую и суточную сводки (отрицательные значения - при возврате)"""
+    slot = random.randrange(STAT_SLOTS)
+    for granularity in GRANULARITIES:
+        await _add_rollup(session, granularity, truncate(created_at, granularity), currency, slot, orders, revenue)
+
+async def _add_rollup(
+    session: AsyncSession,
+    granularity: str,
+    bucket: datetime,
+    currency: str,
+    slot: int,
+    orders: int,
+    revenue: Decimal
+) -> None:
+    """Прибавляет заказы и выручку к одному интервалу сводки одним upsert"""
+    stmt = _insert(session, SalesRollup).values(
+        granularity=granularity,
+        bucket=bucket,
+        currency=currency,
+        slot=slot,
+        orders=orders,
+        revenue=revenue
+    )
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[SalesRollup.granularity, SalesRollup.bucket, SalesRollup.currency, SalesRollup.slot],
+        set_={"orders": SalesRollup.orders + orders, "revenue": SalesRollup.revenue + revenue}
+    ))
+
+async def record_transition(
+    session: AsyncSession,
+    old_status: Optional[str],
+    new_status: str,
+    amount: Optional[Decimal] = None,
+    currency: Optional[str] = None,
+    created_at: Optional[datetime] = None
+) -> None:
+    """
+    Учитывает смену статуса заказа в счетчиках и сводках выручки.
+
+    Вызывается в той же транзакции, что и изменение статуса, поэтому статистика
+    фиксируется или откатывается вместе с заказом. Выручка относится к часу
+    создания заказа, так же как при пересчете из таблицы transactions.
+
+    Args:
+        session: Асинхронная сессия БД
+        old_status: Прежний статус (None для нового заказа)
+        new_status: Новый статус
+        amount: Сумма заказа
+        currency: Валюта (BTC/LTC)
+        created_at: Время создания заказа
+    """
+    deltas = {counter_name(new_status): 1}
+    if old_status:
+        deltas[counter_name(old_status)] = -1
+    await bump_counters(session, deltas)
+
+    if amount is None or not currency or created_at is None:
+        return
+    if new_status == 'completed':
+        await add_sales(session, created_at, currency, 1, amount)
+    elif old_status == 'completed':
+        await add_sales(session, created_at, currency, -1, -amount)
+
+async def load_stats(session: AsyncSession, now: Optional[datetime] = None) -> dict:
+    """
+    Читает счетчики и выручку за последние 24 часа и 7 дней.
+
+    Объем чтения ограничен числом счетчиков и интервалов сводок (24 часа, 7 суток)
+    и не зависит от размера истории заказов.
+
+    Returns:
+        {"counters": {имя: значение}, "day": {валюта: (заказы, выручка)}, "week": {...}}
+    """
+    now = now or datetime.utcnow()
+    result = await session.execute(
+        select(StatCounter.name, func.sum(StatCounter.value)).group_by(StatCounter.name)
+    )
+    stats = {"counters": {name: int(value) for name, value in result.all()}}
+
+    for key, granularity, since in (
+        ("day", "hour", truncate(now, "hour") - timedelta(hours=23)),
+        ("week", "day", truncate(now, "day") - timedelta(days=6)),
+    ):
+        result = await session.execute(
+            select(SalesRollup.currency, func.sum(SalesRollup.orders), func.sum(SalesRollup.revenue))
+            .where(SalesRollup.granularity == granularity, SalesRollup.bucket >= since)
+            .group_by(SalesRollup.currency)
+        )
+        stats[key] = {currency: (orders, revenue) for currency, orders, revenue in result.all()}
+    return stats
+
+async def rebuild_stats(Session: async_sessionmaker, batch_size: int) -> Counter:
+    """
+    Пересчитывает счетчики и сводки из таблиц transactions и transactions_archive.
+
+    Обе таблицы читаются одним запросом UNION ALL (серверный курсор, пачки по
+    batch_size), поэтому заказ, перенесенный в архив во время сверки, учитывается
+    ровно один раз. Текущие счетчики и сводки читаются в той же транзакции
+    (REPEATABLE READ: один снимок с заказами, ведь record_transition пишет в
+    транзакции заказа). Значения не перезаписываются: к слоту 0 прибавляется
+    расхождение между пересчетом и счетчиками этого снимка, поэтому изменения,
+    зафиксированные после снимка, не теряются, а обновления заказов не ждут сверку.
+
+    Returns:
+        Пересчитанные значения счетчиков
+    """
+    counters = Counter()
+    sales = defaultdict(lambda: [0, Decimal(0)])
+
+    query = union_all(*(
+        select(model.status, model.amount, model.currency, model.created_at)
+        for model in (Transaction, TransactionArchive)
+    )).execution_options(yield_per=batch_size)
+    async with Session() as session:
+        if session.bind.dialect.name == "postgresql":
+            await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            for row in rows:
+                counters[counter_name(row.status)] += 1
+                if row.status == 'completed' and row.currency and row.created_at:
+                    for granularity in GRANULARITIES:
+                        bucket = sales[(granularity, truncate(row.created_at, granularity), row.currency)]
+                        bucket[0] += 1
+                        bucket[1] += Decimal(row.amount or 0)
+        counters["products"] = await session.scalar(select(func.count()).select_from(Product))
+
+        result = await session.execute(
+            select(StatCounter.name, func.sum(StatCounter.value))
+            .where(StatCounter.name.like("orders_%") | StatCounter.name.in_(list(counters)))
+            .group_by(StatCounter.name)
+        )
+        current = {name: int(value) for name, value in result.all()}
+        result = await session.execute(
+            select(SalesRollup.granularity, SalesRollup.bucket, SalesRollup.currency,
+                   func.sum(SalesRollup.orders), func.sum(SalesRollup.revenue))
+            .group_by(SalesRollup.granularity, SalesRollup.bucket, SalesRollup.currency)
+        )
+        current_sales = {(granularity, bucket, currency): (orders, revenue)
+                         for granularity, bucket, currency, orders, revenue in result.all()}
+
+    async with Session() as session:
+        # Счетчики статусов, которых больше нет в таблице, сводятся к нулю той же разницей
+        await bump_counters(
+            session, {name: counters[name] - current.get(name, 0) for name in set(counters) | set(current)}, slot=0
+        )
+        for key in sorted(set(sales) | set(current_sales)):
+            orders, revenue = sales.get(key, (0, Decimal(0)))
+            current_orders, current_revenue = current_sales.get(key, (0, Decimal(0)))
+            if orders != current_orders or revenue != current_revenue:
+                await _add_rollup(session, *key, 0, orders - current_orders, revenue - Decimal(current_revenue))
+        await session.commit()
+    return counters
+
+async def reconcile_stats(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Фоновая сверка статистики с исходными данными"""
+    config = context.bot_data['config']
+    counters = await rebuild_stats(context.bot_data['session_factory'], config.stats_reconcile_batch)
+    logger.info(f"Статистика пересчитана: {dict(counters)}")
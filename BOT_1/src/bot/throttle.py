@@ -0,0 +1,189 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+from src.bot.metrics import THROTTLED_UPDATES
+
+logger = logging.getLogger(__name__)
+
+# Атомарная проверка нескольких корзин: токен списывается из всех, только если хватает во всех.
+# KEYS - корзины, затем ключ уведомления; ARGV - now_ms, затем пары rate/capacity на каждую корзину.
+# Возвращает {разрешено, через сколько мс повторить, нужно ли уведомить пользователя}.
+TOKEN_BUCKET_LUA = """
+local now = tonumber(ARGV[1])
+local buckets = #KEYS - 1
+local state = {}
+local wait = 0
+for i = 1, buckets do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    local data = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(data[1]) or capacity
+    local ts = tonumber(data[2]) or now
+    tokens = math.min(capacity, tokens + (now - ts) / 1000 * rate)
+    state[i] = {tokens, rate, capacity}
+    if tokens < 1 then
+        wait = math.max(wait, math.ceil((1 - tokens) / rate * 1000))
+    end
+end
+if wait > 0 then
+    local notify = redis.call('SET', KEYS[#KEYS], 1, 'NX', 'PX', wait)
+    return {0, wait, notify and 1 or 0}
+end
+for i = 1, buckets do
+    local tokens, rate, capacity = state[i][1] - 1, state[i][2], state[i][3]
+    redis.call('HSET', KEYS[i], 'tokens', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate * 1000))
+end
+return {1, 0, 0}
+"""
+
+def update_action(update: Update) -> Optional[str]:
+    """Действие для per-action корзины: команда или префикс callback_data"""
+    if update.callback_query and update.callback_query.data:
+        return update.callback_query.data.split("_", 1)[0]
+    message = update.message
+    if message and message.text and message.text.startswith("/"):
+        return message.text.split()[0][1:].split("@", 1)[0].split("_", 1)[0].lower()
+    return None
+
+class Throttle:
+    """
+    Анти-флуд на токен-корзинах: общая корзина пользователя и корзина на действие.
+
+    Основное хранилище - Redis (скрипт Lua, одна операция на обновление, общие
+    лимиты для всех реплик). При недоступности Redis используются корзины
+    в памяти процесса, ограниченные max_local_keys записями. Переход на них и
+    возврат к Redis пишутся в журнал один раз, пока Redis недоступен -
+    напоминание не чаще warn_interval секунд.
+    """
+
+    PREFIX = "throttle"
+
+    def __init__(
+        self,
+        redis: Redis,
+        user_rate: float = 2.0,
+        user_burst: int = 10,
+        action_rate: float = 0.5,
+        action_burst: int = 3,
+        max_local_keys: int = 100000,
+        warn_interval: float = 60.0
+    ):
+        self.redis = redis
+        self.user_limit = (user_rate, user_burst)
+        self.action_limit = (action_rate, action_burst)
+        self.max_local_keys = max_local_keys
+        self.warn_interval = warn_interval
+        self._script = redis.register_script(TOKEN_BUCKET_LUA)
+        self._local: OrderedDict = OrderedDict()
+        # Начало работы без Redis, время последнего предупреждения и число обновлений в памяти
+        self._fallback_since: Optional[float] = None
+        self._warned_at = 0.0
+        self._fallback_updates = 0
+
+    def _buckets(self, user_id: int, action: Optional[str]) -> List[Tuple[str, float, int]]:
+        buckets = [(f"{self.PREFIX}:{user_id}", *self.user_limit)]
+        if action:
+            buckets.append((f"{self.PREFIX}:{user_id}:{action}", *self.action_limit))
+        return buckets
+
+    def _take_local(self, buckets, notice_key: str) -> Tuple[bool, float, bool]:
+        now = time.monotonic()
+        wait = 0.0
+        state = []
+        for key, rate, capacity in buckets:
+            tokens, ts = self._local.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            state.append((key, tokens))
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+
+        if wait:
+            notice_until = self._local.get(notice_key, (0.0, 0.0))[0]
+            notify = notice_until <= now
+            if notify:
+                self._local[notice_key] = (now + wait, now)
+            return False, wait, notify
+
+        for key, tokens in state:
+            self._local[key] = (tokens - 1, now)
+            self._local.move_to_end(key)
+        while len(self._local) > self.max_local_keys:
+            self._local.popitem(last=False)
+        return True, 0.0, False
+
+    async def take(self, user_id: int, action: Optional[str]) -> Tuple[bool, float, bool]:
+        """
+        Списывает токен для обновления пользователя.
+
+        Returns:
+            (разрешено, через сколько секунд повторить, нужно ли отправить уведомление)
+        """
+        buckets = self._buckets(user_id, action)
+        notice_key = f"{self.PREFIX}:{user_id}:notice"
+        try:
+            args = [int(time.time() * 1000)]
+            for _, rate, capacity in buckets:
+                args += [rate, capacity]
+            allowed, wait_ms, notify = await self._script(
+                keys=[key for key, _, _ in buckets] + [notice_key], args=args
+            )
+        except RedisError as e:
+            self._on_fallback(e)
+            return self._take_local(buckets, notice_key)
+
+        if self._fallback_since is not None:
+            logger.warning(
+                f"Анти-флуд снова работает через Redis после {time.monotonic() - self._fallback_since:.0f} с "
+                f"(обновлений проверено в памяти: {self._fallback_updates})"
+            )
+            self._fallback_since = None
+        return bool(allowed), wait_ms / 1000, bool(notify)
+
+    def _on_fallback(self, error: RedisError) -> None:
+        """Журнал перехода на корзины в памяти без записи на каждое обновление"""
+        now = time.monotonic()
+        if self._fallback_since is None:
+            self._fallback_since = self._warned_at = now
+            self._fallback_updates = 1
+            logger.error(f"Анти-флуд переключен на корзины в памяти процесса, Redis недоступен: {str(error)}")
+            return
+
+        self._fallback_updates += 1
+        if now - self._warned_at >= self.warn_interval:
+            self._warned_at = now
+            logger.warning(
+                f"Анти-флуд работает без Redis {now - self._fallback_since:.0f} с "
+                f"(обновлений проверено в памяти: {self._fallback_updates}): {str(error)}"
+            )
+
+async def throttle_updates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Пропускает обновление к обработчикам или отбрасывает его при превышении лимита.
+
+    Зарегистрирован в группе -1, до всех обработчиков. Отброшенное обновление не
+    открывает сессию БД и не обращается к внешним API: пользователь получает
+    ответ без запросов к хранилищам (для кнопок - всплывающая подсказка).
+    """
+    throttle = context.bot_data.get('throttle')
+    user = update.effective_user
+    if throttle is None or user is None or user.id in context.bot_data['config'].admin_ids:
+        return
+
+    action = update_action(update)
+    allowed, wait, notify = await throttle.take(user.id, action)
+    if allowed:
+        return
+
+    THROTTLED_UPDATES.labels(action or "other").inc()
+    text = f"⏳ Слишком много запросов, повторите через {max(1, round(wait))} с"
+    if update.callback_query:
+        await update.callback_query.answer(text)
+    elif notify and update.effective_message:
+        await update.effective_message.reply_text(text)
+    raise ApplicationHandlerStop
@@ -0,0 +1,562 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import signal
+import socket
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+import redis.asyncio as aioredis
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+from telegram import Update
+from telegram.ext import Application
+from src.bot.metrics import STREAM_SHARDS_OWNED, STREAM_UPDATES
+
+logger = logging.getLogger(__name__)
+
+# Продление аренды шарда только ее владельцем
+RENEW_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Освобождение аренды только ее владельцем
+RELEASE_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Подтверждение сообщений шарда, только пока аренда у этого воркера (-1 - аренда потеряна)
+ACK_OWNED_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return -1
+end
+return redis.call('XACK', KEYS[2], ARGV[2], unpack(ARGV, 3))
+"""
+
+def update_key(update: Update) -> str:
+    """Ключ упорядочивания: обновления с одним ключом обрабатываются строго по очереди"""
+    if update.effective_user:
+        return str(update.effective_user.id)
+    if update.effective_chat:
+        return str(update.effective_chat.id)
+    return str(update.update_id)
+
+class UpdateStream:
+    """
+    Распределение обновлений между процессами через потоки Redis.
+
+    Обновления раскладываются по shards потокам updates:<шард> по ключу
+    пользователя (update_key), у каждого потока - группа потребителей workers.
+    Шард в каждый момент арендует один воркер, поэтому обновления одного
+    пользователя не обрабатываются параллельно и не переставляются.
+    """
+
+    PREFIX = "updates"
+    GROUP = "workers"
+
+    def __init__(self, redis: Redis, shards: int = 16, maxlen: int = 100000):
+        self.redis = redis
+        self.shards = shards
+        self.maxlen = maxlen
+
+    def stream_key(self, shard: int) -> str:
+        return f"{self.PREFIX}:{shard}"
+
+    def lease_key(self, shard: int) -> str:
+        return f"{self.PREFIX}:lease:{shard}"
+
+    @property
+    def dead_key(self) -> str:
+        # Обновления, обработка которых завершилась исключением, - для ручного разбора
+        return f"{self.PREFIX}:dead"
+
+    @property
+    def workers_key(self) -> str:
+        return f"{self.PREFIX}:workers"
+
+    def shard_of(self, key: str) -> int:
+        # Ключи - id пользователей и чатов; отрицательные id групп тоже распределяются равномерно
+        return int(key) % self.shards
+
+    async def ensure_groups(self) -> None:
+        """Создает потоки и группу потребителей (повторный вызов безопасен)"""
+        keys = [self.stream_key(shard) for shard in range(self.shards)]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.exists(key)
+            exists = await pipe.execute()
+        for key, present in zip(keys, exists):
+            if present and any(group["name"] == self.GROUP for group in await self.redis.xinfo_groups(key)):
+                continue
+            try:
+                await self.redis.xgroup_create(key, self.GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                # Группу одновременно создал другой процесс
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def publish(self, updates: List[Update]) -> None:
+        """Добавляет пачку обновлений в потоки одним конвейером"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for update in updates:
+                key = update_key(update)
+                pipe.xadd(
+                    self.stream_key(self.shard_of(key)),
+                    {"key": key, "update": update.to_json()},
+                    maxlen=self.maxlen,
+                    approximate=True
+                )
+            await pipe.execute()
+        STREAM_UPDATES.labels("published").inc(len(updates))
+
+async def forward_updates(queue: asyncio.Queue, stream: UpdateStream, batch_size: int) -> None:
+    """
+    Перекладывает обновления из очереди приложения в потоки Redis пачками.
+
+    При недоступности Redis пачка повторяется; очередь тем временем заполняется,
+    и webhook отвечает Telegram 503, так что обновления не теряются.
+    """
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+
+        while True:
+            try:
+                await stream.publish(batch)
+                break
+            except RedisError as e:
+                STREAM_UPDATES.labels("publish_error").inc(len(batch))
+                logger.error(f"Не удалось передать {len(batch)} обновлений в Redis: {str(e)}")
+                await asyncio.sleep(1)
+
+        for _ in batch:
+            queue.task_done()
+
+class StreamWorker:
+    """
+    Обработчик обновлений из потоков Redis через стек register_handlers.
+
+    Воркер регистрируется в updates:workers и арендует примерно shards / N
+    шардов (N - число живых воркеров), продлевая аренду каждые lease_ttl / 3
+    секунд; лишние шарды отдает после завершения их обновлений. Получив шард,
+    воркер сначала забирает (XAUTOCLAIM) необработанные сообщения прежнего
+    владельца - например, упавшего процесса, - и только потом читает новые.
+
+    Чтение одним XREADGROUP по всем своим шардам. Обновления разных
+    пользователей обрабатываются параллельно (не больше max_inflight), одного
+    пользователя - цепочкой в порядке потока; обновление, ждущее предыдущее,
+    слот не занимает. Подтверждение (XACK) после обработки, пачками: доставка
+    "хотя бы один раз". Обновление, обработка которого упала, переносится в
+    updates:dead и подтверждается - повтор вне очереди нарушил бы порядок.
+
+    Аренда проверяется перед обработкой каждого обновления и при
+    подтверждении (XACK в Lua-скрипте вместе с проверкой владельца): если
+    цикл воркера простоял дольше lease_ttl и шард уже забрал другой воркер,
+    полученные сообщения шарда не обрабатываются и не подтверждаются.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        stream: UpdateStream,
+        lease_ttl: float = 15.0,
+        batch_size: int = 100,
+        max_inflight: int = 16,
+        block: float = 1.0
+    ):
+        self.application = application
+        self.stream = stream
+        self.redis = stream.redis
+        self.lease_ttl = lease_ttl
+        self.batch_size = batch_size
+        self.block = block
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        self.owned: Set[int] = set()
+        self._draining: Set[int] = set()
+        self._reclaimed: Set[int] = set()
+        # Номер аренды шарда и момент (time.monotonic), до которого она точно наша
+        self._epochs: Counter = Counter()
+        self._expires: Dict[int, float] = {}
+        self._shard_inflight: Counter = Counter()
+        self._slots = asyncio.Semaphore(max_inflight)
+        # Прочитанные, но не обработанные обновления (включая ждущие в цепочках) - ограничивает чтение
+        self._buffered = asyncio.Semaphore(max_inflight * 4)
+        self._chains: Dict[str, asyncio.Task] = {}
+        self._acks: Dict[Tuple[int, int], List[str]] = defaultdict(list)
+        self._dead: Dict[Tuple[int, int], List[Tuple[str, dict, str]]] = defaultdict(list)
+
+        self._renew = self.redis.register_script(RENEW_LEASE_LUA)
+        self._release = self.redis.register_script(RELEASE_LEASE_LUA)
+        self._ack = self.redis.register_script(ACK_OWNED_LUA)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Цикл чтения до установки stop; затем дообрабатывает полученное и отдает шарды"""
+        await self.stream.ensure_groups()
+        await self._maintain_leases()
+        leases = asyncio.create_task(self._lease_loop(stop))
+        logger.info(f"Воркер {self.consumer} запущен, шарды: {sorted(self.owned)}")
+        try:
+            while not stop.is_set():
+                try:
+                    await self._poll()
+                except RedisError as e:
+                    logger.error(f"Ошибка чтения потоков обновлений: {str(e)}")
+                    await asyncio.sleep(1)
+        finally:
+            leases.cancel()
+            if self._chains:
+                await asyncio.wait(list(self._chains.values()))
+            await self._flush_acks()
+            await self._release_all()
+
+    async def _poll(self) -> None:
+        # Шарды отдаются только здесь, между чтениями: иначе уже отданный шард мог бы
+        # вернуться в ответе XREADGROUP, начатого до освобождения
+        await self._release_drained()
+        shards = sorted(self.owned - self._draining)
+        if not shards:
+            await asyncio.sleep(self.block)
+            return
+
+        for shard in shards:
+            if shard not in self._reclaimed:
+                await self._reclaim(shard)
+        # Аренда могла быть потеряна при подтверждении перед XAUTOCLAIM
+        shards = [shard for shard in shards if shard in self.owned]
+        if not shards:
+            return
+
+        response = await self.redis.xreadgroup(
+            self.stream.GROUP, self.consumer,
+            {self.stream.stream_key(shard): ">" for shard in shards},
+            count=self.batch_size,
+            block=int(self.block * 1000)
+        )
+        for stream_key, entries in response or []:
+            shard = int(stream_key.rsplit(":", 1)[1])
+            epoch = self._epochs[shard]
+            # Чтение могло длиться дольше аренды: сообщения потерянного шарда заберет новый владелец
+            if not await self._check_lease(shard, epoch):
+                STREAM_UPDATES.labels("dropped").inc(len(entries))
+                continue
+            for message_id, fields in entries:
+                await self._dispatch(shard, epoch, message_id, fields)
+        await self._flush_acks()
+
+    async def _reclaim(self, shard: int) -> None:
+        """Забирает сообщения, доставленные прежнему владельцу шарда и не подтвержденные им"""
+        stream_key = self.stream.stream_key(shard)
+        epoch = self._epochs[shard]
+        # Свои уже обработанные сообщения не должны вернуться повторно
+        await self._flush_acks()
+        start, reclaimed = "0-0", 0
+        while True:
+            result = await self.redis.xautoclaim(
+                stream_key, self.stream.GROUP, self.consumer,
+                min_idle_time=0, start_id=start, count=self.batch_size
+            )
+            start, entries = result[0], result[1]
+            # Сообщения, удаленные из потока по MAXLEN, остаются только в списке ожидающих
+            deleted = list(result[2]) if len(result) > 2 else []
+            for message_id, fields in entries:
+                if not fields:
+                    deleted.append(message_id)
+                    continue
+                # Сообщение, еще обрабатываемое по прежней аренде, встанет в цепочку после него
+                await self._dispatch(shard, epoch, message_id, fields)
+                reclaimed += 1
+            if deleted:
+                await self.redis.xack(stream_key, self.stream.GROUP, *deleted)
+            if start in ("0-0", b"0-0"):
+                break
+
+        self._reclaimed.add(shard)
+        if reclaimed:
+            STREAM_UPDATES.labels("reclaimed").inc(reclaimed)
+            logger.warning(f"Шард {shard}: повторно обрабатывается {reclaimed} неподтвержденных обновлений")
+
+    async def _dispatch(self, shard: int, epoch: int, message_id: str, fields: dict) -> None:
+        # Ограничено число прочитанных и не обработанных обновлений, а не только выполняющихся.
+        # Пока чтение ждет, подтверждаются уже обработанные - иначе ответ XREADGROUP по всем
+        # шардам держал бы подтверждения до конца разбора
+        if self._buffered.locked():
+            await self._flush_acks()
+        await self._buffered.acquire()
+        key = fields.get("key", message_id)
+        previous = self._chains.get(key)
+        self._shard_inflight[shard] += 1
+        task = asyncio.create_task(self._handle(shard, epoch, message_id, fields, previous))
+        self._chains[key] = task
+        task.add_done_callback(lambda done: self._chains.pop(key) if self._chains.get(key) is done else None)
+
+    async def _handle(
+        self,
+        shard: int,
+        epoch: int,
+        message_id: str,
+        fields: dict,
+        previous: Optional[asyncio.Task]
+    ) -> None:
+        try:
+            # Предыдущее обновление того же пользователя должно завершиться первым
+            if previous is not None:
+                await asyncio.wait([previous])
+            async with self._slots:
+                if not await self._check_lease(shard, epoch):
+                    STREAM_UPDATES.labels("dropped").inc()
+                    return
+                try:
+                    update = Update.de_json(json.loads(fields["update"]), self.application.bot)
+                    await self.application.process_update(update)
+                except Exception as e:
+                    # Ошибки обработчиков PTB передает error handler'ам; сюда доходят сбои самого разбора
+                    STREAM_UPDATES.labels("failed").inc()
+                    logger.error(f"Ошибка обработки обновления {message_id} из шарда {shard}: {str(e)}")
+                    self._dead[(shard, epoch)].append((message_id, fields, str(e)))
+                else:
+                    STREAM_UPDATES.labels("processed").inc()
+                    self._acks[(shard, epoch)].append(message_id)
+        finally:
+            self._shard_inflight[shard] -= 1
+            self._buffered.release()
+
+    def _holds(self, shard: int, epoch: int) -> bool:
+        return shard in self.owned and self._epochs[shard] == epoch
+
+    async def _check_lease(self, shard: int, epoch: int) -> bool:
+        """Аренда шарда все еще у этого воркера; у самого срока истечения сверяется с Redis"""
+        if not self._holds(shard, epoch):
+            return False
+        if time.monotonic() < self._expires.get(shard, 0) - self.lease_ttl / 10:
+            return True
+        return await self._renew_lease(shard)
+
+    async def _renew_lease(self, shard: int) -> bool:
+        started = time.monotonic()
+        try:
+            renewed = await self._renew(keys=[self.stream.lease_key(shard)], args=[self.consumer, int(self.lease_ttl * 1000)])
+        except RedisError as e:
+            # Не удалось подтвердить аренду - шард отпускается, его подхватят после истечения
+            logger.error(f"Не удалось продлить аренду шарда {shard}: {str(e)}")
+            renewed = False
+        if not renewed:
+            # Аренду перехватили (процесс долго не продлевал ее) - шард больше не читаем
+            logger.warning(f"Потеряна аренда шарда {shard}")
+            STREAM_UPDATES.labels("lease_lost").inc()
+            self._forget(shard)
+            return False
+        self._expires[shard] = started + self.lease_ttl
+        return True
+
+    async def _flush_acks(self) -> None:
+        if not self._acks and not self._dead:
+            return
+        acks, self._acks = self._acks, defaultdict(list)
+        dead, self._dead = self._dead, defaultdict(list)
+
+        batches = {}
+        for lease in set(acks) | set(dead):
+            if not self._holds(*lease):
+                # Шард уже у другого воркера: он обработает эти сообщения заново
+                STREAM_UPDATES.labels("dropped").inc(len(acks.get(lease, ())) + len(dead.get(lease, ())))
+                continue
+            batches[lease] = acks.get(lease, []) + [message_id for message_id, _, _ in dead.get(lease, ())]
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for message_id, fields, error in (item for lease in batches for item in dead.get(lease, ())):
+                    pipe.xadd(
+                        self.stream.dead_key,
+                        {**fields, "id": message_id, "error": error[:1000]},
+                        maxlen=self.stream.maxlen,
+                        approximate=True
+                    )
+                for (shard, _), ids in batches.items():
+                    await self._ack(
+                        keys=[self.stream.lease_key(shard), self.stream.stream_key(shard)],
+                        args=[self.consumer, self.stream.GROUP, *ids],
+                        client=pipe
+                    )
+                results = await pipe.execute()
+        except RedisError as e:
+            for lease in batches:
+                self._acks[lease].extend(acks.get(lease, ()))
+                self._dead[lease].extend(dead.get(lease, ()))
+            logger.error(f"Не удалось подтвердить обработанные обновления: {str(e)}")
+            return
+
+        for (shard, epoch), acked in zip(batches, results[len(results) - len(batches):]):
+            if acked == -1 and self._holds(shard, epoch):
+                logger.warning(f"Потеряна аренда шарда {shard}: обработанные сообщения не подтверждены")
+                STREAM_UPDATES.labels("lease_lost").inc()
+                self._forget(shard)
+
+    async def _lease_loop(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.lease_ttl / 3)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self._maintain_leases()
+                await self._flush_acks()
+            except RedisError as e:
+                logger.error(f"Ошибка продления аренды шардов: {str(e)}")
+
+    async def _maintain_leases(self) -> None:
+        """Пульс воркера, продление своих аренд и выравнивание числа шардов между воркерами"""
+        now = time.time()
+        ttl_ms = int(self.lease_ttl * 1000)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(self.stream.workers_key, {self.consumer: now})
+            pipe.zremrangebyscore(self.stream.workers_key, 0, now - self.lease_ttl)
+            pipe.zcard(self.stream.workers_key)
+            _, _, workers = await pipe.execute()
+        target = math.ceil(self.stream.shards / max(workers, 1))
+
+        for shard in sorted(self.owned):
+            await self._renew_lease(shard)
+
+        # Лишние шарды больше не читаются и отдаются, когда их обновления обработаны
+        active = self.owned - self._draining
+        for shard in sorted(active)[target:]:
+            self._draining.add(shard)
+
+        if len(self.owned) < target:
+            # Начинаем поиск со своего смещения, чтобы воркеры не конкурировали за одни шарды
+            offset = hash(self.consumer) % self.stream.shards
+            for i in range(self.stream.shards):
+                shard = (offset + i) % self.stream.shards
+                if shard in self.owned:
+                    continue
+                started = time.monotonic()
+                if await self.redis.set(self.stream.lease_key(shard), self.consumer, nx=True, px=ttl_ms):
+                    self.owned.add(shard)
+                    self._epochs[shard] += 1
+                    self._expires[shard] = started + self.lease_ttl
+                    if len(self.owned) >= target:
+                        break
+        STREAM_SHARDS_OWNED.set(len(self.owned))
+
+    async def _release_drained(self) -> None:
+        drained = [shard for shard in sorted(self._draining) if not self._shard_inflight[shard]]
+        if not drained:
+            return
+        await self._flush_acks()
+        for shard in drained:
+            await self._release(keys=[self.stream.lease_key(shard)], args=[self.consumer])
+            self._forget(shard)
+
+    def _forget(self, shard: int) -> None:
+        self.owned.discard(shard)
+        self._draining.discard(shard)
+        self._reclaimed.discard(shard)
+        self._expires.pop(shard, None)
+
+    async def _release_all(self) -> None:
+        try:
+            for shard in sorted(self.owned):
+                await self._release(keys=[self.stream.lease_key(shard)], args=[self.consumer])
+            await self.redis.zrem(self.stream.workers_key, self.consumer)
+        except RedisError as e:
+            logger.error(f"Не удалось освободить шарды при остановке: {str(e)}")
+        for shard in list(self.owned):
+            self._forget(shard)
+        STREAM_SHARDS_OWNED.set(0)
+
+def install_stop_signals(stop: asyncio.Event) -> None:
+    """SIGINT/SIGTERM завершают цикл процесса"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+async def run_ingress(application: Application, config) -> None:
+    """
+    Режим ingress: прием обновлений (polling или webhook) и передача их в потоки Redis.
+
+    Обработчики, БД и фоновые задачи в этом процессе не запускаются.
+    """
+    stop = asyncio.Event()
+    install_stop_signals(stop)
+
+    redis = aioredis.from_url(str(config.redis_url), decode_responses=True)
+    stream = UpdateStream(redis, config.stream_shards, config.stream_maxlen)
+    await stream.ensure_groups()
+
+    server = None
+    await application.initialize()
+    forwarder = asyncio.create_task(
+        forward_updates(application.update_queue, stream, config.stream_batch)
+    )
+    try:
+        if config.bot_mode == "webhook":
+            # tornado нужен только в webhook-режиме
+            from tornado.httpserver import HTTPServer
+            from src.bot.webhook import ensure_webhook, make_web_app
+
+            if not config.webhook_url or not config.webhook_secret_token:
+                raise ValueError("Для webhook-режима нужны WEBHOOK_URL и WEBHOOK_SECRET_TOKEN")
+            await ensure_webhook(application, config)
+            server = HTTPServer(
+                make_web_app(application, config, alive=lambda: not stop.is_set()), xheaders=True
+            )
+            server.listen(config.webhook_port, config.webhook_listen)
+        else:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        logger.info(f"Ingress передает обновления в {config.stream_shards} потоков Redis")
+
+        await stop.wait()
+    finally:
+        if server:
+            server.stop()
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        # Все принятые обновления должны попасть в Redis до выхода
+        try:
+            await asyncio.wait_for(application.update_queue.join(), timeout=10)
+        except asyncio.TimeoutError:
+            logger.error(f"При остановке не передано {application.update_queue.qsize()} обновлений")
+        forwarder.cancel()
+        await application.shutdown()
+        await redis.aclose()
+
+async def run_worker(application: Application, config) -> None:
+    """Режим worker: обработка обновлений из потоков Redis стеком register_handlers"""
+    stop = asyncio.Event()
+    install_stop_signals(stop)
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        worker = StreamWorker(
+            application,
+            UpdateStream(application.bot_data["redis"], config.stream_shards, config.stream_maxlen),
+            lease_ttl=config.stream_lease_ttl,
+            batch_size=config.stream_batch,
+            max_inflight=config.concurrent_updates,
+            block=config.stream_block
+        )
+        await worker.run(stop)
+    finally:
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
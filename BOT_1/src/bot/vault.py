@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional
+from sqlalchemy import bindparam, or_, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from telegram.ext import ContextTypes
+from src.bot.database import DepositAddress
+
+logger = logging.getLogger(__name__)
+
+def key_fingerprint(key: str) -> str:
+    """Короткий отпечаток ключа для колонки key_id (сам ключ в БД не хранится)"""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+class KeyVault:
+    """
+    Шифрование приватных ключей Fernet в ограниченном пуле потоков.
+
+    Шифрование и расшифровка не выполняются в цикле событий, а число потоков
+    ограничено, поэтому всплеск заказов не занимает все ядра. Старые ключи
+    (MultiFernet) используются только для расшифровки при ротации.
+    """
+
+    def __init__(self, key: str, old_keys: Optional[List[str]] = None, max_workers: int = 2):
+        self.key_id = key_fingerprint(key)
+        self._keys = [key] + list(old_keys or [])
+        self._cipher = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fernet")
+
+    @property
+    def cipher(self):
+        """MultiFernet создается при первом использовании: cryptography не загружается при старте"""
+        if self._cipher is None:
+            from cryptography.fernet import Fernet, MultiFernet
+            self._cipher = MultiFernet([Fernet(key.encode()) for key in self._keys])
+        return self._cipher
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _encrypt(self, plaintext: str) -> str:
+        return self.cipher.encrypt(plaintext.encode()).decode()
+
+    def _decrypt(self, token: str) -> str:
+        return self.cipher.decrypt(token.encode()).decode()
+
+    def _rotate(self, tokens: List[str]) -> List[Optional[str]]:
+        from cryptography.fernet import InvalidToken
+        rotated = []
+        for token in tokens:
+            try:
+                rotated.append(self.cipher.rotate(token.encode()).decode())
+            except InvalidToken:
+                rotated.append(None)
+        return rotated
+
+    async def encrypt(self, plaintext: str) -> str:
+        """Шифрует строку текущим ключом"""
+        return await self._run(self._encrypt, plaintext)
+
+    async def decrypt(self, token: str) -> str:
+        """Расшифровывает строку текущим или одним из старых ключей"""
+        return await self._run(self._decrypt, token)
+
+    async def rotate(self, tokens: List[str]) -> List[Optional[str]]:
+        """Перешифровывает пачку токенов текущим ключом; None - токен не подходит ни к одному ключу"""
+        return await self._run(self._rotate, tokens)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+async def _stale_key_batches(Session: async_sessionmaker, key_id: str, batch_size: int) -> AsyncIterator[list]:
+    """Пачки (id, private_key) строк, зашифрованных не текущим ключом"""
+    query = select(DepositAddress.id, DepositAddress.private_key) \
+        .where(or_(DepositAddress.key_id.is_(None), DepositAddress.key_id != key_id)) \
+        .order_by(DepositAddress.id)
+
+    async with Session() as reader:
+        # SQLite не даст закоммитить запись, пока открыт читающий курсор: читаем keyset-пачками
+        if reader.bind.dialect.name == "sqlite":
+            last_id = 0
+            while True:
+                result = await reader.execute(query.where(DepositAddress.id > last_id).limit(batch_size))
+                rows = result.all()
+                await reader.rollback()
+                if not rows:
+                    return
+                yield rows
+                last_id = rows[-1].id
+
+        result = await reader.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield rows
+
+async def rotate_deposit_keys(Session: async_sessionmaker, vault: KeyVault, batch_size: int) -> int:
+    """
+    Перешифровывает приватные ключи адресов, зашифрованные не текущим ключом.
+
+    Строки читаются потоково (серверный курсор, yield_per) и обновляются в отдельной
+    сессии с коммитом после каждой пачки - без блокировки таблицы и без загрузки всех
+    ключей в память. Обработанные строки получают key_id текущего ключа, поэтому
+    прерванная ротация при следующем запуске продолжается с оставшихся строк.
+    Обновление условное (private_key не изменился), параллельные изменения не теряются.
+
+    Returns:
+        Количество перешифрованных ключей
+    """
+    table = DepositAddress.__table__
+    rewrite = update(table) \
+        .where(table.c.id == bindparam('row_id'), table.c.private_key == bindparam('old_key')) \
+        .values(private_key=bindparam('new_key'), key_id=vault.key_id)
+
+    rotated = failed = 0
+    async for rows in _stale_key_batches(Session, vault.key_id, batch_size):
+        tokens = await vault.rotate([row.private_key for row in rows])
+        params = [
+            {"row_id": row.id, "old_key": row.private_key, "new_key": token}
+            for row, token in zip(rows, tokens) if token is not None
+        ]
+        failed += len(rows) - len(params)
+
+        if params:
+            async with Session() as writer:
+                await writer.execute(rewrite, params)
+                await writer.commit()
+            rotated += len(params)
+
+    if failed:
+        logger.error(f"Не удалось расшифровать {failed} ключей ни одним из ключей ENCRYPTION_KEY/ENCRYPTION_OLD_KEYS")
+    return rotated
+
+async def rotate_encryption_keys(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Фоновая ротация ключа шифрования приватных ключей"""
+    config = context.bot_data['config']
+    rotated = await rotate_deposit_keys(
+        context.bot_data['session_factory'],
+        context.bot_data['vault'],
+        config.key_rotation_batch
+    )
+    if rotated:
+        logger.info(f"Перешифровано приватных ключей: {rotated}")
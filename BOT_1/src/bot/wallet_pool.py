@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram.ext import ContextTypes
+from src.bot.database import DepositAddress
+
+logger = logging.getLogger(__name__)
+
+async def claim_address(session: AsyncSession, currency: str) -> Optional[str]:
+    """
+    Атомарно забирает свободный адрес из пула.
+
+    Подзапрос блокирует строку через FOR UPDATE SKIP LOCKED, поэтому параллельные
+    заказы не ждут друг друга и никогда не получают один и тот же адрес.
+    Коммит выполняет вызывающий код.
+
+    Args:
+        session: Асинхронная сессия БД
+        currency: Валюта (BTC/LTC)
+
+    Returns:
+        Адрес или None, если пул пуст
+    """
+    candidate = select(DepositAddress.id) \
+        .where(DepositAddress.currency == currency, DepositAddress.status == 'free') \
+        .order_by(DepositAddress.id) \
+        .limit(1) \
+        .with_for_update(skip_locked=True) \
+        .scalar_subquery()
+
+    result = await session.execute(
+        update(DepositAddress)
+        .where(DepositAddress.id == candidate)
+        .values(status='claimed', claimed_at=datetime.utcnow())
+        .returning(DepositAddress.address)
+    )
+    return result.scalar_one_or_none()
+
+async def refill_wallet_pool(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Пополняет пул адресов до целевого размера, если он опустился ниже порога"""
+    Session = context.bot_data['session_factory']
+    crypto = context.bot_data['crypto']
+    config = context.bot_data['config']
+
+    async with Session() as session:
+        result = await session.execute(
+            select(DepositAddress.currency, func.count())
+            .where(DepositAddress.status == 'free')
+            .group_by(DepositAddress.currency)
+        )
+        free = dict(result.all())
+
+    for currency in config.wallet_pool_currencies:
+        available = free.get(currency, 0)
+        if available >= config.wallet_pool_low_water:
+            continue
+
+        # За один проход генерируем ограниченное число адресов, чтобы не упереться в лимиты API
+        needed = min(config.wallet_pool_target - available, config.wallet_pool_refill_batch)
+        results = await asyncio.gather(
+            *(crypto.generate_wallet(currency.lower()) for _ in range(needed)),
+            return_exceptions=True
+        )
+        wallets = [wallet for wallet in results if not isinstance(wallet, Exception)]
+        failed = len(results) - len(wallets)
+
+        if wallets:
+            async with Session() as session:
+                session.add_all([
+                    DepositAddress(
+                        currency=currency,
+                        address=wallet['address'],
+                        private_key=wallet['private'],
+                        key_id=wallet['key_id']
+                    )
+                    for wallet in wallets
+                ])
+                await session.commit()
+
+        logger.info(
+            f"Пул адресов {currency}: было {available}, добавлено {len(wallets)}"
+            + (f", ошибок {failed}" if failed else "")
+        )
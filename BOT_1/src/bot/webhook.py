@@ -0,0 +1,140 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from telegram import Update
+from telegram.ext import Application
+from tornado.httpserver import HTTPServer
+from typing import Callable, Optional
+from tornado.web import Application as WebApplication, RequestHandler
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает secret_token из setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class TelegramWebhookHandler(RequestHandler):
+    """Прием обновлений от Telegram и постановка их в очередь приложения"""
+
+    def initialize(self, bot_application: Application, secret_token: str) -> None:
+        self.bot_application = bot_application
+        self.secret_token = secret_token
+
+    async def post(self) -> None:
+        # compare_digest не принимает строки с не-ASCII символами: сравниваются байты
+        received = self.request.headers.get(SECRET_HEADER, "").encode()
+        if not hmac.compare_digest(received, self.secret_token.encode()):
+            logger.warning(f"Отклонен webhook-запрос с неверным токеном от {self.request.remote_ip}")
+            self.set_status(403)
+            return
+
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Некорректное обновление: {str(e)}")
+            self.set_status(400)
+            return
+
+        # Очередь ограничена: при переполнении отвечаем 503, Telegram повторит доставку
+        try:
+            self.bot_application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning("Очередь обновлений переполнена")
+            self.set_status(503)
+            return
+
+        self.set_status(200)
+
+class HealthHandler(RequestHandler):
+    """Проверка живости для Traefik и оркестратора"""
+
+    def initialize(self, bot_application: Application, alive: Optional[Callable[[], bool]] = None) -> None:
+        self.bot_application = bot_application
+        self.alive = alive
+
+    def get(self) -> None:
+        queue = self.bot_application.update_queue
+        # В режиме ingress приложение не запускается: живость определяет сам процесс
+        running = self.alive() if self.alive else self.bot_application.running
+        self.set_status(200 if running else 503)
+        self.write({
+            "status": "ok" if running else "stopping",
+            "queue_size": queue.qsize(),
+            "queue_maxsize": queue.maxsize
+        })
+
+def make_web_app(
+    application: Application,
+    config,
+    alive: Optional[Callable[[], bool]] = None
+) -> WebApplication:
+    """Маршруты HTTP-сервера webhook-режима"""
+    return WebApplication([
+        (config.webhook_path, TelegramWebhookHandler, {
+            "bot_application": application,
+            "secret_token": config.webhook_secret_token
+        }),
+        (config.health_path, HealthHandler, {"bot_application": application, "alive": alive}),
+    ])
+
+async def ensure_webhook(application: Application, config) -> None:
+    """
+    Регистрирует webhook, если Telegram знает другой адрес или параметры.
+
+    Реплик несколько, и каждая вызывает эту функцию при старте: уже
+    установленный webhook не переустанавливается, а очередь необработанных
+    обновлений не сбрасывается - иначе перезапуск или добавление реплики
+    теряли бы обновления всего кластера. getWebhookInfo не возвращает
+    secret_token: после его смены webhook нужно удалить (deleteWebhook без
+    drop_pending_updates), и первая запущенная реплика установит его заново.
+    """
+    url = config.webhook_url.rstrip("/") + config.webhook_path
+    info = await application.bot.get_webhook_info()
+    if info.url == url and info.max_connections == config.webhook_max_connections:
+        logger.info(f"Webhook уже установлен, ожидает обновлений: {info.pending_update_count}")
+        return
+
+    await application.bot.set_webhook(
+        url=url,
+        secret_token=config.webhook_secret_token,
+        max_connections=config.webhook_max_connections,
+        allowed_updates=Update.ALL_TYPES,
+        drop_pending_updates=False
+    )
+    logger.info(f"Webhook установлен: {url}")
+
+async def run_webhook(application: Application, config) -> None:
+    """Жизненный цикл приложения в webhook-режиме (аналог run_polling)"""
+    if not config.webhook_url or not config.webhook_secret_token:
+        raise ValueError("Для webhook-режима нужны WEBHOOK_URL и WEBHOOK_SECRET_TOKEN")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server = None
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+
+        await ensure_webhook(application, config)
+        await application.start()
+
+        server = HTTPServer(make_web_app(application, config), xheaders=True)
+        server.listen(config.webhook_port, config.webhook_listen)
+        logger.info(f"Webhook-сервер слушает {config.webhook_listen}:{config.webhook_port}{config.webhook_path}")
+
+        await stop.wait()
+    finally:
+        if server:
+            server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,16 @@
+-- Пул заранее сгенерированных адресов для оплаты
+CREATE TABLE IF NOT EXISTS deposit_addresses (
+    id SERIAL PRIMARY KEY,
+    currency VARCHAR(10) NOT NULL,
+    address VARCHAR(255) NOT NULL UNIQUE,
+    private_key TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'free',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP
+);
+
+-- Частичный индекс: выдача адреса читает только свободные записи
+CREATE INDEX IF NOT EXISTS idx_deposit_addresses_free ON deposit_addresses(currency, id) WHERE status = 'free';
+
+GRANT ALL PRIVILEGES ON deposit_addresses TO botuser;
+GRANT USAGE, SELECT ON SEQUENCE deposit_addresses_id_seq TO botuser;
@@ -0,0 +1,15 @@
+-- Резервирование товара на время ожидания оплаты
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    id SERIAL PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    transaction_id INTEGER NOT NULL UNIQUE REFERENCES transactions(id),
+    status VARCHAR(20) NOT NULL DEFAULT 'active',
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Частичный индекс: освобождение просроченных резервов читает только активные
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_expiry ON stock_reservations(expires_at) WHERE status = 'active';
+
+GRANT ALL PRIVILEGES ON stock_reservations TO botuser;
+GRANT USAGE, SELECT ON SEQUENCE stock_reservations_id_seq TO botuser;
@@ -0,0 +1,36 @@
+-- Счетчики заказов по статусам, обновляются при каждой смене статуса
+CREATE TABLE IF NOT EXISTS stat_counters (
+    name VARCHAR(50) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Почасовая и суточная выручка по валютам (granularity = 'hour' / 'day')
+CREATE TABLE IF NOT EXISTS sales_rollups (
+    granularity VARCHAR(10) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    currency VARCHAR(10) NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    revenue NUMERIC(24, 8) NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket, currency)
+);
+
+-- Начальное заполнение по существующим данным (далее поддерживается ботом и задачей сверки)
+INSERT INTO stat_counters (name, value)
+SELECT 'orders_' || status, COUNT(*) FROM transactions GROUP BY status
+ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP;
+
+INSERT INTO stat_counters (name, value)
+SELECT 'products', COUNT(*) FROM products
+ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP;
+
+INSERT INTO sales_rollups (granularity, bucket, currency, orders, revenue)
+SELECT g.granularity, date_trunc(g.granularity, t.created_at), t.currency, COUNT(*), SUM(t.amount)
+FROM transactions t CROSS JOIN (VALUES ('hour'), ('day')) AS g(granularity)
+WHERE t.status = 'completed'
+GROUP BY 1, 2, 3
+ON CONFLICT (granularity, bucket, currency) DO UPDATE
+SET orders = EXCLUDED.orders, revenue = EXCLUDED.revenue;
+
+GRANT ALL PRIVILEGES ON stat_counters TO botuser;
+GRANT ALL PRIVILEGES ON sales_rollups TO botuser;
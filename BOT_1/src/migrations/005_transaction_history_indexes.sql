@@ -0,0 +1,12 @@
+-- История заказов пользователя: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions(user_id, created_at DESC, id DESC);
+
+-- Последние заказы для администратора
+CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions(created_at DESC, id DESC);
+
+-- Частичный индекс: фоновая проверка оплаты читает только ожидающие транзакции
+CREATE INDEX IF NOT EXISTS idx_transactions_pending ON transactions(id) WHERE status = 'pending';
+
+-- Покрываются составным и частичным индексами выше
+DROP INDEX IF EXISTS idx_transactions_user_id;
+DROP INDEX IF EXISTS idx_transactions_status;
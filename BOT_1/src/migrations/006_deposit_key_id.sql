@@ -0,0 +1,2 @@
+-- Отпечаток ключа Fernet, которым зашифрован private_key (NULL - зашифрован до введения ротации)
+ALTER TABLE deposit_addresses ADD COLUMN IF NOT EXISTS key_id VARCHAR(16);
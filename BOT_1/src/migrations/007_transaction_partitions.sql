@@ -0,0 +1,75 @@
+-- Помесячное секционирование transactions по created_at и архив старых заказов (PostgreSQL)
+-- Выполнять в окно обслуживания: таблица переписывается целиком
+BEGIN;
+
+-- Внешний ключ на секционированную таблицу должен включать created_at;
+-- к тому же заказ может быть перенесен в архив раньше своего резерва
+ALTER TABLE stock_reservations DROP CONSTRAINT IF EXISTS stock_reservations_transaction_id_fkey;
+
+-- Последовательность id переживает удаление старой таблицы
+ALTER SEQUENCE transactions_id_seq OWNED BY NONE;
+ALTER TABLE transactions RENAME TO transactions_unpartitioned;
+DROP INDEX IF EXISTS idx_transactions_user_created;
+DROP INDEX IF EXISTS idx_transactions_created;
+DROP INDEX IF EXISTS idx_transactions_pending;
+
+-- Первичный ключ секционированной таблицы обязан включать ключ секционирования
+CREATE TABLE transactions (
+    id INTEGER NOT NULL DEFAULT nextval('transactions_id_seq'),
+    user_id INTEGER NOT NULL,
+    product_id INTEGER REFERENCES products(id),
+    crypto_address VARCHAR(255),
+    amount NUMERIC(16,8),
+    currency VARCHAR(10),
+    status VARCHAR(50) DEFAULT 'pending',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id;
+
+-- Строки вне созданных месяцев (на случай, если задача не успела создать секцию)
+CREATE TABLE transactions_default PARTITION OF transactions DEFAULT;
+
+-- Секции transactions_pYYYYMM от первого заказа до двух месяцев вперед (далее их создает бот)
+DO $$
+DECLARE
+    month DATE := date_trunc('month', COALESCE((SELECT MIN(created_at) FROM transactions_unpartitioned), CURRENT_TIMESTAMP));
+BEGIN
+    WHILE month <= date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '2 months' LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+            'transactions_p' || to_char(month, 'YYYYMM'), month, month + INTERVAL '1 month'
+        );
+        month := month + INTERVAL '1 month';
+    END LOOP;
+END $$;
+
+INSERT INTO transactions (id, user_id, product_id, crypto_address, amount, currency, status, created_at)
+SELECT id, user_id, product_id, crypto_address, amount, currency, status, COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM transactions_unpartitioned;
+
+DROP TABLE transactions_unpartitioned;
+
+-- Индексы создаются на каждой секции
+CREATE INDEX idx_transactions_user_created ON transactions(user_id, created_at DESC, id DESC);
+CREATE INDEX idx_transactions_created ON transactions(created_at DESC, id DESC);
+CREATE INDEX idx_transactions_pending ON transactions(id) WHERE status = 'pending';
+
+-- Завершенные и возвращенные заказы старше окна TRANSACTIONS_HOT_DAYS переносит бот
+CREATE TABLE IF NOT EXISTS transactions_archive (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    product_id INTEGER,
+    crypto_address VARCHAR(255),
+    amount NUMERIC(16,8),
+    currency VARCHAR(10),
+    status VARCHAR(50),
+    created_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_archive_user_created ON transactions_archive(user_id, created_at DESC, id DESC);
+
+GRANT ALL PRIVILEGES ON transactions, transactions_default, transactions_archive TO botuser;
+GRANT USAGE, SELECT ON SEQUENCE transactions_id_seq TO botuser;
+
+COMMIT;
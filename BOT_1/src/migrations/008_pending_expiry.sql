@@ -0,0 +1,4 @@
+-- Просроченные счета (status = 'expired'): частичный индекс для возврата их адресов в пул
+CREATE INDEX IF NOT EXISTS idx_transactions_expired ON transactions(created_at) WHERE status = 'expired';
+
+-- Новый статус адреса: retired - средства пришли после истечения счета, адрес больше не выдается
@@ -0,0 +1,14 @@
+-- Счетчики и сводки выручки делятся на слоты: каждое изменение попадает в случайный
+-- слот (stats.STAT_SLOTS), значение - сумма по слотам. Одновременные заказы больше
+-- не ждут блокировку одной строки orders_pending / текущего часа сводки
+BEGIN;
+
+ALTER TABLE stat_counters ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE stat_counters DROP CONSTRAINT IF EXISTS stat_counters_pkey;
+ALTER TABLE stat_counters ADD PRIMARY KEY (name, slot);
+
+ALTER TABLE sales_rollups ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE sales_rollups DROP CONSTRAINT IF EXISTS sales_rollups_pkey;
+ALTER TABLE sales_rollups ADD PRIMARY KEY (granularity, bucket, currency, slot);
+
+COMMIT;
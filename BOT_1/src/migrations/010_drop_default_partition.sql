@@ -0,0 +1,27 @@
+-- Секция по умолчанию не дает отсоединять секции без блокировки всей transactions
+-- (DETACH PARTITION CONCURRENTLY), поэтому удаляется: ее строки переносятся в
+-- помесячные секции, а секции наперед создает бот (PARTITION_MONTHS_AHEAD).
+-- Выполнять в окно обслуживания: отсоединение берет ACCESS EXCLUSIVE на transactions
+BEGIN;
+
+ALTER TABLE transactions DETACH PARTITION transactions_default;
+
+DO $$
+DECLARE
+    month TIMESTAMP;
+BEGIN
+    FOR month IN SELECT DISTINCT date_trunc('month', created_at) FROM transactions_default LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+            'transactions_p' || to_char(month, 'YYYYMM'), month, month + INTERVAL '1 month'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO transactions (id, user_id, product_id, crypto_address, amount, currency, status, created_at)
+SELECT id, user_id, product_id, crypto_address, amount, currency, status, created_at
+FROM transactions_default;
+
+DROP TABLE transactions_default;
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- Адреса просроченных счетов больше не возвращаются в пул: проверка оплаты видит
+-- только наличие средств, и поздний платеж прежнего покупателя засчитывался новому.
+-- Свободные адреса, уже выданные раньше, выводятся из оборота (retired)
+BEGIN;
+
+UPDATE deposit_addresses SET status = 'retired'
+WHERE status = 'free'
+  AND (
+      address IN (SELECT crypto_address FROM transactions WHERE crypto_address IS NOT NULL)
+      OR address IN (SELECT crypto_address FROM transactions_archive WHERE crypto_address IS NOT NULL)
+  );
+
+COMMIT;
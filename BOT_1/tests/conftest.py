@@ -0,0 +1,63 @@
+"""
+Общие фикстуры тестов.
+
+Тесты запускаются из каталога BOT_1 (python -m pytest) на SQLite (aiosqlite)
+вместо PostgreSQL; асинхронные тесты выполняет плагин anyio (зависимость httpx).
+"""
+import pytest
+from cryptography.fernet import Fernet
+from telegram.ext import Application
+from src.bot.config import Config
+from src.bot.database import close_db, init_db
+from src.bot.handlers import register_handlers
+from src.bot.notifications import create_notifier
+from bench.handlers_load import StubRequest
+
+ADMIN_ID = 1
+
+class RecordingRequest(StubRequest):
+    """Заглушка Bot API, запоминающая тексты отправленных и отредактированных сообщений"""
+
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if url.endswith(("/sendMessage", "/editMessageText")):
+            self.texts.append(request_data.parameters["text"])
+        return await super().do_request(url, method, request_data, **kwargs)
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def session_factory(tmp_path):
+    """Фабрика сессий над чистой файловой SQLite-базой"""
+    Session = await init_db(f"sqlite:///{tmp_path / 'bot.db'}")
+    yield Session
+    await close_db(Session)
+
+@pytest.fixture
+async def bot_application(session_factory):
+    """
+    Application с обработчиками бота над тестовой базой; Bot API - RecordingRequest
+    (доступен как application.bot.request), без Redis (кэш каталога и анти-флуд не подключены)
+    """
+    config = Config(
+        bot_token="123456:test",
+        database_url="sqlite://",
+        redis_url="redis://localhost:6379/0",
+        encryption_key=Fernet.generate_key().decode(),
+        admin_ids=[ADMIN_ID],
+        metrics_port=None
+    )
+    application = Application.builder().token(config.bot_token).request(RecordingRequest()).updater(None).build()
+    application.bot_data.update(config=config, session_factory=session_factory)
+    register_handlers(application)
+
+    await application.initialize()
+    application.bot_data["notifier"] = create_notifier(application.bot, config)
+    yield application
+    await application.bot_data["notifier"].close()
+    await application.shutdown()
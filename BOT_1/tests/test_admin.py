@@ -0,0 +1,26 @@
+import pytest
+from telegram import Update
+from src.bot.handlers import admin
+from bench.fake_telegram import make_callback, make_message
+from tests.conftest import ADMIN_ID
+
+pytestmark = pytest.mark.anyio
+
+async def test_stats_callback_error_replies(bot_application, monkeypatch):
+    """Кнопка статистики: у callback-обновления нет update.message, ответ об ошибке все равно уходит"""
+    async def broken_load_stats(session):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(admin, "load_stats", broken_load_stats)
+    await bot_application.process_update(
+        Update.de_json(make_callback(1, ADMIN_ID, "admin_stats"), bot_application.bot)
+    )
+
+    assert bot_application.bot.request.texts == ["❌ Ошибка получения статистики"]
+
+async def test_stats_command(bot_application):
+    await bot_application.process_update(
+        Update.de_json(make_message(1, ADMIN_ID, "/stats"), bot_application.bot)
+    )
+
+    assert bot_application.bot.request.texts[0].startswith("📊 *Статистика продаж*")
@@ -0,0 +1,31 @@
+from decimal import Decimal
+import pytest
+from fakeredis import FakeAsyncRedis
+from telegram import Update
+from src.bot.cache import CatalogCache
+from src.bot.database import Product
+from bench.fake_telegram import make_message
+
+pytestmark = pytest.mark.anyio
+
+async def test_cached_catalog_shows_current_stock(session_factory, bot_application):
+    async with session_factory() as session:
+        session.add(Product(id=1, name="Товар", price_btc=Decimal("0.001"), price_ltc=Decimal("0.1"), stock=5))
+        await session.commit()
+    redis = FakeAsyncRedis(decode_responses=True)
+    cache = CatalogCache(redis)
+    bot_application.bot_data["catalog_cache"] = cache
+
+    await bot_application.process_update(Update.de_json(make_message(1, 100, "/products"), bot_application.bot))
+    # Резерв меняет остаток без инвалидации кеша
+    async with session_factory() as session:
+        (await session.get(Product, 1)).stock = 3
+        await session.commit()
+    await bot_application.process_update(Update.de_json(make_message(2, 100, "/products"), bot_application.bot))
+
+    first, second = bot_application.bot.request.texts
+    assert "Остаток: 5 шт." in first
+    assert "Остаток: 3 шт." in second
+    assert "`0.00100000 ₿` / `0.10000000 Ł`" in second
+    assert await redis.keys(f"{CatalogCache.PREFIX}:*")
+    await redis.aclose()
@@ -0,0 +1,58 @@
+from decimal import Decimal
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Update
+from src.bot.database import (
+    DepositAddress, Product, StockReservation, Transaction, create_db_engine, to_async_url
+)
+from bench.fake_telegram import make_message
+
+pytestmark = pytest.mark.anyio
+
+def test_to_async_url():
+    assert to_async_url("postgresql://u:p@db/bot").drivername == "postgresql+asyncpg"
+    assert to_async_url("postgresql+asyncpg://u:p@db/bot").drivername == "postgresql+asyncpg"
+    assert to_async_url("sqlite:///bot.db").drivername == "sqlite+aiosqlite"
+
+async def test_pool_options_apply_to_server_databases():
+    engine = create_db_engine("postgresql://u:p@localhost/bot", pool_size=3, max_overflow=4, pool_timeout=1.5)
+    try:
+        assert engine.pool.size() == 3
+        assert engine.pool._max_overflow == 4
+        assert engine.pool._timeout == 1.5
+    finally:
+        await engine.dispose()
+
+async def test_init_db_returns_async_session_factory(session_factory):
+    async with session_factory() as session:
+        assert isinstance(session, AsyncSession)
+        product = Product(name="Товар", price_btc=Decimal("0.001"), price_ltc=0, stock=5)
+        session.add(product)
+        await session.commit()
+        # expire_on_commit=False: атрибуты доступны после commit без ленивой подгрузки
+        assert product.stock == 5
+
+    async with session_factory() as session:
+        assert await session.scalar(select(func.count()).select_from(Product)) == 1
+
+async def test_handler_round_trip(session_factory, bot_application):
+    async with session_factory() as session:
+        session.add(Product(id=1, name="Товар", price_btc=Decimal("0.001"), price_ltc=0, stock=2))
+        session.add(DepositAddress(currency="BTC", address="pool_1", private_key="-", status="free"))
+        await session.commit()
+
+    for update_id, text in enumerate(["/pay 1", "/my_orders"], 1):
+        await bot_application.process_update(Update.de_json(make_message(update_id, 100, text), bot_application.bot))
+
+    texts = bot_application.bot.request.texts
+    invoice, history = texts[0], texts[-1]
+    assert "pool_1" in invoice
+    assert "Заказ #1" in history
+
+    async with session_factory() as session:
+        transaction = await session.scalar(select(Transaction))
+        assert (transaction.user_id, transaction.crypto_address, transaction.status) == (100, "pool_1", "pending")
+        assert (await session.get(Product, 1)).stock == 1
+        assert (await session.scalar(select(StockReservation))).status == "active"
+        assert (await session.scalar(select(DepositAddress))).status == "claimed"
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+import pytest
+from src.bot.database import DepositAddress, Transaction
+from src.bot.expiry import retire_addresses
+
+pytestmark = pytest.mark.anyio
+
+class StubCrypto:
+    """Балансы адресов: True - есть средства, None - проверить не удалось"""
+
+    def __init__(self, balances):
+        self.balances = balances
+
+    async def check_payments(self, addresses, currency, batch_size=None):
+        return {address: self.balances[address] for address in addresses if self.balances[address] is not None}
+
+async def test_expired_addresses_are_retired_not_reused(session_factory):
+    created = datetime.utcnow() - timedelta(days=10)
+    async with session_factory() as session:
+        for i, address in enumerate(["empty", "funded", "unchecked"], 1):
+            session.add(DepositAddress(
+                id=i, currency="BTC", address=address, private_key="x", status="claimed", claimed_at=created
+            ))
+            session.add(Transaction(
+                id=i, user_id=100, product_id=None, crypto_address=address, amount=Decimal("0.001"),
+                currency="BTC", status="expired", created_at=created
+            ))
+        await session.commit()
+
+    context = SimpleNamespace(bot_data={
+        'session_factory': session_factory,
+        'config': SimpleNamespace(pending_expiry_batch=100, payment_watch_batch_size=50),
+        'crypto': StubCrypto({"empty": False, "funded": True, "unchecked": None}),
+    })
+    totals = await retire_addresses(context, datetime.utcnow())
+
+    assert totals == {'retired': 2, 'late_funded': 1}
+    async with session_factory() as session:
+        statuses = {i: (await session.get(DepositAddress, i)).status for i in (1, 2, 3)}
+    # Ни один адрес не вернулся в пул; непроверенный ждет следующего запуска
+    assert statuses == {1: 'retired', 2: 'retired', 3: 'claimed'}
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pytest
+from src.bot.database import Transaction
+from src.bot.orders import refund_order
+from src.bot.stats import counter_name, load_stats, record_transition
+
+pytestmark = pytest.mark.anyio
+
+async def test_refund_order_is_bounded_by_created_at(session_factory):
+    created_at = datetime.utcnow() - timedelta(hours=1)
+    async with session_factory() as session:
+        session.add(Transaction(
+            id=1, user_id=100, crypto_address="a", amount=Decimal("0.001"),
+            currency="BTC", status="completed", created_at=created_at
+        ))
+        await record_transition(session, None, 'completed', Decimal("0.001"), "BTC", created_at)
+        await session.commit()
+
+    async with session_factory() as session:
+        assert not await refund_order(session, 1, created_at - timedelta(seconds=1))
+        assert await refund_order(session, 1, created_at)
+        assert not await refund_order(session, 1, created_at)
+        await session.commit()
+
+        assert (await session.get(Transaction, 1)).status == 'refunded'
+        counters = (await load_stats(session))["counters"]
+        assert counters[counter_name('completed')] == 0
+        assert counters[counter_name('refunded')] == 1
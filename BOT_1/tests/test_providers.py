@@ -0,0 +1,216 @@
+import asyncio
+import time
+import pytest
+from bench.blockcypher_stub import BlockCypherStub
+from src.bot.providers import (
+    BlockchainProvider, BlockCypherProvider, ProviderError, ProviderPool, ProviderUnavailable
+)
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(scope="module")
+def server():
+    stub = BlockCypherStub().start()
+    yield stub
+    stub.stop()
+
+@pytest.fixture
+def stub(server):
+    server.requests = 0
+    server.balances.clear()
+    server.faults.clear()
+    return server
+
+@pytest.fixture
+async def make_provider(stub):
+    providers = []
+
+    def make(**kwargs):
+        kwargs.setdefault("backoff", 0.0)
+        provider = BlockCypherProvider(None, base_url=stub.base_url, **kwargs)
+        providers.append(provider)
+        return provider
+
+    yield make
+    for provider in providers:
+        await provider.aclose()
+
+async def test_balances_and_generated_address(stub, make_provider):
+    provider = make_provider()
+    stub.pay("paid")
+    assert await provider.get_balances(["paid", "empty"], "btc") == {"paid": True, "empty": False}
+    assert (await provider.generate_address("btc"))["address"].startswith("stub")
+    assert stub.requests == 2
+
+@pytest.mark.parametrize("status", [500, 502, 503, 429])
+async def test_transient_status_is_retried(stub, make_provider, status):
+    provider = make_provider(retries=2)
+    stub.inject(status, status)
+    assert await provider.get_balances(["a"], "btc") == {"a": False}
+    assert stub.requests == 3
+
+@pytest.mark.parametrize("status", [503, 429])
+async def test_exhausted_retries_raise_unavailable(stub, make_provider, status):
+    provider = make_provider(retries=2)
+    stub.inject(status, status, status)
+    with pytest.raises(ProviderUnavailable, match=f"HTTP {status}"):
+        await provider.get_balances(["a"], "btc")
+    assert stub.requests == 3
+
+async def test_timeout_is_retried(stub, make_provider):
+    provider = make_provider(timeout=0.1, retries=1)
+    stub.inject(0.4)
+    assert await provider.get_balances(["a"], "btc") == {"a": False}
+    assert stub.requests == 2
+
+async def test_timeout_without_retries_raises_unavailable(stub, make_provider):
+    # Под ProviderPool у провайдера одна попытка: повторяет пул
+    provider = make_provider(timeout=0.1)
+    stub.inject(0.4)
+    with pytest.raises(ProviderUnavailable, match="Timeout"):
+        await provider.get_balances(["a"], "btc")
+    assert stub.requests == 1
+
+async def test_client_error_is_not_retried(stub, make_provider):
+    provider = make_provider(retries=2)
+    stub.inject(400)
+    with pytest.raises(ProviderError) as error:
+        await provider.get_balances(["a"], "btc")
+    assert not isinstance(error.value, ProviderUnavailable)
+    assert stub.requests == 1
+
+class StubProvider(BlockchainProvider):
+    """
+    Провайдер в памяти процесса: каждый вызов берет следующий сбой из script -
+    задержку в секундах (float) или исключение; без сбоев отвечает сразу
+    """
+
+    def __init__(self, name: str, *script, can_generate: bool = True):
+        self.name = name
+        self.can_generate = can_generate
+        self.script = list(script)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def _perform(self, result):
+        self.calls += 1
+        fault = self.script.pop(0) if self.script else None
+        try:
+            if isinstance(fault, Exception):
+                raise fault
+            if fault:
+                await asyncio.sleep(fault)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return result
+
+    async def get_balances(self, addresses, currency, timeout=None):
+        return await self._perform({address: self.name == "paid" for address in addresses})
+
+    async def generate_address(self, currency, timeout=None):
+        return await self._perform({"address": f"{self.name}-address", "private": "key"})
+
+def unavailable(name: str) -> ProviderUnavailable:
+    return ProviderUnavailable(f"{name} API unavailable: HTTP 503")
+
+def make_pool(*providers, **kwargs) -> ProviderPool:
+    options = dict(failure_threshold=5, open_timeout=30.0, hedge_percentile=None, retries=0, backoff=0.0)
+    options.update(kwargs)
+    return ProviderPool(list(providers), **options)
+
+async def test_pool_fails_over_to_next_provider():
+    primary, secondary = StubProvider("primary", unavailable("primary")), StubProvider("paid")
+    pool = make_pool(primary, secondary)
+    assert await pool.get_balances(["a"], "btc") == {"a": True}
+    assert (primary.calls, secondary.calls) == (1, 1)
+    assert pool.health["primary"].failures == 1
+
+async def test_generate_address_fails_over_without_hedging():
+    primary = StubProvider("primary", ProviderError("primary API error: bad request"))
+    secondary = StubProvider("secondary")
+    pool = make_pool(primary, secondary, hedge_percentile=0.95, hedge_min_delay=0.0)
+    assert (await pool.generate_address("btc"))["address"] == "secondary-address"
+    assert (primary.calls, secondary.calls) == (1, 1)
+
+async def test_circuit_opens_after_consecutive_failures():
+    primary = StubProvider("primary", *(unavailable("primary") for _ in range(2)))
+    pool = make_pool(primary, failure_threshold=2)
+
+    for _ in range(2):
+        assert pool.health["primary"].opened_at is None
+        with pytest.raises(ProviderUnavailable):
+            await pool.get_balances(["a"], "btc")
+    # После двух ошибок подряд провайдер исключен: запрос к нему не отправляется
+    assert pool.health["primary"].opened_at is not None
+    with pytest.raises(ProviderError, match="Нет доступных провайдеров"):
+        await pool.get_balances(["a"], "btc")
+    assert primary.calls == 2
+
+async def test_half_open_sends_single_probe_and_closes_on_success():
+    primary = StubProvider("primary", unavailable("primary"), 0.05)
+    secondary = StubProvider("secondary")
+    pool = make_pool(primary, secondary, failure_threshold=1, open_timeout=0.05)
+
+    await pool.get_balances(["a"], "btc")
+    assert pool.health["primary"].opened_at is not None
+    await asyncio.sleep(0.06)
+
+    # Пока идет пробный запрос, остальные обходят восстанавливающийся провайдер
+    await asyncio.gather(*(pool.get_balances(["a"], "btc") for _ in range(3)))
+    assert primary.calls == 2
+    assert secondary.calls == 3
+    assert pool.health["primary"].opened_at is None
+
+async def test_half_open_probe_failure_reopens_circuit():
+    primary = StubProvider("primary", unavailable("primary"), unavailable("primary"))
+    secondary = StubProvider("secondary")
+    pool = make_pool(primary, secondary, failure_threshold=1, open_timeout=0.05)
+
+    await pool.get_balances(["a"], "btc")
+    opened_at = pool.health["primary"].opened_at
+    await asyncio.sleep(0.06)
+    await pool.get_balances(["a"], "btc")
+
+    assert primary.calls == 2
+    assert pool.health["primary"].opened_at > opened_at
+    assert not pool.health["primary"].probing
+
+async def test_hedged_read_cancels_slow_primary():
+    primary, secondary = StubProvider("primary", 5.0), StubProvider("paid")
+    pool = make_pool(primary, secondary, hedge_percentile=0.95, hedge_min_delay=0.02)
+
+    started = time.perf_counter()
+    assert await pool.get_balances(["a"], "btc") == {"a": True}
+    assert time.perf_counter() - started < 1.0
+    await asyncio.sleep(0)
+
+    assert primary.cancelled == 1
+    # Отмененный запрос не считается ошибкой провайдера
+    assert pool.health["primary"].failures == 0
+    assert pool.health["primary"].opened_at is None
+
+async def test_pool_retries_transient_failures():
+    primary = StubProvider("primary", unavailable("primary"), unavailable("primary"))
+    secondary = StubProvider("paid", unavailable("paid"), unavailable("paid"))
+    pool = make_pool(primary, secondary, retries=2)
+
+    assert await pool.get_balances(["a"], "btc") == {"a": False}
+    # Третий проход: первым снова идет основной провайдер (цепь не разомкнута)
+    assert (primary.calls, secondary.calls) == (3, 2)
+
+async def test_pool_raises_unavailable_after_retries():
+    primary = StubProvider("primary", *(unavailable("primary") for _ in range(2)))
+    pool = make_pool(primary, retries=1)
+    with pytest.raises(ProviderUnavailable):
+        await pool.get_balances(["a"], "btc")
+    assert primary.calls == 2
+
+async def test_pool_does_not_retry_permanent_errors():
+    primary = StubProvider("primary", ProviderError("primary API error: bad request"))
+    secondary = StubProvider("secondary", unavailable("secondary"))
+    pool = make_pool(primary, secondary, retries=3)
+    with pytest.raises(ProviderError) as error:
+        await pool.get_balances(["a"], "btc")
+    assert not isinstance(error.value, ProviderUnavailable)
+    assert (primary.calls, secondary.calls) == (1, 1)
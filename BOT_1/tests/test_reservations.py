@@ -0,0 +1,86 @@
+from decimal import Decimal
+import pytest
+from sqlalchemy import select
+from src.bot.database import Product, StockReservation, Transaction
+from src.bot.orders import complete_transaction
+from src.bot.reservations import add_reservation, release_expired, reserve_stock
+from src.bot.stats import counter_name, load_stats, record_transition
+
+pytestmark = pytest.mark.anyio
+
+async def create_order(Session, product_id: int, user_id: int, ttl: int) -> Transaction:
+    """Заказ с резервом - как в start_payment"""
+    async with Session() as session:
+        product = await reserve_stock(session, product_id)
+        assert product is not None
+        transaction = Transaction(
+            user_id=user_id, product_id=product_id, crypto_address=f"addr{user_id}",
+            amount=Decimal("0.001"), currency="BTC", status="pending"
+        )
+        session.add(transaction)
+        await session.flush()
+        add_reservation(session, product_id, transaction.id, ttl)
+        await record_transition(session, None, 'pending')
+        await session.commit()
+        return transaction
+
+@pytest.fixture
+async def product(session_factory):
+    async with session_factory() as session:
+        session.add(Product(id=1, name="Товар", price_btc=Decimal("0.001"), price_ltc=0, stock=1))
+        await session.commit()
+    return 1
+
+async def test_release_expires_invoice(session_factory, product):
+    order = await create_order(session_factory, product, 100, ttl=-1)
+
+    async with session_factory() as session:
+        scanned, released = await release_expired(session, 100)
+        await session.commit()
+
+        assert scanned == 1
+        assert released == {product: 1}
+        assert (await session.get(Transaction, order.id)).status == 'expired'
+        assert (await session.get(Product, product)).stock == 1
+        counters = (await load_stats(session))["counters"]
+        assert counters[counter_name('pending')] == 0
+        assert counters[counter_name('expired')] == 1
+
+async def test_late_payment_after_release_does_not_oversell(session_factory, product):
+    late = await create_order(session_factory, product, 100, ttl=-1)
+    async with session_factory() as session:
+        await release_expired(session, 100)
+        await session.commit()
+
+    # Последнюю единицу резервирует другой покупатель, затем приходит поздняя оплата
+    other = await create_order(session_factory, product, 200, ttl=1800)
+    async with session_factory() as session:
+        assert not await complete_transaction(session, late.id, late.created_at)
+        await session.commit()
+
+        assert (await session.get(Transaction, late.id)).status == 'expired'
+        assert (await session.get(Product, product)).stock == 0
+        reservation = await session.scalar(
+            select(StockReservation).where(StockReservation.transaction_id == other.id)
+        )
+        assert reservation.status == 'active'
+
+    async with session_factory() as session:
+        assert await complete_transaction(session, other.id, other.created_at)
+        await session.commit()
+        assert (await session.get(Product, product)).stock == 0
+
+async def test_release_skips_paid_order(session_factory, product):
+    order = await create_order(session_factory, product, 100, ttl=-1)
+    async with session_factory() as session:
+        assert await complete_transaction(session, order.id, order.created_at)
+        await session.commit()
+
+    async with session_factory() as session:
+        scanned, released = await release_expired(session, 100)
+        await session.commit()
+
+        assert scanned == 0
+        assert not released
+        assert (await session.get(Transaction, order.id)).status == 'completed'
+        assert (await session.get(Product, product)).stock == 0
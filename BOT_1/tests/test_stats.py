@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pytest
+from src.bot.database import Transaction
+from src.bot.stats import bump_counters, counter_name, load_stats, rebuild_stats, record_transition
+
+pytestmark = pytest.mark.anyio
+
+def make_order(order_id: int, status: str, created_at: datetime) -> Transaction:
+    return Transaction(
+        id=order_id, user_id=100, crypto_address=f"a{order_id}", amount=Decimal("0.001"),
+        currency="BTC", status=status, created_at=created_at
+    )
+
+async def test_rebuild_fixes_drift(session_factory):
+    created_at = datetime.utcnow() - timedelta(hours=1)
+    async with session_factory() as session:
+        session.add_all([make_order(1, "completed", created_at), make_order(2, "pending", created_at)])
+        await bump_counters(session, {counter_name('pending'): 5, counter_name('lost'): 3})
+        await session.commit()
+
+    await rebuild_stats(session_factory, batch_size=10)
+
+    async with session_factory() as session:
+        stats = await load_stats(session)
+    assert stats["counters"][counter_name('pending')] == 1
+    assert stats["counters"][counter_name('completed')] == 1
+    assert stats["counters"][counter_name('lost')] == 0
+    assert stats["day"] == {"BTC": (1, Decimal("0.001"))}
+
+async def test_rebuild_keeps_changes_after_snapshot(session_factory):
+    """Заказ, созданный между чтением снимка и записью результата, остается в счетчиках"""
+    created_at = datetime.utcnow() - timedelta(hours=1)
+    async with session_factory() as session:
+        session.add(make_order(1, "completed", created_at))
+        await record_transition(session, None, 'completed', Decimal("0.001"), "BTC", created_at)
+        await session.commit()
+
+    sessions = 0
+
+    def racing_factory():
+        nonlocal sessions
+        sessions += 1
+        if sessions == 2:
+            return ConcurrentOrder(session_factory)
+        return session_factory()
+
+    class ConcurrentOrder:
+        def __init__(self, factory):
+            self.factory = factory
+
+        async def __aenter__(self):
+            async with self.factory() as session:
+                session.add(make_order(2, "completed", created_at))
+                await record_transition(session, None, 'completed', Decimal("0.002"), "BTC", created_at)
+                await session.commit()
+            self.session = self.factory()
+            return await self.session.__aenter__()
+
+        async def __aexit__(self, *exc):
+            return await self.session.__aexit__(*exc)
+
+    await rebuild_stats(racing_factory, batch_size=10)
+
+    async with session_factory() as session:
+        stats = await load_stats(session)
+    assert stats["counters"][counter_name('completed')] == 2
+    assert stats["day"] == {"BTC": (2, Decimal("0.003"))}
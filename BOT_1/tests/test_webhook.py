@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from telegram.ext import Application
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from bench.fake_telegram import FakeBotAPI, make_message, post_updates
+from src.bot.webhook import SECRET_HEADER, ensure_webhook, make_web_app
+
+pytestmark = pytest.mark.anyio
+
+SECRET = "s3cr3t"
+
+@pytest.fixture(scope="module")
+def api():
+    api = FakeBotAPI().start()
+    yield api
+    api.stop()
+
+@pytest.fixture
+def config():
+    return SimpleNamespace(
+        webhook_url="https://bot.example.com",
+        webhook_path="/telegram",
+        webhook_secret_token=SECRET,
+        webhook_max_connections=40,
+        health_path="/healthz"
+    )
+
+@pytest.fixture
+def application(api):
+    return Application.builder() \
+        .token("123456:test") \
+        .base_url(f"{api.url}/bot") \
+        .update_queue(asyncio.Queue(maxsize=2)) \
+        .updater(None) \
+        .build()
+
+@pytest.fixture
+async def serve(application, config):
+    """Запускает webhook-сервер на свободном порту и возвращает его адрес"""
+    servers = []
+
+    def start(alive=None) -> str:
+        sockets = bind_sockets(0, "127.0.0.1")
+        server = HTTPServer(make_web_app(application, config, alive))
+        server.add_sockets(sockets)
+        servers.append(server)
+        return f"http://127.0.0.1:{sockets[0].getsockname()[1]}"
+
+    yield start
+    for server in servers:
+        server.stop()
+
+async def test_valid_secret_queues_update(application, serve, config):
+    url = serve()
+    result = await post_updates(url + config.webhook_path, SECRET, [make_message(1, 100, "/start")], 1)
+    assert result["statuses"] == {200: 1}
+    assert application.update_queue.get_nowait().update_id == 1
+
+@pytest.mark.parametrize("headers", [
+    {SECRET_HEADER: "wrong"},
+    {},
+    {SECRET_HEADER: "секрет".encode()},
+], ids=["wrong", "missing", "non-ascii"])
+async def test_bad_secret_is_rejected(application, serve, config, headers):
+    url = serve()
+    async with httpx.AsyncClient() as client:
+        response = await client.post(url + config.webhook_path, json=make_message(1, 100, "/start"), headers=headers)
+    assert response.status_code == 403
+    assert application.update_queue.empty()
+
+async def test_malformed_update_is_rejected(serve, config):
+    url = serve()
+    async with httpx.AsyncClient() as client:
+        response = await client.post(url + config.webhook_path, content=b"{", headers={SECRET_HEADER: SECRET})
+    assert response.status_code == 400
+
+async def test_full_queue_returns_503(serve, config):
+    url = serve()
+    updates = [make_message(i, 100 + i, "/start") for i in range(1, 4)]
+    result = await post_updates(url + config.webhook_path, SECRET, updates, 1)
+    # Telegram повторит доставку отклоненного обновления
+    assert result["statuses"] == {200: 2, 503: 1}
+
+async def test_health(serve, config):
+    async with httpx.AsyncClient() as client:
+        response = await client.get(serve(alive=lambda: True) + config.health_path)
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok", "queue_size": 0, "queue_maxsize": 2}
+
+        # Приложение не запущено и проверка живости не передана
+        response = await client.get(serve() + config.health_path)
+        assert response.status_code == 503
+        assert response.json()["status"] == "stopping"
+
+async def test_ensure_webhook_registers_once(api, application, config):
+    await application.initialize()
+    try:
+        await ensure_webhook(application, config)
+        await ensure_webhook(application, config)
+    finally:
+        await application.shutdown()
+
+    calls = [params for _, method, params in api.calls if method == "setWebhook"]
+    assert len(calls) == 1
+    assert api.webhook == "https://bot.example.com/telegram"
+    # Очередь необработанных обновлений при старте реплики не сбрасывается
+    assert calls[0].get("drop_pending_updates") in (False, "false", None)